@@ -0,0 +1,8 @@
+/*
+  Warnings:
+
+  - A unique constraint covering the columns `[refType,refId,sku]` on the table `InventoryLedger` will be added. If there are existing duplicate values, this will fail.
+
+*/
+-- CreateIndex
+CREATE UNIQUE INDEX `InventoryLedger_refType_refId_sku_key` ON `InventoryLedger`(`refType`, `refId`, `sku`);
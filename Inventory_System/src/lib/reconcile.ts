@@ -0,0 +1,57 @@
+import { createHash } from "crypto";
+import { Prisma } from "@prisma/client";
+import type { Product } from "@prisma/client";
+
+/**
+ * SKU-bucket digests for stock reconciliation with Sales_System
+ * (Sales_System/sales_site/sales/reconcile.py computes the same).
+ *
+ * Each product is reduced to "SKU|price|qty|active" the way Sales
+ * normalizes it, hashed to 64 bits, and the hashes are summed per bucket,
+ * so neither side needs to sort. Only buckets whose digests differ are
+ * then compared row by row.
+ */
+
+export type ReconcileRow = Pick<Product, "sku" | "name" | "listPrice" | "status" | "currentQty">;
+
+const MASK = (1n << 64n) - 1n;
+
+const md5 = (s: string) => createHash("md5").update(s, "utf8").digest("hex");
+
+/** Bucket of a normalized (trimmed, upper-case) SKU */
+export function bucketOf(sku: string, buckets: number): number {
+  return parseInt(md5(sku).slice(0, 8), 16) % buckets;
+}
+
+/**
+ * bucketOf() of the Product row's SKU as a MySQL expression, so routes
+ * can select some buckets' rows without reading the whole table. (TRIM
+ * strips spaces only, where String.trim() strips any whitespace: a SKU
+ * with tabs or newlines around it can land in another bucket here.)
+ */
+export const bucketOfSql = (buckets: number) =>
+  Prisma.sql`CAST(CONV(LEFT(MD5(UPPER(TRIM(sku))), 8), 16, 10) AS UNSIGNED) % ${buckets}`;
+
+/** Normalized SKU and digest line, or null for rows Sales ignores (no SKU / name) */
+export function reconcileLine(p: ReconcileRow): { sku: string; line: string } | null {
+  const sku = (p.sku ?? "").trim().toUpperCase();
+  if (!sku || !(p.name ?? "").trim()) return null;
+  const price = p.listPrice == null ? "0.00" : p.listPrice.toFixed(2);
+  const qty = p.currentQty ?? 0;
+  const active = (p.status || "ACTIVE").toUpperCase() === "ACTIVE" ? 1 : 0;
+  return { sku, line: `${sku}|${price}|${qty}|${active}` };
+}
+
+/** One "<count>:<sum hex>" digest per bucket */
+export function bucketDigests(rows: ReconcileRow[], buckets: number): string[] {
+  const counts = new Array<number>(buckets).fill(0);
+  const sums = new Array<bigint>(buckets).fill(0n);
+  for (const row of rows) {
+    const r = reconcileLine(row);
+    if (!r) continue;
+    const b = bucketOf(r.sku, buckets);
+    counts[b] += 1;
+    sums[b] = (sums[b] + BigInt("0x" + md5(r.line).slice(0, 16))) & MASK;
+  }
+  return counts.map((c, i) => `${c}:${sums[i].toString(16).padStart(16, "0")}`);
+}
@@ -1,5 +1,5 @@
 import { prisma } from "./prisma";
-import type { Prisma } from "@prisma/client";
+import { Prisma } from "@prisma/client";
 
 export async function computeStock(sku: string): Promise<number> {
   const agg = await prisma.inventoryLedger.aggregate({
@@ -9,26 +9,69 @@ export async function computeStock(sku: string): Promise<number> {
   return agg._sum.qtyChange ?? 0;
 }
 
-export async function addLedgerAndBumpCache(input: {
+type LedgerInput = {
   sku: string;
   txnType: string;
   qtyChange: number;
   refType?: string;
   refId?: string;
   note?: string;
-}) {
-  return prisma.$transaction(async (tx: Prisma.TransactionClient) => {
-    const product = await tx.product.findUnique({ where: { sku: input.sku } });
-    if (!product) throw new Error("Unknown SKU");
+};
+
+/** Write one ledger row and keep the product's currentQty cache in step, inside `tx`. */
+async function applyLedger(tx: Prisma.TransactionClient, input: LedgerInput) {
+  const product = await tx.product.findUnique({ where: { sku: input.sku } });
+  if (!product) throw new Error(`Unknown SKU ${input.sku}`);
 
-    const ledger = await tx.inventoryLedger.create({ data: input });
+  const ledger = await tx.inventoryLedger.create({ data: input });
 
-    if (product.currentQty !== null) {
-      await tx.product.update({
-        where: { sku: input.sku },
-        data: { currentQty: (product.currentQty ?? 0) + input.qtyChange },
+  if (product.currentQty !== null) {
+    await tx.product.update({
+      where: { sku: input.sku },
+      data: { currentQty: { increment: input.qtyChange } },
+    });
+  }
+  return ledger;
+}
+
+export async function addLedgerAndBumpCache(input: LedgerInput) {
+  return prisma.$transaction((tx: Prisma.TransactionClient) => applyLedger(tx, input));
+}
+
+/**
+ * Apply a committed sale exactly once: all of its lines or none, and a
+ * saleId that already has SALE ledger rows is reported as a duplicate.
+ * The unique (refType, refId, sku) index settles concurrent deliveries of
+ * the same sale: the loser's insert fails and its transaction rolls back.
+ */
+export async function applySaleCommitted(sale: {
+  saleId: string;
+  items: { sku: string; qty: number }[];
+}) {
+  try {
+    return await prisma.$transaction(async (tx: Prisma.TransactionClient) => {
+      const seen = await tx.inventoryLedger.findFirst({
+        where: { refType: "SALE", refId: sale.saleId },
+        select: { id: true },
       });
+      if (seen) return { duplicate: true, count: 0 };
+
+      for (const item of sale.items) {
+        await applyLedger(tx, {
+          sku: item.sku,
+          txnType: "SALE",
+          qtyChange: -item.qty,
+          refType: "SALE",
+          refId: sale.saleId,
+          note: "Sale committed",
+        });
+      }
+      return { duplicate: false, count: sale.items.length };
+    });
+  } catch (err) {
+    if (err instanceof Prisma.PrismaClientKnownRequestError && err.code === "P2002") {
+      return { duplicate: true, count: 0 };
     }
-    return ledger;
-  });
+    throw err;
+  }
 }
@@ -1,31 +1,45 @@
 import { Router } from "express";
 import { z } from "zod";
-import { addLedgerAndBumpCache } from "../lib/stock";
+import { applySaleCommitted } from "../lib/stock";
 
 const router = Router();
 
-// sales will POST here after a sale is committed
+const SaleCommittedSchema = z.object({
+  saleId: z.string(),
+  items: z.array(z.object({ sku: z.string(), qty: z.number().int().positive() }))
+});
+
+// sales will POST here after a sale is committed; idempotent per saleId
 router.post("/sale-committed", async (req, res) => {
-  const schema = z.object({
-    saleId: z.string(),
-    items: z.array(z.object({ sku: z.string(), qty: z.number().int().positive() }))
-  });
-  const payload = schema.parse(req.body);
+  const payload = SaleCommittedSchema.parse(req.body);
+  const r = await applySaleCommitted(payload);
+  res.json({ ok: true, ...r });
+});
+
+// Sales' outbox dispatcher sends many committed sales in one request.
+// Each event is applied in its own transaction so one bad event (e.g. an
+// unknown SKU) doesn't block the rest; results are reported per saleId.
+router.post("/sale-committed/batch", async (req, res) => {
+  const parsed = z.object({ events: z.array(z.unknown()) }).safeParse(req.body);
+  if (!parsed.success) {
+    return res.status(400).json({ error: "Invalid payload format", details: parsed.error.flatten() });
+  }
 
-  // write one ledger row per item, idempotency can use unique(refType, refId, sku)
   const results = [];
-  for (const item of payload.items) {
-    const r = await addLedgerAndBumpCache({
-      sku: item.sku,
-      txnType: "SALE",
-      qtyChange: -item.qty,
-      refType: "SALE",
-      refId: payload.saleId,
-      note: "Sale committed"
-    });
-    results.push(r);
+  for (const raw of parsed.data.events) {
+    const ev = SaleCommittedSchema.safeParse(raw);
+    if (!ev.success) {
+      results.push({ saleId: (raw as any)?.saleId ?? null, ok: false, error: "Invalid event" });
+      continue;
+    }
+    try {
+      const r = await applySaleCommitted(ev.data);
+      results.push({ saleId: ev.data.saleId, ok: true, ...r });
+    } catch (err: any) {
+      results.push({ saleId: ev.data.saleId, ok: false, error: err?.message || "Failed" });
+    }
   }
-  res.json({ ok: true, count: results.length });
+  res.json({ ok: true, results });
 });
 
 export default router;
@@ -2,6 +2,9 @@ import { Router } from "express";
 import { z } from "zod";
 import { prisma } from "../lib/prisma";
 import axios from "axios";
+import { Prisma } from "@prisma/client";
+import type { Product } from "@prisma/client";
+import { bucketDigests, bucketOfSql, reconcileLine } from "../lib/reconcile";
 
 const router = Router();
 
@@ -23,18 +26,83 @@ const SalesProductSchema = z.object({
   description: z.string().nullable().optional(),
   unit: z.string().min(1).optional(),                 // default to "pcs" below
   price: z.union([z.number(), z.string()]).optional(), // Decimal may be string
+  // sent by older Sales builds; ignored, stock changes arrive as ledger events
   stock_qty: z.union([z.number().int(), z.string()]).optional(),
 });
 const SalesProductArraySchema = z.array(SalesProductSchema);
 
 /* ------------------------------- Routes ------------------------------ */
 
-/** Get all products from our local Prisma DB */
-router.get("/", async (_req, res) => {
+/** updatedAt/id filters shared by GET / and GET /id-range; null if updatedSince is invalid */
+const productFilter = (query: Record<string, unknown>): Prisma.ProductWhereInput | null => {
+  const where: Prisma.ProductWhereInput = {};
+  if (query.updatedSince !== undefined) {
+    const since = new Date(String(query.updatedSince));
+    if (Number.isNaN(since.getTime())) return null;
+    const afterId = Math.trunc(toNumber(query.afterId, 0));
+    where.OR = [
+      { updatedAt: { gt: since } },
+      { updatedAt: since, id: { gt: afterId } },
+    ];
+  }
+  if (query.idFrom !== undefined || query.idTo !== undefined) {
+    where.id = {
+      ...(query.idFrom !== undefined ? { gte: Math.trunc(toNumber(query.idFrom, 0)) } : {}),
+      ...(query.idTo !== undefined ? { lt: Math.trunc(toNumber(query.idTo, 0)) } : {}),
+    };
+  }
+  return where;
+};
+
+/**
+ * Get all products from our local Prisma DB.
+ * ?updatedSince=<ISO>&afterId=<id> returns only rows changed after that
+ * (updatedAt, id) position, oldest first, for Sales_System delta syncs.
+ * ?limit=<n> pages through the same (updatedAt, id) order; pass the last
+ * row's updatedAt/id back as updatedSince/afterId to get the next page.
+ * ?idFrom=<a>&idTo=<b> restricts to a <= id < b, so several id ranges can
+ * be fetched in parallel (see GET /id-range).
+ */
+router.get("/", async (req, res) => {
+  const limit = Math.trunc(toNumber(req.query.limit, 0));
+  const filtered = ["updatedSince", "idFrom", "idTo"].some((k) => req.query[k] !== undefined);
+  if (filtered || limit > 0) {
+    const where = productFilter(req.query);
+    if (where === null) return res.status(400).json({ error: "Invalid updatedSince" });
+    const products = await prisma.product.findMany({
+      where,
+      orderBy: [{ updatedAt: "asc" }, { id: "asc" }],
+      ...(limit > 0 ? { take: limit } : {}),
+    });
+    return res.json(products);
+  }
+
   const products = await prisma.product.findMany({ orderBy: { updatedAt: "desc" } });
   res.json(products);
 });
 
+/**
+ * Count, id span and newest updatedAt of the rows GET / would return for
+ * the same ?updatedSince/afterId, so a client can split the download into
+ * id ranges and fetch them concurrently.
+ */
+router.get("/id-range", async (req, res) => {
+  const where = productFilter(req.query);
+  if (where === null) return res.status(400).json({ error: "Invalid updatedSince" });
+  const agg = await prisma.product.aggregate({
+    where,
+    _count: { _all: true },
+    _min: { id: true },
+    _max: { id: true, updatedAt: true },
+  });
+  res.json({
+    count: agg._count._all,
+    minId: agg._min.id,
+    maxId: agg._max.id,
+    maxUpdatedAt: agg._max.updatedAt,
+  });
+});
+
 /** Inventory ← Sales: receiver endpoint for Sales_System to push products here */
 router.post("/sync-from-sales", async (req, res) => {
   try {
@@ -48,26 +116,27 @@ router.post("/sync-from-sales", async (req, res) => {
 
     const products = parsed.data;
 
-    for (const p of products) {
-      await prisma.product.upsert({
-        where: { sku: p.sku },
-        update: {
-          name: p.name,
-          description: p.description ?? "",
-          unit: p.unit ?? "pcs",
-          listPrice: toNumber(p.price, 0),
-          currentQty: toNumber(p.stock_qty, 0),
-        },
-        create: {
-          sku: p.sku,
+    // One transaction per request: Sales pushes in chunks and treats our
+    // 200 + count as the ack for the whole chunk.
+    await prisma.$transaction(
+      products.map((p) => {
+        const fields = {
           name: p.name,
-          description: p.description ?? "",
           unit: p.unit ?? "pcs",
           listPrice: toNumber(p.price, 0),
-          currentQty: toNumber(p.stock_qty, 0),
-        },
-      });
-    }
+          // Sales has no descriptions; don't wipe ours unless one is sent
+          ...(p.description != null ? { description: p.description } : {}),
+        };
+        // Catalog fields only: stock is ours (the ledger), and Sales'
+        // decrements reach it as sale-committed events. Writing its
+        // stock_qty here as well would apply every sale twice.
+        return prisma.product.upsert({
+          where: { sku: p.sku },
+          update: fields,
+          create: { sku: p.sku, ...fields, currentQty: 0 },
+        });
+      })
+    );
 
     return res.json({
       message: "Products received successfully from Sales_System",
@@ -119,6 +188,57 @@ router.get("/sync", async (_req, res) => {
   }
 });
 
+/* ------------------------- Reconciliation -------------------------- */
+
+const RECONCILE_SELECT = { sku: true, name: true, listPrice: true, status: true, currentQty: true } as const;
+
+const parseBuckets = (v: unknown): number | null => {
+  const n = Math.trunc(toNumber(v, 256));
+  return n >= 1 && n <= 65536 ? n : null;
+};
+
+/**
+ * Per-bucket digests of (sku, price, qty, status) for Sales_System's
+ * reconcile: ?buckets=<n> (default 256). A few KB whatever the catalog size.
+ */
+router.get("/reconcile/buckets", async (req, res) => {
+  const buckets = parseBuckets(req.query.buckets);
+  if (buckets === null) return res.status(400).json({ error: "Invalid buckets" });
+
+  const products = await prisma.product.findMany({ select: RECONCILE_SELECT });
+  res.json({
+    buckets,
+    count: products.filter((p) => reconcileLine(p) !== null).length,
+    digests: bucketDigests(products, buckets),
+  });
+});
+
+/** Full product rows in the buckets ?ids=1,2,3 (of ?buckets=<n>), for drilling into mismatches */
+router.get("/reconcile/rows", async (req, res) => {
+  const buckets = parseBuckets(req.query.buckets);
+  if (buckets === null) return res.status(400).json({ error: "Invalid buckets" });
+  const ids = new Set(
+    String(req.query.ids ?? "")
+      .split(",")
+      .filter((s) => s.trim() !== "")
+      .map(Number)
+  );
+  if ([...ids].some((i) => !Number.isInteger(i) || i < 0 || i >= buckets)) {
+    return res.status(400).json({ error: "Invalid bucket ids" });
+  }
+
+  // Bucketed in SQL: Sales asks for a few buckets at a time, and each
+  // request should read only their rows, not the whole table.
+  const rows = ids.size
+    ? await prisma.$queryRaw<Product[]>`
+        SELECT * FROM \`Product\`
+        WHERE TRIM(sku) <> '' AND TRIM(name) <> ''
+          AND ${bucketOfSql(buckets)} IN (${Prisma.join([...ids])})
+        ORDER BY sku`
+    : [];
+  res.json({ buckets, rows });
+});
+
 /** Manually add a new product to local DB */
 router.post("/", async (req, res) => {
   const schema = z.object({
@@ -1,5 +1,5 @@
 import { Router } from 'express';
-import { PrismaClient } from '@prisma/client';
+import { Prisma, PrismaClient } from '@prisma/client';
 
 const prisma = new PrismaClient();
 const router = Router();
@@ -16,8 +16,12 @@ router.post('/stock-adjustments', async (req, res) => {
   try {
     // 2) One DB transaction for safety
     const result = await prisma.$transaction(async (tx) => {
-      // Idempotency check (assumes InventoryLedger.idempotencyKey is UNIQUE)
-      const dup = await tx.inventoryLedger.findUnique({ where: { idempotencyKey } }).catch(() => null);
+      // Idempotency: the key is the ledger row's ADJ reference, unique per
+      // SKU through the (refType, refId, sku) index
+      const dup = await tx.inventoryLedger.findFirst({
+        where: { refType: 'ADJ', refId: String(idempotencyKey), sku },
+        select: { id: true },
+      });
       if (dup) return { duplicate: true };
 
       const prod = await tx.product.findUnique({ where: { sku } });
@@ -36,12 +40,12 @@ router.post('/stock-adjustments', async (req, res) => {
 
       await tx.inventoryLedger.create({
         data: {
-          idempotencyKey,
           sku,
           txnType: reason || 'SALE',
           qtyChange: delta,
-          refType: 'SALE',
-          refId: reference || null
+          refType: 'ADJ',
+          refId: String(idempotencyKey),
+          note: reference ? `Reference ${reference}` : null
         }
       });
 
@@ -58,6 +62,10 @@ router.post('/stock-adjustments', async (req, res) => {
     }
     return res.status(201).json(result);
   } catch (e: any) {
+    // a concurrent request with the same key won the insert
+    if (e instanceof Prisma.PrismaClientKnownRequestError && e.code === 'P2002') {
+      return res.status(409).json({ error: 'duplicate idempotency key', code: 'DUPLICATE' });
+    }
     if (e.http === 404) return res.status(404).json({ error: 'sku not found', code: 'SKU_NOT_FOUND' });
     if (e.http === 422) return res.status(422).json({ error: 'insufficient stock', code: 'INSUFFICIENT_STOCK' });
     console.error(e);
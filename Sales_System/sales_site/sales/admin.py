@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Customer, Sale, SaleItem, Product
+from .rollups import forget_sale, record_sale
 
 class SaleItemInline(admin.TabularInline):
     model = SaleItem
@@ -11,6 +12,20 @@ class SaleAdmin(admin.ModelAdmin):
     list_filter = ("status",)
     inlines = [SaleItemInline]
 
+    def save_related(self, request, form, formsets, change):
+        sale = form.instance
+        items_changed = any(fs.has_changed() for fs in formsets)
+        # rollups: take out the stored lines, count the saved ones (a status
+        # change was already moved by the post_save signal)
+        if change and items_changed:
+            forget_sale(sale)
+        super().save_related(request, form, formsets, change)
+        # Sale.save() doesn't total items; only redo it when the inline changed
+        if items_changed:
+            sale.recalculate_total()
+        if not change or items_changed:
+            record_sale(sale, sale.items.only("sku", "qty", "line_total"))
+
 admin.site.register(Customer)
 
 @admin.register(Product)
@@ -1,5 +1,5 @@
 from rest_framework import serializers, viewsets, filters
-from .models import Product, Sale, SaleItem, Customer
+from .models import Product
 from .serializers import ProductSerializer
 
 # --- SERIALIZERS ---
@@ -8,25 +8,6 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = '__all__'
 
-class CustomerSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Customer
-        fields = '__all__'
-
-class SaleItemSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = SaleItem
-        fields = '__all__'
-
-class SaleSerializer(serializers.ModelSerializer):
-    items = SaleItemSerializer(many=True, read_only=True)
-    customer = CustomerSerializer(read_only=True)
-
-    class Meta:
-        model = Sale
-        fields = '__all__'
-
-
 # --- VIEWSETS ---
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by("-updated_at")
@@ -35,6 +16,4 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ["sku", "name"]
     ordering_fields = ["updated_at", "price", "sku"]
 
-class SaleViewSet(viewsets.ModelViewSet):
-    queryset = Sale.objects.all()
-    serializer_class = SaleSerializer
+# Sales are served by sales.views.SaleViewSet (prefetching, cursor pages).
@@ -1,25 +1,56 @@
-import requests
+import gzip
+import json
 from decimal import Decimal, InvalidOperation
 from django.conf import settings
 from django.db import transaction
-from .models import Product
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .catalog import bump_catalog_version
+from .inventory_client import get_client
+from .models import Product, SyncCursor
 
-def _headers():
-    h = {}
-    if getattr(settings, "INVENTORY_API_KEY", ""):
-        h["Authorization"] = f"Bearer {settings.INVENTORY_API_KEY}"
-    return h
+def _page_size():
+    return int(getattr(settings, "INVENTORY_PAGE_SIZE", 1000))
 
-def fetch_inventory_products():
+
+def iter_inventory_pages(updated_since=None, after_id=0, page_size=None):
     """
-    Calls Inventory_System GET /products
-    Expected fields per product: sku, name, description?, unit, listPrice, status, currentQty
+    Calls Inventory_System GET /products one page at a time and yields each
+    page (a list of at most `page_size` products), so callers never hold
+    more than one page of the catalog in memory.
+    Expected fields per product: id, sku, name, description?, unit, listPrice,
+    status, currentQty, updatedAt
+
+    Pages are keyed on (updatedAt, id): with `updated_since` only rows changed
+    after (updated_since, after_id) are returned, oldest first.
     """
-    base = getattr(settings, "INVENTORY_API_BASE", "http://127.0.0.1:3001")
-    url = f"{base}/products"
-    r = requests.get(url, headers=_headers(), timeout=10)
-    r.raise_for_status()
-    return r.json()
+    client = get_client()
+    page_size = page_size or _page_size()
+
+    while True:
+        params = {"limit": page_size}
+        if updated_since is not None:
+            params["updatedSince"] = updated_since.isoformat(timespec="milliseconds")
+            params["afterId"] = after_id
+        r = client.get("/products", params=params)
+        r.raise_for_status()
+        page = r.json()
+        if page:
+            yield page
+        # A short page is the last one. A long one means Inventory ignored
+        # ?limit= (older build) and already sent everything.
+        if len(page) != page_size:
+            return
+        updated_since, after_id = _next_position(page)
+
+
+def fetch_inventory_products(updated_since=None, after_id=0):
+    """
+    Whole (or delta) catalog as one list. Prefer iter_inventory_pages for
+    anything that can be processed page by page.
+    """
+    return [p for page in iter_inventory_pages(updated_since, after_id) for p in page]
 
 def _to_decimal(val, default="0"):
     if val is None or val == "":
@@ -30,55 +61,330 @@ def _to_decimal(val, default="0"):
     except (InvalidOperation, TypeError):
         return Decimal(default)
 
-@transaction.atomic
-def upsert_into_sales(products):
+# Fields Inventory is the source of truth for; anything else on Product is ours.
+SYNC_FIELDS = ("name", "unit", "price", "stock_qty", "is_active")
+CENT = Decimal("0.01")
+
+
+def _sync_batch_size():
+    return int(getattr(settings, "INVENTORY_SYNC_BATCH_SIZE", 1000))
+
+
+class _Skip(Exception):
+    """Raised by _normalize for rows we ignore on purpose (not errors)."""
+
+
+def _normalize(p):
+    """
+    Map one Inventory product to (sku, {field: value}) in Sales terms.
+    Values are normalized the way the DB would store them so the diff
+    against existing rows is exact.
+    """
+    raw_sku = p.get("sku")
+    if not raw_sku:
+        raise _Skip("missing sku")
+
+    sku = str(raw_sku).strip().upper()
+    name = (p.get("name") or "").strip()
+    if not name:
+        raise _Skip("empty name")
+
+    return sku, {
+        "name": name,
+        "unit": (p.get("unit") or "pcs").strip() or "pcs",
+        "price": _to_decimal(p.get("listPrice")).quantize(CENT),
+        "stock_qty": int(p.get("currentQty") or 0),
+        "is_active": (str(p.get("status") or "ACTIVE").upper() == "ACTIVE"),
+    }
+
+
+def _apply_batch(rows, result):
+    """
+    rows: {sku: fields}. Loads the existing products for these SKUs in one
+    query, diffs in memory and writes only real changes. Each batch is its
+    own short transaction so we never hold row locks for the whole sync.
+    """
+    now = timezone.now()
+    to_create, to_update = [], []
+
+    with transaction.atomic():
+        existing = {
+            obj.sku: obj
+            for obj in Product.objects.select_for_update().filter(sku__in=list(rows))
+        }
+        for sku, fields in rows.items():
+            obj = existing.get(sku)
+            if obj is None:
+                to_create.append(Product(sku=sku, **fields))
+                continue
+            changed = False
+            for f, v in fields.items():
+                if getattr(obj, f) != v:
+                    setattr(obj, f, v)
+                    changed = True
+            if changed:
+                # bulk_update skips auto_now, keep updated_at honest ourselves
+                obj.updated_at = now
+                to_update.append(obj)
+            else:
+                result["unchanged"] += 1
+
+        if to_create:
+            Product.objects.bulk_create(to_create, batch_size=len(to_create))
+        if to_update:
+            Product.objects.bulk_update(
+                to_update, [*SYNC_FIELDS, "updated_at"], batch_size=len(to_update)
+            )
+
+    result["created"].extend(obj.sku for obj in to_create)
+    result["updated"].extend(obj.sku for obj in to_update)
+
+
+def summarize(result):
+    """Counts-only view of an upsert result, for progress reporting."""
+    return {
+        k: (len(v) if isinstance(v, list) else v)
+        for k, v in result.items()
+        if isinstance(v, (list, int))
+    }
+
+
+def upsert_into_sales(products, batch_size=None, progress=None):
     """
     Inventory -> Sales field mapping:
       listPrice -> price (Decimal)
       currentQty -> stock_qty (int)
       status == 'ACTIVE' -> is_active True else False
+
+    `products` may be any iterable of Inventory product dicts. Rows are
+    normalized, de-duplicated by SKU (last one wins) and applied in chunks
+    of `batch_size` (default settings.INVENTORY_SYNC_BATCH_SIZE) using
+    bulk_create / bulk_update; rows that already match are only counted.
+    `progress`, if given, is called with summarize(result) plus a "batches"
+    count after every applied batch.
     Returns a rich result for diagnostics.
     """
+    batch_size = batch_size or _sync_batch_size()
     result = {
-        "received": len(products),
+        "received": 0,
         "created": [],
         "updated": [],
+        "unchanged": 0,
         "skipped": [],   # [{sku, reason}]
         "errors": []     # [{sku, error}]
     }
 
+    batches = 0
+
+    def flush(rows):
+        nonlocal batches
+        try:
+            _apply_batch(rows, result)
+        except Exception as e:
+            # whole batch rolled back; report every SKU in it
+            result["errors"].extend({"sku": sku, "error": str(e)} for sku in rows)
+        batches += 1
+        if progress:
+            progress({"batches": batches, **summarize(result)})
+
+    rows = {}
     for p in products:
+        result["received"] += 1
         try:
-            raw_sku = p.get("sku")
-            if not raw_sku:
-                result["skipped"].append({"sku": None, "reason": "missing sku"})
-                continue
+            sku, fields = _normalize(p)
+        except _Skip as skip:
+            sku = p.get("sku")
+            result["skipped"].append({
+                "sku": str(sku).strip().upper() if sku else None,
+                "reason": str(skip),
+            })
+            continue
+        except Exception as e:
+            result["errors"].append({"sku": p.get("sku"), "error": str(e)})
+            continue
 
-            sku = str(raw_sku).strip().upper()
-            name = (p.get("name") or "").strip()
-            unit = (p.get("unit") or "pcs").strip() or "pcs"
-            price = _to_decimal(p.get("listPrice"))
-            stock_qty = int(p.get("currentQty") or 0)
-            is_active = (str(p.get("status") or "ACTIVE").upper() == "ACTIVE")
+        rows.pop(sku, None)  # keep last occurrence, in arrival order
+        rows[sku] = fields
+        if len(rows) >= batch_size:
+            flush(rows)
+            rows = {}
 
-            # Basic validation
-            if not name:
-                result["skipped"].append({"sku": sku, "reason": "empty name"})
-                continue
+    if rows:
+        flush(rows)
 
-            obj, created = Product.objects.update_or_create(
-                sku=sku,
-                defaults={
-                    "name": name,
-                    "unit": unit,
-                    "price": price,
-                    "stock_qty": stock_qty,
-                    "is_active": is_active,
-                },
-            )
-            (result["created"] if created else result["updated"]).append(sku)
+    if result["created"] or result["updated"]:
+        bump_catalog_version()
+    return result
 
-        except Exception as e:
-            result["errors"].append({"sku": p.get("sku"), "error": str(e)})
 
+PULL_CURSOR = "inventory_pull"
+
+
+def _row_position(p):
+    """(updatedAt, id) of an Inventory row, or None if it doesn't carry them."""
+    ts = parse_datetime(str(p.get("updatedAt") or ""))
+    if ts is None:
+        return None
+    try:
+        return ts, int(p.get("id") or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _next_position(page):
+    """
+    Where the page after this full one starts. A last row without a usable
+    updatedAt/id would otherwise end the pull early and let the cursor
+    skip rows nobody fetched, so that's an error.
+    """
+    position = _row_position(page[-1])
+    if position is None:
+        raise RuntimeError(f"Inventory row without a valid updatedAt/id ends a full page: {page[-1]!r:.200}")
+    return position
+
+
+def pull_products(full=False, progress=None):
+    """
+    Inventory -> Sales sync. Incremental by default: only rows changed since
+    the stored high-water mark are requested. `full=True` (or no cursor yet)
+    downloads the whole catalog. Pages stream straight into
+    upsert_into_sales, so memory stays bounded by the page/batch size.
+    The cursor only advances when every row was applied without errors,
+    so failed rows are retried next time.
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(name=PULL_CURSOR)
+    delta = not full and cursor.last_updated_at is not None
+
+    if delta:
+        pages = iter_inventory_pages(cursor.last_updated_at, cursor.last_id)
+    else:
+        pages = iter_inventory_pages()
+
+    sample = []
+    high = None
+
+    def items():
+        nonlocal high
+        for page in pages:
+            for p in page:
+                if len(sample) < 3:
+                    sample.append(p)
+                pos = _row_position(p)
+                if pos and (high is None or pos > high):
+                    high = pos
+                yield p
+
+    result = upsert_into_sales(items(), progress=progress)
+
+    if high and not result["errors"]:
+        if cursor.last_updated_at is None or high > (cursor.last_updated_at, cursor.last_id):
+            cursor.last_updated_at, cursor.last_id = high
+            cursor.save()
+
+    result["mode"] = "delta" if delta else "full"
+    result["cursor"] = {
+        "updatedAt": cursor.last_updated_at.isoformat() if cursor.last_updated_at else None,
+        "id": cursor.last_id,
+    }
+    result["sample"] = sample  # tiny peek
     return result
+
+
+PUSH_CURSOR = "inventory_push"
+# No stock_qty: Inventory owns stock, Sales' decrements reach it once
+# through the outbox's sale-committed events (see outbox.py)
+PUSH_FIELDS = ("id", "sku", "name", "unit", "price", "updated_at")
+
+
+def _push_chunk_size():
+    return int(getattr(settings, "INVENTORY_PUSH_CHUNK_SIZE", 500))
+
+
+def _chunk_body(rows):
+    """(row count, gzip-compressed JSON body) for one sync-from-sales chunk."""
+    payload = [
+        {
+            "sku": str(p["sku"]).strip().upper(),
+            "name": p["name"],
+            "unit": p.get("unit") or "pcs",
+            "price": str(p["price"]),   # send as string to avoid float issues
+        }
+        for p in rows
+    ]
+    return len(payload), gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+PUSH_HEADERS = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+
+def _check_ack(status_code, text, ack, sent):
+    if status_code != 200:
+        raise RuntimeError(f"Inventory answered {status_code}: {text[:500]}")
+    if ack.get("count") != sent:
+        raise RuntimeError(f"Inventory acknowledged {ack.get('count')} of {sent} products")
+    return ack
+
+
+def _post_chunk(client, rows):
+    """
+    POST one gzip-compressed chunk to Inventory and check its ack
+    (HTTP 200 with a count matching what we sent).
+    """
+    sent, body = _chunk_body(rows)
+    # sync-from-sales is an upsert by SKU, so retrying it is safe
+    resp = client.post("/products/sync-from-sales", data=body, headers=PUSH_HEADERS, idempotent=True)
+    ack = resp.json() if resp.status_code == 200 else {}
+    return _check_ack(resp.status_code, resp.text, ack, sent)
+
+
+def push_products(full=False, progress=None):
+    """
+    Sales -> Inventory: push products changed since the last successful
+    push (all of them with `full=True` or on the first run).
+
+    Rows go out in (updated_at, id) order, in gzip-compressed chunks of
+    INVENTORY_PUSH_CHUNK_SIZE. The watermark is saved after each
+    acknowledged chunk, so a failed push resumes where it stopped instead
+    of resending everything. Raises on transport errors or a bad ack.
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(name=PUSH_CURSOR)
+    delta = not full and cursor.last_updated_at is not None
+    chunk_size = _push_chunk_size()
+    client = get_client()
+
+    qs = Product.objects.order_by("updated_at", "id").values(*PUSH_FIELDS)
+    position = (cursor.last_updated_at, cursor.last_id) if delta else None
+
+    sent = chunks = 0
+    ack = None
+    while True:
+        page = qs
+        if position is not None:
+            ts, last_id = position
+            page = qs.filter(Q(updated_at__gt=ts) | Q(updated_at=ts, id__gt=last_id))
+        rows = list(page[:chunk_size])
+        if not rows:
+            break
+
+        ack = _post_chunk(client, rows)
+        position = (rows[-1]["updated_at"], rows[-1]["id"])
+        cursor.last_updated_at, cursor.last_id = position
+        cursor.save()
+
+        sent += len(rows)
+        chunks += 1
+        if progress:
+            progress({"chunks": chunks, "sent": sent})
+        if len(rows) < chunk_size:
+            break
+
+    return {
+        "mode": "delta" if delta else "full",
+        "count": sent,
+        "chunks": chunks,
+        "cursor": {
+            "updatedAt": cursor.last_updated_at.isoformat() if cursor.last_updated_at else None,
+            "id": cursor.last_id,
+        },
+        "inventory_response": ack,  # last chunk's ack
+    }
@@ -0,0 +1,60 @@
+from .models import Product
+from .reservations import held_by_others
+
+
+def revalidate_cart(cart, desired=None, holder=None):
+    """
+    Check a session cart against the DB with one sku__in query for the
+    products and one for other carts' reservations of them.
+
+    cart:    {"<sku>": {"qty": n}} (a "name" is used for lines that are no
+             longer available); name/unit/price are filled in here.
+    desired: optional {"<sku>": qty} overriding the quantities in `cart`.
+    holder:  cart's reservation holder (session key), or None for a cart
+             that has none yet. Stock reserved by other carts is not
+             counted as available.
+
+    Returns (new_cart, changes). new_cart holds fresh name/unit/price and
+    quantities capped to stock; lines with qty <= 0, inactive/unknown
+    products or no stock are dropped. changes is a list of
+    {"sku", "kind", "message"} with kind one of "removed", "unavailable"
+    (unknown/inactive), "out_of_stock" or "capped". Prices aren't compared:
+    the compact session cart keeps no price, and place_order charges the
+    current one.
+    """
+    desired = desired or {}
+    products = {
+        p.sku: p
+        for p in Product.objects.filter(sku__in=list(cart), is_active=True)
+        .only("sku", "name", "unit", "price", "stock_qty")
+    }
+    others = held_by_others(products, holder) if products else {}
+
+    new_cart = {}
+    changes = []
+
+    def change(sku, kind, message):
+        changes.append({"sku": sku, "kind": kind, "message": message})
+
+    for sku, item in cart.items():
+        qty = desired.get(sku, item.get("qty", 0))
+        p = products.get(sku)
+        name = p.name if p else (item.get("name") or sku)
+
+        if qty <= 0:
+            change(sku, "removed", f"Removed {name}.")
+            continue
+        if p is None:
+            change(sku, "unavailable", f"{name} is no longer available.")
+            continue
+        available = p.stock_qty - others.get(sku, 0)
+        if available <= 0:
+            change(sku, "out_of_stock", f"{p.name} is out of stock.")
+            continue
+        if qty > available:
+            qty = available
+            change(sku, "capped", f"Capped {p.name} to {available} (available).")
+
+        new_cart[sku] = {"name": p.name, "unit": p.unit, "price": float(p.price), "qty": qty}
+
+    return new_cart, changes
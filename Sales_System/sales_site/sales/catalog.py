@@ -0,0 +1,87 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product
+
+VERSION_KEY = "catalog:version"
+CATALOG_FIELDS = ("id", "sku", "name", "unit", "price", "stock_qty", "updated_at")
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bumps": 0}
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def catalog_stats():
+    """Process-local hit/miss/bump counters, for tuning CATALOG_CACHE_TTL."""
+    with _stats_lock:
+        s = dict(_stats)
+    lookups = s["hits"] + s["misses"]
+    s["hit_ratio"] = round(s["hits"] / lookups, 4) if lookups else None
+    s["version"] = cache.get(VERSION_KEY)
+    return s
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog by moving to a new version key; old
+    entries just age out. Call after anything that changes active products
+    (price, stock, name, visibility).
+    """
+    _count("bumps")
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:  # key evicted or never set
+        cache.add(VERSION_KEY, 1, timeout=None)
+        cache.incr(VERSION_KEY)
+
+
+def bump_catalog_version_on_commit():
+    """bump_catalog_version once the current transaction commits (now if none)."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def get_active_catalog():
+    """
+    Active products ordered by name, as plain dicts with CATALOG_FIELDS,
+    plus the catalog version and newest updated_at:
+
+        {"version": int, "last_modified": datetime|None, "rows": [...]}
+
+    Served from Django's cache under a version key; a miss runs the query
+    once and stores the result for CATALOG_CACHE_TTL seconds.
+    """
+    version = _version()
+    key = f"catalog:active:v{version}"
+    catalog = cache.get(key)
+    if catalog is not None:
+        _count("hits")
+        return catalog
+
+    _count("misses")
+    rows = list(
+        Product.objects.filter(is_active=True)
+        .order_by("name", "id")
+        .values(*CATALOG_FIELDS)
+    )
+    catalog = {
+        "version": version,
+        "last_modified": max((r["updated_at"] for r in rows), default=None),
+        "rows": rows,
+    }
+    cache.set(key, catalog, getattr(settings, "CATALOG_CACHE_TTL", 60))
+    return catalog
@@ -0,0 +1,93 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+SALE_COLUMNS = (
+    "sale_id", "sale_no", "status", "created_at", "paid_at", "total_amount",
+    "customer_id", "customer_name", "customer_email",
+)
+ITEM_COLUMNS = ("sku", "product_name", "unit", "qty", "unit_price", "line_total")
+# One CSV row per sale item; a sale without items gets one row with empty item columns
+CSV_COLUMNS = SALE_COLUMNS + ITEM_COLUMNS
+
+
+def _chunk_size():
+    return int(getattr(settings, "SALES_EXPORT_CHUNK_SIZE", 2000))
+
+
+def sale_rows(sales, chunk_size=None):
+    """
+    Yield one tuple per (sale, item) of the `sales` queryset, as
+    (item_id, *SALE_COLUMNS, *ITEM_COLUMNS), ordered by created_at,
+    sale_id, item id.
+
+    Sale, customer and items come from one LEFT JOIN query per chunk of
+    `chunk_size` rows, keyset-paged on (created_at, sale_id, item id), so
+    memory stays constant and the first rows go out before the rest of
+    the range is read. (A single .iterator() wouldn't do on MySQL: its
+    driver buffers the whole result set client-side.)
+    """
+    chunk_size = chunk_size or _chunk_size()
+    qs = sales.annotate(
+        item_id=F("items__sale_item_id"),
+        customer_name=F("customer__name"),
+        customer_email=F("customer__email"),
+        **{c: F(f"items__{c}") for c in ITEM_COLUMNS},
+    ).order_by("created_at", "sale_id", "item_id").values_list("item_id", *SALE_COLUMNS, *ITEM_COLUMNS)
+
+    after = None
+    while True:
+        page = qs
+        if after is not None:
+            created_at, sale_id, item_id = after
+            later = Q(created_at__gt=created_at) | Q(created_at=created_at, sale_id__gt=sale_id)
+            if item_id is not None:
+                later |= Q(created_at=created_at, sale_id=sale_id, item_id__gt=item_id)
+            page = qs.filter(later)
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+        after = (last[4], last[1], last[0])  # created_at, sale_id, item_id
+
+
+class _Line:
+    """File-like object whose write() returns the text, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """CSV text (header first) for sale_rows(), one line at a time."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        yield writer.writerow(
+            v.isoformat() if hasattr(v, "isoformat") else v for v in row[1:]
+        )
+
+
+def ndjson_lines(rows):
+    """
+    One JSON object per sale with its items nested, per line, for
+    sale_rows(). Rows arrive grouped by sale, so only one sale is held at
+    a time.
+    """
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    n_sale = len(SALE_COLUMNS)
+    current = None
+    for row in rows:
+        item_id, values = row[0], row[1:]
+        if current is None or current["sale_id"] != values[0]:
+            if current is not None:
+                yield encoder.encode(current) + "\n"
+            current = dict(zip(SALE_COLUMNS, values[:n_sale]))
+            current["items"] = []
+        if item_id is not None:
+            current["items"].append(dict(zip(ITEM_COLUMNS, values[n_sale:])))
+    if current is not None:
+        yield encoder.encode(current) + "\n"
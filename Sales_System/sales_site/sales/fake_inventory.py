@@ -0,0 +1,286 @@
+import bisect
+import gzip
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .api_inventory import _normalize, _Skip
+from .reconcile import bucket_digests, bucket_of
+
+
+class FakeInventory:
+    """
+    In-process stand-in for Inventory_System's HTTP API, for benchmarks and
+    offline runs. Serves the endpoints the sync code calls:
+
+    - GET  /products                     keyset pages on (updatedAt, id),
+                                         optionally within [idFrom, idTo)
+    - GET  /products/id-range            count and id/updatedAt bounds
+    - POST /products/sync-from-sales     gzip or plain JSON, upserts catalog
+                                         fields (never stock), acks the count
+    - POST /events/sale-committed/batch  takes each saleId's quantities off
+                                         currentQty once
+    - GET  /products/reconcile/buckets   per-bucket digests
+    - GET  /products/reconcile/rows      products in some buckets
+
+    `latency` seconds are added to every response and `failure_rate` of
+    requests answer 503, so retries and the circuit breaker get exercised.
+
+        with FakeInventory(catalog_size=5000, latency=0.005) as inv:
+            settings.INVENTORY_API_BASE = inv.url
+    """
+
+    def __init__(self, catalog_size=1000, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._clock = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        self._rows = {}     # id -> product
+        self._sales = set()  # saleIds already applied
+        self._order = []    # sorted [(updatedAt, id)]
+        self.stats = {"requests": 0, "failed": 0, "pushed": 0, "events": 0}
+        for i in range(1, catalog_size + 1):
+            self._rows[i] = {
+                "id": i,
+                "sku": f"BENCH-{i:06d}",
+                "name": f"Benchmark product {i:06d}",
+                "description": None,
+                "unit": "pcs",
+                "listPrice": f"{100 + i % 900}.{i % 100:02d}",
+                "status": "ACTIVE",
+                "currentQty": 1000,
+                "updatedAt": self._tick(),
+            }
+        self._reindex()
+        self._server = None
+        self._thread = None
+
+    # --- catalog -------------------------------------------------------------
+
+    def _tick(self):
+        self._clock += timedelta(milliseconds=1)
+        return self._clock
+
+    def _reindex(self):
+        self._order = sorted((p["updatedAt"], p["id"]) for p in self._rows.values())
+
+    def touch(self, n):
+        """Mark `n` random products as changed (for incremental pulls)."""
+        with self._lock:
+            for pid in self._random.sample(sorted(self._rows), min(n, len(self._rows))):
+                row = self._rows[pid]
+                row["currentQty"] = self._random.randint(0, 1000)
+                row["updatedAt"] = self._tick()
+            self._reindex()
+
+    def update_product(self, sku, **fields):
+        """Change one product (Inventory field names), bumping updatedAt."""
+        with self._lock:
+            row = next(r for r in self._rows.values() if r["sku"] == sku)
+            row.update(fields, updatedAt=self._tick())
+            self._reindex()
+
+    def sync_from_sales(self, products):
+        """Upsert pushed products like Inventory does: catalog fields only."""
+        with self._lock:
+            by_sku = {r["sku"]: r for r in self._rows.values()}
+            for p in products:
+                fields = {"name": p["name"], "unit": p.get("unit") or "pcs", "listPrice": p["price"]}
+                row = by_sku.get(p["sku"])
+                if row is None:
+                    pid = max(self._rows, default=0) + 1
+                    row = self._rows[pid] = by_sku[p["sku"]] = {
+                        "id": pid, "sku": p["sku"], "description": None,
+                        "status": "ACTIVE", "currentQty": 0,
+                    }
+                row.update(fields, updatedAt=self._tick())
+            self._reindex()
+        return len(products)
+
+    def apply_sale(self, event):
+        """One sale-committed event, applied at most once per saleId."""
+        with self._lock:
+            if event["saleId"] in self._sales:
+                return {"saleId": event["saleId"], "ok": True, "duplicate": True, "count": 0}
+            by_sku = {r["sku"]: r for r in self._rows.values()}
+            unknown = [i["sku"] for i in event["items"] if i["sku"] not in by_sku]
+            if unknown:
+                return {"saleId": event["saleId"], "ok": False, "error": f"Unknown SKU {unknown[0]}"}
+            for item in event["items"]:
+                row = by_sku[item["sku"]]
+                row["currentQty"] -= item["qty"]
+                row["updatedAt"] = self._tick()
+            self._sales.add(event["saleId"])
+            self._reindex()
+        return {"saleId": event["saleId"], "ok": True, "duplicate": False, "count": len(event["items"])}
+
+    def stock(self, sku):
+        with self._lock:
+            return next(r["currentQty"] for r in self._rows.values() if r["sku"] == sku)
+
+    def _normalized(self):
+        for row in self._rows.values():
+            try:
+                yield _normalize(row)
+            except _Skip:
+                continue
+
+    def reconcile_buckets(self, buckets):
+        with self._lock:
+            digests = bucket_digests(self._normalized(), buckets)
+        return {"buckets": buckets, "digests": digests}
+
+    def reconcile_rows(self, buckets, ids):
+        wanted = set(ids)
+        with self._lock:
+            rows = [
+                self._public(self._rows[pid]) for pid in sorted(self._rows)
+                if bucket_of(self._rows[pid]["sku"].strip().upper(), buckets) in wanted
+            ]
+        return {"buckets": buckets, "rows": rows}
+
+    def _after(self, updated_since, after_id):
+        start = 0
+        if updated_since is not None:
+            start = bisect.bisect_right(self._order, (updated_since, after_id))
+        return self._order[start:]
+
+    def page(self, updated_since=None, after_id=0, limit=None, id_from=None, id_to=None):
+        with self._lock:
+            keys = self._after(updated_since, after_id)
+            if id_from is not None or id_to is not None:
+                lo, hi = id_from or 0, id_to if id_to is not None else float("inf")
+                keys = [k for k in keys if lo <= k[1] < hi]
+            keys = keys[:limit] if limit else keys
+            return [self._public(self._rows[pid]) for _, pid in keys]
+
+    def id_range(self, updated_since=None, after_id=0):
+        with self._lock:
+            keys = self._after(updated_since, after_id)
+            ids = [pid for _, pid in keys]
+            return {
+                "count": len(ids),
+                "minId": min(ids) if ids else None,
+                "maxId": max(ids) if ids else None,
+                "maxUpdatedAt": self._public(self._rows[keys[-1][1]])["updatedAt"] if keys else None,
+            }
+
+    @staticmethod
+    def _public(row):
+        return {**row, "updatedAt": row["updatedAt"].isoformat(timespec="milliseconds").replace("+00:00", "Z")}
+
+    # --- server --------------------------------------------------------------
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-inventory", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _should_fail(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            failed = self.failure_rate > 0 and self._random.random() < self.failure_rate
+            if failed:
+                self.stats["failed"] += 1
+            return failed
+
+    def _count(self, key, n):
+        with self._lock:
+            self.stats[key] += n
+
+
+def _handler(inventory):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like Express
+
+        def _send(self, status, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.headers.get("Content-Encoding") == "gzip":
+                raw = gzip.decompress(raw)
+            return json.loads(raw or b"null")
+
+        def _begin(self):
+            if inventory.latency:
+                time.sleep(inventory.latency)
+            if inventory._should_fail():
+                self._send(503, {"error": "injected failure"})
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if not self._begin():
+                return
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == "/products/reconcile/buckets":
+                return self._send(200, inventory.reconcile_buckets(int(q.get("buckets") or 256)))
+            if url.path == "/products/reconcile/rows":
+                ids = [int(i) for i in q.get("ids", "").split(",") if i]
+                return self._send(200, inventory.reconcile_rows(int(q.get("buckets") or 256), ids))
+            since = q.get("updatedSince")
+            position = {
+                "updated_since": datetime.fromisoformat(since.replace("Z", "+00:00")) if since else None,
+                "after_id": int(q.get("afterId") or 0),
+            }
+            if url.path == "/products/id-range":
+                return self._send(200, inventory.id_range(**position))
+            if url.path.rstrip("/") != "/products":
+                return self._send(404, {"error": "Not found"})
+            self._send(200, inventory.page(
+                **position,
+                limit=int(q["limit"]) if q.get("limit") else None,
+                id_from=int(q["idFrom"]) if q.get("idFrom") else None,
+                id_to=int(q["idTo"]) if q.get("idTo") else None,
+            ))
+
+        def do_POST(self):
+            path = urlsplit(self.path).path.rstrip("/")
+            body = self._body()  # always drain the request, even on failure
+            if not self._begin():
+                return
+            if path == "/products/sync-from-sales":
+                count = inventory.sync_from_sales(body)
+                inventory._count("pushed", count)
+                return self._send(200, {"message": "ok", "count": count})
+            if path == "/events/sale-committed/batch":
+                events = body.get("events", [])
+                inventory._count("events", len(events))
+                return self._send(200, {"ok": True, "results": [inventory.apply_sale(e) for e in events]})
+            self._send(404, {"error": "Not found"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
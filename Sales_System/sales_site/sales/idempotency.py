@@ -0,0 +1,201 @@
+import functools
+import hashlib
+import random
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+FORM_FIELD = "idempotency_key"  # for HTML forms, which can't set headers
+# Response headers stored with the body and replayed
+REPLAY_HEADERS = ("Content-Type", "Location")
+_POLL_INTERVAL = 0.05
+# Upper bound on IDEMPOTENCY_WAIT: a waiting duplicate holds a worker, so
+# it must give up long before the worker timeout
+_MAX_WAIT = 2.0
+
+
+def _wait():
+    return min(float(getattr(settings, "IDEMPOTENCY_WAIT", 1)), _MAX_WAIT)
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_TTL", 86400))
+
+
+def _fingerprint(request):
+    h = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _key(request):
+    key = request.headers.get(HEADER)
+    if not key and request.content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        key = request.POST.get(FORM_FIELD)
+    return (key or "").strip()
+
+
+def _error(status, message):
+    return JsonResponse({"error": message}, status=status)
+
+
+def _claim(scope, key, fingerprint):
+    """(record, created): insert an IN_PROGRESS row, or load the existing one."""
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fingerprint, expires_at=now + _ttl()
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:  # the owner failed and released it; try again
+                continue
+            return record, False
+        if random.random() < 0.01:
+            IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+        return record, True
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.response_body), status=record.response_status)
+    for header, value in record.response_headers.items():
+        response[header] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _acquire(scope, key, fingerprint):
+    """
+    (record, None) when this request should run and record its outcome, or
+    (None, response) to answer with instead: the stored response, a 422
+    for a key reused with a different request, or a 409 with Retry-After
+    if an identical request was still running after IDEMPOTENCY_WAIT
+    seconds (at most _MAX_WAIT; 0 answers 409 at once).
+    """
+    deadline = time.monotonic() + _wait()
+    stale_after = timedelta(seconds=getattr(settings, "IDEMPOTENCY_STALE_AFTER", 600))
+    while True:
+        record, created = _claim(scope, key, fingerprint)
+        if created:
+            return record, None
+        now = timezone.now()
+        if record.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at=record.expires_at).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            return None, _error(422, f"{HEADER} was already used for a different request")
+        if record.status == IdempotencyKey.Status.DONE:
+            return None, _replay(record)
+        if record.created_at <= now - stale_after:
+            # the owner died mid-request; take the key over
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status=IdempotencyKey.Status.IN_PROGRESS, created_at=record.created_at
+            ).update(created_at=now, expires_at=now + _ttl())
+            if taken:
+                return record, None
+            continue
+        if time.monotonic() >= deadline:
+            response = _error(409, f"A request with this {HEADER} is still in progress")
+            response["Retry-After"] = "1"
+            return None, response
+        time.sleep(_POLL_INTERVAL)
+
+
+def _record(record, response):
+    """Store a finished response, or release the key if it shouldn't be replayed."""
+    release = IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.Status.IN_PROGRESS)
+    if response is None or response.status_code >= 500 or response.streaming:
+        release.delete()
+        return
+    release.update(
+        status=IdempotencyKey.Status.DONE,
+        response_status=response.status_code,
+        response_headers={h: response[h] for h in REPLAY_HEADERS if h in response},
+        response_body=response.content,
+        expires_at=timezone.now() + _ttl(),
+    )
+
+
+def _rendered(response):
+    if callable(getattr(response, "render", None)) and not response.is_rendered:
+        response.render()  # DRF/template responses: store the final bytes
+    return response
+
+
+def _off_loop(func):
+    """
+    For async views: run `func` on a worker thread, not Django's shared
+    sync thread, since _acquire may poll for up to IDEMPOTENCY_WAIT.
+    """
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def idempotent(scope):
+    """
+    Make a POST view safe to retry. A request carrying an Idempotency-Key
+    header (or an idempotency_key form field) runs once; its response is
+    stored for IDEMPOTENCY_TTL seconds and replayed to later requests with
+    the same key and the same method, path and body. A duplicate that
+    arrives while the first is still running waits briefly for its result
+    (IDEMPOTENCY_WAIT), then gets 409 with Retry-After; it never executes
+    again. Failures (exceptions, 5xx) are not stored, so they
+    can be retried. Requests without a key are unaffected. Works on sync
+    and async views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                fingerprint = _fingerprint(request)
+                key = _key(request)
+                if not key:
+                    return await view(request, *args, **kwargs)
+                if len(key) > 255:
+                    return _error(400, f"{HEADER} must be at most 255 characters")
+
+                record, response = await _off_loop(_acquire)(scope, key, fingerprint)
+                if response is not None:
+                    return response
+                try:
+                    response = _rendered(await view(request, *args, **kwargs))
+                finally:
+                    await _off_loop(_record)(record, response)
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            fingerprint = _fingerprint(request)  # reads the body before the view does
+            key = _key(request)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return _error(400, f"{HEADER} must be at most 255 characters")
+
+            record, response = _acquire(scope, key, fingerprint)
+            if response is not None:
+                return response
+            try:
+                response = _rendered(view(request, *args, **kwargs))
+            finally:
+                _record(record, response)
+            return response
+        return wrapper
+    return decorator
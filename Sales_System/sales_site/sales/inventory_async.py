@@ -0,0 +1,356 @@
+import asyncio
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .api_inventory import (
+    PULL_CURSOR,
+    PUSH_CURSOR,
+    PUSH_FIELDS,
+    PUSH_HEADERS,
+    _check_ack,
+    _chunk_body,
+    _next_position,
+    _page_size,
+    _push_chunk_size,
+    _row_position,
+    pull_products,
+    push_products,
+    upsert_into_sales,
+)
+from .inventory_client import InventoryUnavailable, get_client
+from .metrics import install_query_hook
+from .models import Product, SyncCursor
+
+try:
+    import httpx  # optional; without it the async views run the sync code in a thread
+except ImportError:
+    httpx = None
+
+_DONE = object()
+
+
+def _concurrency():
+    return int(getattr(settings, "INVENTORY_ASYNC_CONCURRENCY", 4))
+
+
+class AsyncInventoryClient:
+    """
+    httpx.AsyncClient with the same timeouts, retry policy, circuit breaker
+    and stats as the shared InventoryClient (which it borrows them from).
+    Create one per sync run: an AsyncClient is bound to its event loop.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent or get_client()
+        connect, read = self.parent.timeout
+        self.http = httpx.AsyncClient(
+            base_url=self.parent.base_url,
+            headers=dict(self.parent.session.headers),
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=max(_concurrency(), 1) * 2),
+        )
+
+    async def request(self, method, path, idempotent=None, **kwargs):
+        """Async counterpart of InventoryClient.request."""
+        parent = self.parent
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in parent.IDEMPOTENT_METHODS
+        if not parent.breaker.allow():
+            parent._count("rejected")
+            raise InventoryUnavailable("Inventory_System circuit breaker is open")
+
+        attempts = parent.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                resp = await self.http.request(method, path, **kwargs)
+            except httpx.HTTPError as e:
+                parent._observe(time.monotonic() - started)
+                if isinstance(e, httpx.TransportError) and attempt + 1 < attempts:
+                    await self._sleep(attempt)
+                    continue
+                parent._count("failures")
+                parent.breaker.record_failure()
+                raise
+            except BaseException:  # incl. cancellation: never leave a probe unreported
+                parent.breaker.record_failure()
+                raise
+            parent._observe(time.monotonic() - started)
+
+            if resp.status_code in parent.RETRY_STATUSES and attempt + 1 < attempts:
+                await self._sleep(attempt)
+                continue
+            if resp.status_code >= 500:
+                parent._count("failures")
+                parent.breaker.record_failure()
+            else:
+                parent.breaker.record_success()
+            return resp
+
+    async def _sleep(self, attempt):
+        self.parent._count("retries")
+        delay = self.parent.backoff * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+@asynccontextmanager
+async def async_client():
+    client = AsyncInventoryClient()
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+def _in_thread(func):
+    """
+    Run blocking ORM code on a worker thread of its own (not the single
+    thread Django shares between sync views under ASGI) and close its DB
+    connection afterwards.
+    """
+    def run(*args, **kwargs):
+        install_query_hook(connection)  # count its queries against the request
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+# --- pull ---------------------------------------------------------------------
+
+async def _fetch_json(client, params):
+    resp = await client.get("/products", params=params)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _produce_ranges(client, queue, span, params, page_size):
+    """
+    Split [minId, maxId] into ~count/page_size id ranges and fetch them
+    INVENTORY_ASYNC_CONCURRENCY at a time, each in keyset pages of
+    page_size, feeding pages to `queue`. The first failure cancels the
+    other fetches and is raised.
+    """
+    lo, hi = span["minId"], span["maxId"] + 1
+    parts = max(1, math.ceil(span["count"] / page_size))
+    width = max(1, math.ceil((hi - lo) / parts))
+    limit = asyncio.Semaphore(_concurrency())
+
+    async def fetch(start):
+        async with limit:
+            await _produce_pages(client, queue, params, page_size, {"idFrom": start, "idTo": min(start + width, hi)})
+
+    tasks = [asyncio.ensure_future(fetch(start)) for start in range(lo, hi, width)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _produce_pages(client, queue, params, page_size, id_range=None):
+    """
+    Sequential keyset pages, for Inventory builds without /products/id-range
+    (and within one id range of _produce_ranges).
+    """
+    updated_since, after_id = params.get("updatedSince"), params.get("afterId", 0)
+    while True:
+        query = {"limit": page_size, **(id_range or {})}
+        if updated_since is not None:
+            query.update(updatedSince=updated_since, afterId=after_id)
+        page = await _fetch_json(client, query)
+        if page:
+            await queue.put(page)
+        if len(page) != page_size:
+            return
+        ts, after_id = _next_position(page)
+        updated_since = ts.isoformat(timespec="milliseconds")
+
+
+async def apull_products(full=False, progress=None):
+    """
+    Async pull_products. Pages are fetched concurrently (bounded by
+    INVENTORY_ASYNC_CONCURRENCY) by id range when Inventory supports
+    /products/id-range, sequentially by keyset otherwise, and handed
+    through a bounded queue to upsert_into_sales running on a worker
+    thread, so network time and DB writes overlap.
+
+    After a range-split pull the cursor moves to Inventory's newest
+    updatedAt at the start of the run; rows changed while it ran are
+    simply pulled again next time.
+    """
+    if httpx is None:
+        return await _in_thread(pull_products)(full=full, progress=progress)
+
+    cursor, _ = await _in_thread(SyncCursor.objects.get_or_create)(name=PULL_CURSOR)
+    delta = not full and cursor.last_updated_at is not None
+    params = {}
+    if delta:
+        params = {
+            "updatedSince": cursor.last_updated_at.isoformat(timespec="milliseconds"),
+            "afterId": cursor.last_id,
+        }
+    page_size = _page_size()
+    queue = asyncio.Queue(maxsize=_concurrency() * 2)
+    loop = asyncio.get_running_loop()
+    sample = []
+    high = None  # newest (updatedAt, id) seen, for keyset pulls
+
+    def items():
+        """Blocking iterator over queued rows, consumed on the worker thread."""
+        nonlocal high
+        while True:
+            page = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+            if page is _DONE:
+                return
+            for p in page:
+                if len(sample) < 3:
+                    sample.append(p)
+                pos = _row_position(p)
+                if pos and (high is None or pos > high):
+                    high = pos
+                yield p
+
+    async with async_client() as client:
+        resp = await client.get("/products/id-range", params=params)
+        span = resp.json() if resp.status_code == 200 else None
+        consumer = asyncio.ensure_future(_in_thread(upsert_into_sales)(items(), progress=progress))
+        try:
+            if span is not None:
+                if span["count"]:
+                    await _produce_ranges(client, queue, span, params, page_size)
+            else:
+                await _produce_pages(client, queue, params, page_size)
+        finally:
+            # always unblock the consumer, even when a fetch failed
+            await queue.put(_DONE)
+            result = await consumer
+
+    if span is not None:
+        # ranges arrive out of order, so only the probe's snapshot is safe
+        snapshot = parse_datetime(str(span.get("maxUpdatedAt") or ""))
+        high = (snapshot, 0) if snapshot else None
+    if high and not result["errors"]:
+        if cursor.last_updated_at is None or high > (cursor.last_updated_at, cursor.last_id):
+            cursor.last_updated_at, cursor.last_id = high
+            await _in_thread(cursor.save)()
+
+    result["mode"] = "delta" if delta else "full"
+    result["fetch"] = "ranges" if span is not None else "keyset"
+    result["cursor"] = {
+        "updatedAt": cursor.last_updated_at.isoformat() if cursor.last_updated_at else None,
+        "id": cursor.last_id,
+    }
+    result["sample"] = sample
+    return result
+
+
+# --- push ---------------------------------------------------------------------
+
+def _push_rows(position, chunk_size):
+    qs = Product.objects.order_by("updated_at", "id").values(*PUSH_FIELDS)
+    if position is not None:
+        ts, last_id = position
+        qs = qs.filter(Q(updated_at__gt=ts) | Q(updated_at=ts, id__gt=last_id))
+    return list(qs[:chunk_size])
+
+
+async def apush_products(full=False, progress=None):
+    """
+    Async push_products: reads the next chunk from the DB while up to
+    INVENTORY_ASYNC_CONCURRENCY earlier chunks are being POSTed. The
+    watermark only advances over chunks acknowledged in order, so a
+    failed push still resumes at the first unacknowledged chunk.
+    """
+    if httpx is None:
+        return await _in_thread(push_products)(full=full, progress=progress)
+
+    cursor, _ = await _in_thread(SyncCursor.objects.get_or_create)(name=PUSH_CURSOR)
+    delta = not full and cursor.last_updated_at is not None
+    chunk_size = _push_chunk_size()
+    position = (cursor.last_updated_at, cursor.last_id) if delta else None
+    limit = asyncio.Semaphore(_concurrency())
+    read_rows = _in_thread(_push_rows)
+    save_cursor = _in_thread(cursor.save)
+
+    ends = []         # chunk index -> (updated_at, id) of its last row
+    acked = set()
+    saved = -1        # last chunk index the cursor covers
+    sent = 0
+    last_ack = None
+
+    async def post(index, rows):
+        nonlocal saved, sent, last_ack
+        try:
+            count, body = _chunk_body(rows)
+            resp = await client.post("/products/sync-from-sales", content=body,
+                                     headers=PUSH_HEADERS, idempotent=True)
+            ack = resp.json() if resp.status_code == 200 else {}
+            last_ack = _check_ack(resp.status_code, resp.text, ack, count)
+        finally:
+            limit.release()
+        sent += count
+        acked.add(index)
+        advanced = False
+        while saved + 1 in acked:
+            saved += 1
+            advanced = True
+        if advanced:
+            cursor.last_updated_at, cursor.last_id = ends[saved]
+            await save_cursor()
+        if progress:
+            progress({"chunks": len(acked), "sent": sent})
+
+    tasks = []
+    async with async_client() as client:
+        try:
+            while True:
+                rows = await read_rows(position, chunk_size)
+                if not rows:
+                    break
+                position = (rows[-1]["updated_at"], rows[-1]["id"])
+                ends.append(position)
+                await limit.acquire()
+                tasks.append(asyncio.ensure_future(post(len(ends) - 1, rows)))
+                if any(t.done() and t.exception() for t in tasks):
+                    break
+                if len(rows) < chunk_size:
+                    break
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    return {
+        "mode": "delta" if delta else "full",
+        "count": sent,
+        "chunks": len(acked),
+        "cursor": {
+            "updatedAt": cursor.last_updated_at.isoformat() if cursor.last_updated_at else None,
+            "id": cursor.last_id,
+        },
+        "inventory_response": last_ack,
+    }
@@ -0,0 +1,217 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .metrics import LATENCY_BUCKETS, observe_inventory_call
+
+
+class InventoryUnavailable(Exception):
+    """Raised instead of calling Inventory_System while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and rejects calls for
+    `reset_after` seconds. Then a single probe is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                return True
+            # OPEN, or HALF_OPEN with the probe already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class InventoryClient:
+    """
+    Keep-alive HTTP client for Inventory_System.
+
+    - one pooled requests.Session shared by every sync path
+    - split (connect, read) timeouts
+    - exponential backoff with jitter, only for idempotent calls
+    - a circuit breaker so callers fail fast while Inventory is down
+    """
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(self, base_url, api_key="", connect_timeout=3.05, read_timeout=30.0,
+                 retries=3, backoff=0.5, pool_size=10,
+                 breaker_threshold=5, breaker_reset=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "rejected": 0,   # short-circuited by the open breaker
+            "latency_sum": 0.0,
+            "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+        }
+
+    # --- stats -------------------------------------------------------------
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _observe(self, seconds):
+        observe_inventory_call(seconds)
+        idx = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                idx = i
+                break
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["latency_sum"] += seconds
+            self._stats["latency_buckets"][idx] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+            buckets = list(s.pop("latency_buckets"))
+        labels = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        s["latency_histogram"] = dict(zip(labels, buckets))
+        s["breaker"] = {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+        return s
+
+    # --- requests ----------------------------------------------------------
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Send one logical request. Idempotent calls are retried on connection
+        errors, timeouts and 429/502/503/504 with exponential backoff.
+        Raises InventoryUnavailable while the breaker is open; otherwise
+        returns the final Response (callers decide on raise_for_status).
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in self.IDEMPOTENT_METHODS
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise InventoryUnavailable("Inventory_System circuit breaker is open")
+
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        attempts = self.retries + 1 if idempotent else 1
+
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._observe(time.monotonic() - started)
+                if isinstance(e, (requests.ConnectionError, requests.Timeout)) and attempt + 1 < attempts:
+                    self._sleep(attempt)
+                    continue
+                self._count("failures")
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # every allowed call must report back, or a half-open
+                # breaker would wait for its probe forever
+                self.breaker.record_failure()
+                raise
+            self._observe(time.monotonic() - started)
+
+            if resp.status_code in self.RETRY_STATUSES and attempt + 1 < attempts:
+                resp.close()
+                self._sleep(attempt)
+                continue
+            if resp.status_code >= 500:
+                self._count("failures")
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return resp
+
+    def _sleep(self, attempt):
+        self._count("retries")
+        delay = self.backoff * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide InventoryClient built from settings on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InventoryClient(
+                    base_url=getattr(settings, "INVENTORY_API_BASE", "http://127.0.0.1:3001"),
+                    api_key=getattr(settings, "INVENTORY_API_KEY", ""),
+                    connect_timeout=getattr(settings, "INVENTORY_CONNECT_TIMEOUT", 3.05),
+                    read_timeout=getattr(settings, "INVENTORY_READ_TIMEOUT", 30.0),
+                    retries=getattr(settings, "INVENTORY_RETRIES", 3),
+                    backoff=getattr(settings, "INVENTORY_RETRY_BACKOFF", 0.5),
+                    pool_size=getattr(settings, "INVENTORY_POOL_SIZE", 10),
+                    breaker_threshold=getattr(settings, "INVENTORY_BREAKER_THRESHOLD", 5),
+                    breaker_reset=getattr(settings, "INVENTORY_BREAKER_RESET", 30.0),
+                )
+    return _client
+
+
+def reset_client():
+    """Drop the shared client (e.g. after changing settings in tests)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
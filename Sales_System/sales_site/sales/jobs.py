@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .api_inventory import pull_products, push_products
+from .models import SyncJob
+
+
+def _run_pull(params, progress):
+    return pull_products(full=bool(params.get("full")), progress=progress)
+
+
+def _run_push(params, progress):
+    return push_products(full=bool(params.get("full")), progress=progress)
+
+
+RUNNERS = {
+    SyncJob.Kind.PULL: _run_pull,
+    SyncJob.Kind.PUSH: _run_push,
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "SYNC_JOB_WORKERS", 2),
+            thread_name_prefix="sync-job",
+        )
+    return _executor
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, "SYNC_JOB_STALE_AFTER", 60))
+
+
+def _abandon(job):
+    """Fail a job whose worker stopped heartbeating, freeing its kind."""
+    SyncJob.objects.filter(pk=job.pk, active_kind=job.kind, heartbeat_at=job.heartbeat_at).update(
+        status=SyncJob.Status.FAILED,
+        error="worker stopped responding",
+        active_kind=None,
+        finished_at=timezone.now(),
+    )
+
+
+def enqueue(kind, params=None):
+    """
+    Queue a sync job and return (job, created). A request for a kind that
+    is already queued or running is coalesced into that job instead of
+    starting another transfer; a queued job is upgraded to full if asked.
+
+    The unique SyncJob.active_kind makes this hold across processes: of
+    two concurrent enqueues only one insert succeeds, the other joins
+    its job. An active job without a heartbeat for SYNC_JOB_STALE_AFTER
+    seconds is failed and replaced.
+    """
+    params = params or {}
+    while True:
+        job = SyncJob.objects.filter(active_kind=kind).first()
+        if job is not None:
+            if job.heartbeat_at is None or job.heartbeat_at < timezone.now() - _stale_after():
+                _abandon(job)
+                continue
+            if job.status == SyncJob.Status.QUEUED and params.get("full") and not job.params.get("full"):
+                job.params = {**job.params, "full": True}
+                SyncJob.objects.filter(pk=job.pk, status=SyncJob.Status.QUEUED).update(params=job.params)
+            return job, False
+        try:
+            with transaction.atomic():
+                job = SyncJob.objects.create(
+                    kind=kind, params=params, active_kind=kind, heartbeat_at=timezone.now()
+                )
+        except IntegrityError:
+            continue  # another process queued one first; join it
+        # submit only once the row is committed so the worker can see it
+        transaction.on_commit(lambda: _get_executor().submit(run_job, job.pk))
+        return job, True
+
+
+def _beat(job_id, stop):
+    """Refresh the job's heartbeat until `stop` is set."""
+    interval = getattr(settings, "SYNC_JOB_HEARTBEAT", 10)
+    try:
+        while not stop.wait(interval):
+            SyncJob.objects.filter(pk=job_id, active_kind__isnull=False).update(heartbeat_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def run_job(job_id):
+    """Execute one job in the current thread, recording progress and outcome."""
+    close_old_connections()
+    stop = threading.Event()
+    try:
+        job = SyncJob.objects.get(pk=job_id)
+        started = SyncJob.objects.filter(pk=job_id, status=SyncJob.Status.QUEUED, active_kind=job.kind).update(
+            status=SyncJob.Status.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now()
+        )
+        if not started:  # abandoned while waiting for a worker
+            return
+        threading.Thread(target=_beat, args=(job_id, stop), name=f"sync-job-beat-{job.kind}", daemon=True).start()
+
+        def progress(p):
+            SyncJob.objects.filter(pk=job_id).update(progress=p, heartbeat_at=timezone.now())
+
+        result = RUNNERS[job.kind](job.params, progress)
+        SyncJob.objects.filter(pk=job_id).update(
+            status=SyncJob.Status.DONE, result=result, finished_at=timezone.now(), active_kind=None
+        )
+    except Exception as e:
+        SyncJob.objects.filter(pk=job_id).update(
+            status=SyncJob.Status.FAILED, error=str(e), finished_at=timezone.now(), active_kind=None
+        )
+    finally:
+        stop.set()
+        close_old_connections()
+
+
+def job_payload(job):
+    return {
+        "job_id": str(job.job_id),
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "heartbeat_at": job.heartbeat_at,
+    }
@@ -0,0 +1,248 @@
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from sales.fake_inventory import FakeInventory
+from sales.inventory_client import reset_client
+from sales.models import Product, Sale
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class _Scenario:
+    """Latency, query count and errors for one benchmarked request type."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    @contextmanager
+    def measure(self):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            yield
+            self.latencies.append(time.perf_counter() - started)
+        self.queries.append(len(ctx.captured_queries))
+
+    def check(self, resp, ok=True):
+        if resp.status_code >= 400 or not ok:
+            self.errors += 1
+
+    def summary(self):
+        lat = sorted(self.latencies)
+        total = sum(lat)
+        ms = lambda v: round(v * 1000, 3) if v is not None else None
+        return {
+            "requests": len(lat),
+            "errors": self.errors,
+            "throughput_rps": round(len(lat) / total, 2) if total else None,
+            "p50_ms": ms(_percentile(lat, 50)),
+            "p99_ms": ms(_percentile(lat, 99)),
+            "mean_ms": ms(total / len(lat)) if lat else None,
+            "queries_avg": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+            "queries_max": max(self.queries, default=None),
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline benchmark: runs the sync, storefront and REST list endpoints "
+        "against an in-process fake Inventory and a throwaway test database, "
+        "and writes throughput, p50/p99 latency and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", type=int, default=2000, help="Products served by the fake Inventory.")
+        parser.add_argument("--latency-ms", type=float, default=2.0, help="Added latency per fake Inventory response.")
+        parser.add_argument("--failure-rate", type=float, default=0.0,
+                            help="Fraction of fake Inventory requests answering 503 (0..1).")
+        parser.add_argument("--iterations", type=int, default=50, help="Requests per storefront/REST scenario.")
+        parser.add_argument("--sync-iterations", type=int, default=3, help="Runs per sync scenario.")
+        parser.add_argument("--delta", type=int, default=100, help="Products changed before each incremental pull.")
+        parser.add_argument("--cart-lines", type=int, default=5, help="Lines per cart.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="",
+                            help="Result file (default bench-results/bench-<timestamp>.json).")
+        parser.add_argument("--compare", default="", help="Earlier result file to compare against.")
+        parser.add_argument("--keepdb", action="store_true", help="Reuse the test database between runs.")
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=opts["keepdb"])
+        try:
+            inventory = FakeInventory(
+                catalog_size=opts["catalog"],
+                latency=opts["latency_ms"] / 1000,
+                failure_rate=opts["failure_rate"],
+                seed=opts["seed"],
+            )
+            with inventory, override_settings(
+                INVENTORY_API_BASE=inventory.url,
+                INVENTORY_RETRY_BACKOFF=0.01,
+                OUTBOX_AUTODISPATCH=False,
+            ):
+                reset_client()
+                try:
+                    results = self.run_scenarios(inventory, opts)
+                finally:
+                    reset_client()
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=opts["keepdb"])
+            teardown_test_environment()
+
+        report = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "db": connection.vendor,
+            },
+            "config": {k: opts[k] for k in (
+                "catalog", "latency_ms", "failure_rate", "iterations",
+                "sync_iterations", "delta", "cart_lines", "seed",
+            )},
+            "fake_inventory": inventory.stats,
+            "results": results,
+        }
+        self.print_table(results)
+        path = opts["output"] or os.path.join(
+            "bench-results", f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"\nWrote {path}")
+        if opts["compare"]:
+            self.print_comparison(opts["compare"], results)
+
+    # --- scenarios -----------------------------------------------------------
+
+    def run_scenarios(self, inventory, opts):
+        n, sync_n = opts["iterations"], opts["sync_iterations"]
+        scenarios = []
+
+        def scenario(name):
+            s = _Scenario(name)
+            scenarios.append(s)
+            self.stdout.write(f"running {name} ...")
+            return s
+
+        api = Client()
+
+        s = scenario("pull_full")
+        for _ in range(sync_n):
+            with s.measure():
+                resp = api.post("/api/sync-from-inventory/?wait=1&full=1")
+            s.check(resp)
+
+        s = scenario("pull_delta")
+        for _ in range(sync_n):
+            inventory.touch(opts["delta"])
+            with s.measure():
+                resp = api.post("/api/sync-from-inventory/?wait=1")
+            s.check(resp)
+
+        s = scenario("push_full")
+        for _ in range(sync_n):
+            with s.measure():
+                resp = api.post("/api/sync-to-inventory/?wait=1&full=1")
+            s.check(resp)
+
+        skus = list(
+            Product.objects.filter(is_active=True).order_by("sku")
+            .values_list("sku", flat=True)[:max(opts["cart_lines"] * 4, 1)]
+        )
+        if not skus:
+            raise RuntimeError("pull_full imported no products; check --failure-rate")
+        lines = skus[:opts["cart_lines"]]
+
+        shopper = Client()
+        for sku in lines:
+            shopper.post("/add/", {"sku": sku, "qty": 1})
+        s = scenario("update_cart")
+        for i in range(n):
+            data = {f"qty_{sku}": 1 + (i + j) % 3 for j, sku in enumerate(lines)}
+            with s.measure():
+                resp = shopper.post("/cart/update/", data)
+            s.check(resp)
+
+        s = scenario("place_order")
+        for i in range(n):
+            buyer = Client()
+            for sku in skus[i % len(skus):][:opts["cart_lines"]] or lines:
+                buyer.post("/add/", {"sku": sku, "qty": 1})
+            before = Sale.objects.count()
+            with s.measure():
+                resp = buyer.post("/place-order/", {"name": f"Bench {i}", "email": f"bench{i}@example.com"})
+            s.check(resp, ok=Sale.objects.count() == before + 1)
+
+        for name, url in (
+            ("list_sales", "/api/sales/"),
+            ("list_products", "/api/products/"),
+            ("catalog_page", "/products/?limit=100"),
+            ("sales_rollup", "/api/reports/sales-rollup/"),
+        ):
+            s = scenario(name)
+            for _ in range(n):
+                with s.measure():
+                    resp = api.get(url)
+                s.check(resp)
+
+        return {s.name: s.summary() for s in scenarios}
+
+    # --- output ----------------------------------------------------------------
+
+    def print_table(self, results):
+        self.stdout.write(
+            f"\n{'scenario':<14} {'reqs':>5} {'err':>4} {'req/s':>9} "
+            f"{'p50 ms':>9} {'p99 ms':>9} {'queries':>8}"
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<14} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps'] or 0:>9.1f} "
+                f"{r['p50_ms'] or 0:>9.2f} {r['p99_ms'] or 0:>9.2f} {r['queries_avg'] or 0:>8.1f}"
+            )
+
+    def print_comparison(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)["results"]
+        self.stdout.write(f"\nvs {path}")
+        self.stdout.write(f"{'scenario':<14} {'req/s':>9} {'p99 ms':>9} {'queries':>8}")
+
+        def change(old, new):
+            if not old or new is None:
+                return "n/a"
+            return f"{(new - old) / old * 100:+.1f}%"
+
+        for name, r in results.items():
+            old = previous.get(name)
+            if old is None:
+                continue
+            self.stdout.write(
+                f"{name:<14} {change(old['throughput_rps'], r['throughput_rps']):>9} "
+                f"{change(old['p99_ms'], r['p99_ms']):>9} "
+                f"{change(old['queries_avg'], r['queries_avg']):>8}"
+            )
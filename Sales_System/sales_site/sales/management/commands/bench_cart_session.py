@@ -0,0 +1,71 @@
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+}
+
+
+def _legacy_cart(lines):
+    return {
+        f"SKU-{i:05d}": {
+            "name": f"Benchmark product {i} with a realistic name",
+            "unit": "pcs",
+            "price": 1999.0,
+            "qty": 2,
+        }
+        for i in range(lines)
+    }
+
+
+def _compact_cart(lines):
+    return {f"SKU-{i:05d}": 2 for i in range(lines)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare storefront session cost per request: legacy vs compact cart "
+        "encoding, across the db / cached_db / cache session backends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=20, help="Cart lines.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Simulated cart clicks (load + modify + save) per case.")
+
+    def handle(self, *args, **opts):
+        lines, n = opts["lines"], opts["requests"]
+        carts = {"legacy": _legacy_cart(lines), "compact": _compact_cart(lines)}
+
+        self.stdout.write(f"{lines}-line cart, {n} requests per case\n")
+        self.stdout.write(f"{'engine':<10} {'cart':<8} {'bytes':>7} {'queries/req':>12} {'ms/req':>8}")
+        for engine_name, engine in ENGINES.items():
+            store_cls = import_module(engine).SessionStore
+            for cart_name, cart in carts.items():
+                store = store_cls()
+                store["cart"] = cart
+                store.save()
+                key = store.session_key
+                size = len(store.encode(store._get_session(no_load=True)))
+
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as ctx:
+                    for _ in range(n):
+                        s = store_cls(session_key=key)
+                        c = s["cart"]          # load (what the middleware does)
+                        s["cart"] = c          # cart click writes it back
+                        s.modified = True
+                        s.save()
+                elapsed = (time.perf_counter() - started) * 1000 / n
+                store.delete()
+
+                self.stdout.write(
+                    f"{engine_name:<10} {cart_name:<8} {size:>7} "
+                    f"{len(ctx.captured_queries) / n:>12.2f} {elapsed:>8.3f}"
+                )
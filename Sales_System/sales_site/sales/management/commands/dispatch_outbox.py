@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sales.inventory_client import InventoryUnavailable
+from sales.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox events (sale-committed) to Inventory_System."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running and poll for new events.")
+        parser.add_argument("--interval", type=float,
+                            default=getattr(settings, "OUTBOX_LINGER", 0.25) * 4,
+                            help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **opts):
+        while True:
+            try:
+                n = drain()
+                if n:
+                    self.stdout.write(f"Delivered {n} event(s)")
+            except InventoryUnavailable as e:
+                self.stderr.write(str(e))
+            if not opts["loop"]:
+                return
+            time.sleep(opts["interval"])
@@ -0,0 +1,42 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.product_io import FORMATS, guess_format, import_products, open_text, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV (with header) or NDJSON file into the "
+        "catalog, upserting by SKU in bulk batches. Columns: sku, name, unit, "
+        "price, stock_qty, is_active (Inventory's listPrice/currentQty/status "
+        "also work). *.gz is read compressed, '-' reads stdin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin.")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension.")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Rows per bulk write (default settings.INVENTORY_SYNC_BATCH_SIZE).")
+
+    def handle(self, *args, **opts):
+        fmt = opts["format"] or guess_format(opts["path"])
+        if fmt is None:
+            raise CommandError("Can't tell the format from the file name; pass --format")
+        started = time.monotonic()
+
+        def progress(counts):
+            if counts["batches"] % 100 == 0:
+                rate = counts["read"] / max(time.monotonic() - started, 1e-9)
+                self.stderr.write(f"{counts['read']} rows read ({rate:.0f}/s)")
+
+        try:
+            with open_text(opts["path"], "r") as stream:
+                result = import_products(read_rows(stream, fmt), opts["batch_size"], progress)
+        except (OSError, ValueError) as e:  # unreadable or undecodable file
+            raise CommandError(str(e))
+        result["seconds"] = round(time.monotonic() - started, 2)
+        self.stdout.write(json.dumps(result, indent=2))
+        if result["errors"]:
+            raise CommandError(f"{result['errors']} rows failed")
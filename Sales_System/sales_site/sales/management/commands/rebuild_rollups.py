@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from sales.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SalesRollup table from sales (backfill or repair drift)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only rebuild from this local date (YYYY-MM-DD) on.")
+
+    def handle(self, *args, **opts):
+        since = None
+        if opts["since"]:
+            since = parse_date(opts["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since date: {opts['since']}")
+        n = rebuild(since)
+        self.stdout.write(f"Wrote {n} rollup row(s)")
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from sales.inventory_client import InventoryUnavailable
+from sales.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare price/stock/status with Inventory_System by SKU bucket and "
+        "report differing SKUs; only mismatching buckets are transferred. "
+        "Exits non-zero when the systems disagree (for nightly checks)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buckets", type=int, default=None,
+                            help="SKU buckets (default settings.RECONCILE_BUCKETS).")
+        parser.add_argument("--fix", action="store_true",
+                            help="Copy Inventory's values into Sales for the differing SKUs.")
+
+    def handle(self, *args, **opts):
+        try:
+            result = reconcile(buckets=opts["buckets"], fix=opts["fix"])
+        except InventoryUnavailable as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(result, indent=2, cls=DjangoJSONEncoder))
+        out_of_sync = result["missing_in_sales"] + result["missing_in_inventory"] + result["different"]
+        if out_of_sync and not opts["fix"]:
+            raise CommandError(f"{out_of_sync} SKUs differ between Sales and Inventory")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from sales.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired stock reservations (run from cron every few minutes)."
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"Swept {sweep_expired()} expired reservation(s)")
@@ -0,0 +1,184 @@
+import threading
+import time
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the latency histogram buckets; last one is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the per-request query-count histogram; last one is +Inf
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+_lock = threading.Lock()
+# The RequestStats of the request being served. A ContextVar rather than a
+# thread-local so it follows async views into the threads they hand ORM
+# work to (sync_to_async copies the context).
+_current = ContextVar("sales_request_stats", default=None)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 3)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        else:
+            row[len(self.buckets)] += 1
+        row[-2] += value
+        row[-1] += 1
+
+
+# name -> (help, type, {labels: value} or _Histogram); labels are tuples of
+# (label, value) pairs. Counters are process-local, like catalog_stats().
+_metrics = {
+    "sales_http_requests_total": ("HTTP requests by view, method and status.", "counter", {}),
+    "sales_http_request_duration_seconds": ("Request latency by view.", "histogram", _Histogram(LATENCY_BUCKETS)),
+    "sales_db_queries_per_request": ("SQL queries per request by view.", "histogram", _Histogram(QUERY_COUNT_BUCKETS)),
+    "sales_db_queries_total": ("SQL queries by view.", "counter", {}),
+    "sales_db_duration_seconds_total": ("Time spent in SQL by view.", "counter", {}),
+    "sales_inventory_calls_total": ("Inventory_System HTTP calls made while serving a view.", "counter", {}),
+    "sales_inventory_duration_seconds_total": ("Time spent calling Inventory_System by view.", "counter", {}),
+    "sales_inventory_request_duration_seconds": (
+        "Latency of every Inventory_System HTTP call (requests and background jobs).",
+        "histogram", _Histogram(LATENCY_BUCKETS),
+    ),
+    "sales_slow_requests_total": ("Requests slower than METRICS_SLOW_REQUEST_MS by view.", "counter", {}),
+    "sales_outbox_dead_events_total": (
+        "Outbox events given up on after OUTBOX_MAX_ATTEMPTS (their stock never reached Inventory).",
+        "counter", {},
+    ),
+}
+
+
+def _inc(name, labels, amount=1):
+    values = _metrics[name][2]
+    values[labels] = values.get(labels, 0) + amount
+
+
+class RequestStats:
+    """What one request spent on SQL and Inventory calls."""
+    __slots__ = ("queries", "db_time", "inventory_calls", "inventory_time")
+
+    def __init__(self):
+        self.queries = []  # [(seconds, sql)]
+        self.db_time = 0.0
+        self.inventory_calls = 0
+        self.inventory_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: time every statement."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries.append((elapsed, sql))
+
+    def top_queries(self, n):
+        return sorted(self.queries, key=lambda q: q[0], reverse=True)[:n]
+
+
+def begin_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def _query_hook(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_hook(connection, **kwargs):
+    """
+    Time the queries of whatever request is current on `connection`, on
+    every thread. Also a connection_created receiver, so connections opened
+    later by worker threads get it too.
+    """
+    if _query_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_hook)
+
+
+def observe_inventory_call(seconds):
+    """Called by InventoryClient for every HTTP call it makes."""
+    stats = _current.get()
+    if stats is not None:
+        stats.inventory_calls += 1
+        stats.inventory_time += seconds
+    with _lock:
+        _metrics["sales_inventory_request_duration_seconds"][2].observe((), seconds)
+
+
+def observe_outbox_dead(count):
+    """Called by the outbox dispatcher for events it stops retrying."""
+    with _lock:
+        _inc("sales_outbox_dead_events_total", (), count)
+
+
+def record_request(view, method, status, seconds, stats, slow=False):
+    labels = (("view", view),)
+    with _lock:
+        _inc("sales_http_requests_total", (("view", view), ("method", method), ("status", str(status))))
+        _metrics["sales_http_request_duration_seconds"][2].observe(labels, seconds)
+        _metrics["sales_db_queries_per_request"][2].observe(labels, len(stats.queries))
+        _inc("sales_db_queries_total", labels, len(stats.queries))
+        _inc("sales_db_duration_seconds_total", labels, stats.db_time)
+        if stats.inventory_calls:
+            _inc("sales_inventory_calls_total", labels, stats.inventory_calls)
+            _inc("sales_inventory_duration_seconds_total", labels, stats.inventory_time)
+        if slow:
+            _inc("sales_slow_requests_total", labels)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _lock:
+        for name, (help_text, kind, values) in _metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                bounds = [str(b) for b in values.buckets] + ["+Inf"]
+                for labels, row in values.series.items():
+                    cumulative = 0
+                    for bound, count in zip(bounds, row):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {row[-2]}")
+                    lines.append(f"{name}_count{_labels(labels)} {row[-1]}")
+            else:
+                for labels, value in values.items():
+                    lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Drop all recorded values (tests/benchmarks)."""
+    with _lock:
+        for _, kind, values in _metrics.values():
+            if kind == "histogram":
+                values.series.clear()
+            else:
+                values.clear()
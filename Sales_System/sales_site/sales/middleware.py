@@ -0,0 +1,88 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+slow_log = logging.getLogger("sales.slow_requests")
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL query count/time and Inventory call count/time for
+    every request, labelled by view name, for the /metrics endpoint.
+
+    Requests slower than METRICS_SLOW_REQUEST_MS are counted, and a
+    METRICS_SLOW_SAMPLE_RATE fraction of them is logged to
+    "sales.slow_requests" with their slowest queries. The per-query cost
+    is one timer and one list append; SQL text is only formatted when a
+    slow request is actually logged.
+
+    Works in both sync and async chains, so under ASGI async views are
+    not pushed back onto a thread just to be measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(metrics.install_query_hook, dispatch_uid="sales.metrics")
+        self.slow_after = getattr(settings, "METRICS_SLOW_REQUEST_MS", 500) / 1000
+        self.sample_rate = getattr(settings, "METRICS_SLOW_SAMPLE_RATE", 0.1)
+        self.top_queries = getattr(settings, "METRICS_TOP_QUERIES", 5)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics.install_query_hook(connection)
+        stats, token = metrics.begin_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.begin_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def _record(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else "unmatched"
+        slow = elapsed >= self.slow_after
+        metrics.record_request(view, request.method, response.status_code, elapsed, stats, slow)
+        if slow and random.random() < self.sample_rate:
+            self._log_slow(request, response, view, elapsed, stats)
+
+    def _log_slow(self, request, response, view, elapsed, stats):
+        slow_log.warning(
+            "slow request %s %s (%s) status=%s %.0fms queries=%d db=%.0fms inventory_calls=%d inventory=%.0fms\n%s",
+            request.method,
+            request.path,
+            view,
+            response.status_code,
+            elapsed * 1000,
+            len(stats.queries),
+            stats.db_time * 1000,
+            stats.inventory_calls,
+            stats.inventory_time * 1000,
+            "\n".join(
+                f"  {seconds * 1000:8.1f}ms  {sql[:500]}"
+                for seconds, sql in stats.top_queries(self.top_queries)
+            ),
+        )
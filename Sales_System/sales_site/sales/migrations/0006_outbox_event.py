@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_sync_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('sale-committed', 'Sale committed')], max_length=40)),
+                ('key', models.CharField(max_length=64)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dispatched_at', 'id'], name='sales_outbo_dispatc_b1a24b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('event_type', 'key'), name='outbox_event_type_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(max_length=64)),
+                ('sku', models.CharField(max_length=64)),
+                ('qty', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sku', 'expires_at'], name='sales_stock_sku_092243_idx'), models.Index(fields=['expires_at'], name='sales_stock_expires_04dbd9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('holder', 'sku'), name='reservation_holder_sku_uniq')],
+            },
+        ),
+    ]
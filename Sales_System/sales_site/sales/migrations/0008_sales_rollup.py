@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sku', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('NEW', 'New'), ('PAID', 'Paid'), ('CANCELLED', 'Cancelled')], max_length=12)),
+                ('qty', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sku', 'date'], name='sales_sales_sku_5b4862_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'sku', 'status'), name='rollup_date_sku_status_uniq')],
+            },
+        ),
+    ]
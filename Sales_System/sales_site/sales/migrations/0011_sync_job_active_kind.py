@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncjob',
+            name='active_kind',
+            field=models.CharField(blank=True, editable=False, max_length=8, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='syncjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Sum
 from django.utils import timezone
 from django.core.validators import MinValueValidator
+from decimal import Decimal
 import uuid
 
 class Customer(models.Model):
@@ -27,16 +30,46 @@ class Sale(models.Model):
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     paid_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # SaleViewSet: ORDER BY -created_at, -sale_id (cursor pages),
+            # optionally filtered by status; admin status filter
+            models.Index(fields=["created_at", "sale_id"]),
+            models.Index(fields=["status", "created_at", "sale_id"]),
+        ]
+
+    @staticmethod
+    def new_sale_no():
+        # Simple unique sale number like 2025-xxxxx
+        return timezone.now().strftime("%Y%m%d") + "-" + str(uuid.uuid4().hex[:6]).upper()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        sale = super().from_db(db, field_names, values)
+        # status as loaded, so post_save can see transitions (rollups)
+        sale._original_status = sale.__dict__.get("status")
+        return sale
+
     def save(self, *args, **kwargs):
         if not self.sale_no:
-            # Simple unique sale number like 2025-xxxxx
-            self.sale_no = timezone.now().strftime("%Y%m%d") + "-" + str(uuid.uuid4().hex[:6]).upper()
-        super().save(*args, **kwargs)
-        # Recompute after items exist
-        total = sum(item.line_total for item in self.items.all())
+            self.sale_no = self.new_sale_no()
+        # the post_save rollup move commits or rolls back with the row
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+        self._original_status = self.status
+
+    def recalculate_total(self):
+        """
+        Recompute total_amount from the items with one aggregate query.
+        save() no longer does this; call it only when items change
+        (creators that build items in memory should set total_amount
+        directly instead).
+        """
+        total = self.items.aggregate(total=Sum("line_total"))["total"] or Decimal("0")
         if self.total_amount != total:
             self.total_amount = total
             super().save(update_fields=["total_amount"])
+        return total
 
     def __str__(self):
         return self.sale_no
@@ -52,6 +85,9 @@ class SaleItem(models.Model):
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     line_total = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["sku", "sale"])]  # per-SKU lookups/reports
+
     def save(self, *args, **kwargs):
         self.line_total = self.qty * self.unit_price
         super().save(*args, **kwargs)
@@ -68,6 +104,167 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # storefront/catalog: active products ORDER BY name, id (keyset pages)
+        indexes = [models.Index(fields=["is_active", "name", "id"])]
+
     def __str__(self):
         return f"{self.sku} – {self.name}"
 
+
+
+class SyncCursor(models.Model):
+    """
+    High-water mark for incremental syncs with Inventory_System.
+    Ordered by (last_updated_at, last_id) so rows sharing a timestamp
+    are not skipped or re-sent.
+    """
+    name = models.CharField(max_length=40, unique=True)
+    last_updated_at = models.DateTimeField(null=True, blank=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_updated_at} #{self.last_id}"
+
+
+class SyncJob(models.Model):
+    """
+    One background Inventory sync, run by sales.jobs in a local worker pool.
+    """
+    class Kind(models.TextChoices):
+        PULL = "PULL", "Inventory → Sales"
+        PUSH = "PUSH", "Sales → Inventory"
+
+    class Status(models.TextChoices):
+        QUEUED = "QUEUED", "Queued"
+        RUNNING = "RUNNING", "Running"
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=8, choices=Kind.choices)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.QUEUED)
+    progress = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # = kind while QUEUED/RUNNING, NULL once finished: the unique index
+    # allows one active job per kind across every process
+    active_kind = models.CharField(max_length=8, null=True, blank=True, unique=True, editable=False)
+    # bumped by the running worker; a job that stops beating is dead
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["kind", "status"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.job_id} ({self.status})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Event waiting to be delivered to Inventory_System. Written in the same
+    transaction as the change it describes and drained by sales.outbox,
+    so checkout never waits on Inventory.
+    """
+    class Type(models.TextChoices):
+        SALE_COMMITTED = "sale-committed", "Sale committed"
+
+    event_type = models.CharField(max_length=40, choices=Type.choices)
+    key = models.CharField(max_length=64)  # sale_no for sale events; idempotency key downstream
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Lease of the dispatcher sending it; others skip it until then
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event_type", "key"], name="outbox_event_type_key_uniq"),
+        ]
+        indexes = [models.Index(fields=["dispatched_at", "id"])]
+
+    def __str__(self):
+        return f"{self.event_type} {self.key}"
+
+
+class StockReservation(models.Model):
+    """
+    Time-limited hold of cart quantity against Product.stock_qty, one row
+    per (cart, SKU). Available stock = stock_qty - active holds of other
+    carts. See sales.reservations.
+    """
+    holder = models.CharField(max_length=64)  # session key of the cart
+    sku = models.CharField(max_length=64)
+    qty = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["holder", "sku"], name="reservation_holder_sku_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["sku", "expires_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.sku} x{self.qty} for {self.holder}"
+
+
+class SalesRollup(models.Model):
+    """
+    Sales per local day x SKU x sale status, kept up to date incrementally
+    by sales.rollups as sales are placed and change status. Rebuild with
+    `manage.py rebuild_rollups`.
+    """
+    date = models.DateField()
+    sku = models.CharField(max_length=64)
+    status = models.CharField(max_length=12, choices=Sale.Status.choices)
+    qty = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "sku", "status"], name="rollup_date_sku_status_uniq"),
+        ]
+        indexes = [models.Index(fields=["sku", "date"])]
+
+    def __str__(self):
+        return f"{self.date} {self.sku} {self.status}: {self.qty}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an Idempotency-Key, replayed to retries
+    of the same request until expires_at. See sales.idempotency.
+    """
+    class Status(models.TextChoices):
+        IN_PROGRESS = "IN_PROGRESS", "In progress"
+        DONE = "DONE", "Done"
+
+    scope = models.CharField(max_length=40)   # endpoint the key was used on
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status = models.CharField(max_length=12, choices=Status.choices, default=Status.IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_headers = models.JSONField(default=dict, blank=True)
+    response_body = models.BinaryField(blank=True, default=b"")
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_uniq"),
+        ]
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status})"
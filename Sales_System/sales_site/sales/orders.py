@@ -0,0 +1,204 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+from rest_framework import serializers
+
+from .catalog import bump_catalog_version_on_commit
+from .models import Customer, Product, Sale, SaleItem
+from .outbox import record_sales_committed
+from .rollups import record_sales
+from .serializers import SaleItemSerializer
+
+log = logging.getLogger(__name__)
+
+
+class BatchOrderSerializer(serializers.Serializer):
+    """One order of a batch; the customer is checked in bulk afterwards."""
+    customer = serializers.IntegerField()
+    items = SaleItemSerializer(many=True)
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class UnknownSku(Exception):
+    def __init__(self, skus):
+        super().__init__(f"unknown sku: {', '.join(skus)}")
+        self.skus = skus
+
+
+def decrement_stock(items):
+    """
+    Take the quantities of `items` (objects with .sku and .qty, summed per
+    SKU) off Product.stock_qty in one conditional UPDATE. The
+    stock_qty >= qty guard never lets stock go negative: returns False if
+    any SKU was short (or isn't a product, see unknown_skus), and the
+    caller must then roll back its transaction, as rows that did have
+    enough were decremented. Bumps the catalog version once the
+    transaction commits.
+    """
+    qty_by_sku = {}
+    for item in items:
+        qty_by_sku[item.sku] = qty_by_sku.get(item.sku, 0) + item.qty
+    if not qty_by_sku:
+        return True
+    guard = Q()
+    decrement = []
+    for sku, qty in qty_by_sku.items():
+        guard |= Q(sku=sku, stock_qty__gte=qty)
+        decrement.append(When(sku=sku, then=F("stock_qty") - qty))
+    updated = Product.objects.filter(guard).update(
+        stock_qty=Case(*decrement, default=F("stock_qty"), output_field=PositiveIntegerField()),
+        updated_at=timezone.now(),  # .update() skips auto_now; Inventory push relies on it
+    )
+    if updated:
+        bump_catalog_version_on_commit()  # dropped with the rest on rollback
+    return updated == len(qty_by_sku)
+
+
+def unknown_skus(items):
+    """Sorted SKUs of `items` with no Product row; for telling why decrement_stock failed."""
+    skus = {item.sku for item in items}
+    return sorted(skus - set(Product.objects.filter(sku__in=skus).values_list("sku", flat=True)))
+
+
+def _group_size():
+    return int(getattr(settings, "CHECKOUT_BATCH_GROUP_SIZE", 100))
+
+
+def _create_group(orders):
+    """
+    Insert [(index, validated_order), ...] with one bulk INSERT for the
+    sales and one for their items, take their stock off Product, then
+    queue the outbox events and rollups. Must run inside a transaction;
+    raises UnknownSku if an item isn't a product, InsufficientStock if
+    the group as a whole oversells. Returns [(index, sale), ...].
+    """
+    sale_nos = set()
+    created = []
+    for index, order in orders:
+        sale_no = Sale.new_sale_no()
+        while sale_no in sale_nos:
+            sale_no = Sale.new_sale_no()
+        sale_nos.add(sale_no)
+        # bulk_create skips SaleItem.save(), so precompute line totals here
+        items = [
+            SaleItem(**item, line_total=item["qty"] * item["unit_price"])
+            for item in order["items"]
+        ]
+        sale = Sale(
+            sale_no=sale_no,
+            customer_id=order["customer"],
+            status=Sale.Status.NEW,
+            total_amount=sum((i.line_total for i in items), Decimal("0")),
+        )
+        created.append((index, sale, items))
+
+    Sale.objects.bulk_create([sale for _, sale, _ in created])
+    if any(sale.pk is None for _, sale, _ in created):
+        # MySQL doesn't return ids from bulk inserts; sale_no is unique
+        ids = dict(Sale.objects.filter(sale_no__in=sale_nos).values_list("sale_no", "sale_id"))
+        for _, sale, _ in created:
+            sale.pk = ids[sale.sale_no]
+
+    lines = []
+    for _, sale, items in created:
+        for item in items:
+            item.sale = sale
+        lines.extend(items)
+    SaleItem.objects.bulk_create(lines)
+    if not decrement_stock(lines):
+        unknown = unknown_skus(lines)
+        if unknown:
+            raise UnknownSku(unknown)
+        raise InsufficientStock("insufficient stock")
+
+    pairs = [(sale, items) for _, sale, items in created]
+    record_sales_committed(pairs)
+    record_sales(pairs)
+    return [(index, sale) for index, sale, _ in created]
+
+
+def create_sales_bulk(orders, group_size=None):
+    """
+    Validate and create many checkout orders at once.
+
+    orders: list of {"customer": <id>, "items": [...]} as accepted by
+            /checkout-json/. Every sale is created with status NEW.
+
+    Valid orders are committed in transactions of `group_size`
+    (CHECKOUT_BATCH_GROUP_SIZE); if a group fails (a database error, an
+    unknown SKU, or not enough stock for all of it) it is retried one order per
+    transaction, so a bad order only fails itself. Returns one result
+    per input order, in order:
+
+        {"index", "ok": True, "sale_id", "sale_no", "total_amount"}
+        {"index", "ok": False, "errors": {...}}
+    """
+    group_size = group_size or _group_size()
+    results = [None] * len(orders)
+
+    valid = []
+    for index, order in enumerate(orders):
+        ser = BatchOrderSerializer(data=order)
+        if ser.is_valid():
+            valid.append((index, ser.validated_data))
+        else:
+            results[index] = {"index": index, "ok": False, "errors": ser.errors}
+
+    known = set(
+        Customer.objects.filter(pk__in={o["customer"] for _, o in valid})
+        .values_list("pk", flat=True)
+    )
+    ready = []
+    for index, order in valid:
+        if order["customer"] in known:
+            ready.append((index, order))
+        else:
+            results[index] = {
+                "index": index,
+                "ok": False,
+                "errors": {"customer": [f'Invalid pk "{order["customer"]}" - object does not exist.']},
+            }
+
+    for start in range(0, len(ready), group_size):
+        group = ready[start:start + group_size]
+        try:
+            with transaction.atomic():
+                created = _create_group(group)
+        except (DatabaseError, InsufficientStock, UnknownSku):
+            created = []
+            for entry in group:
+                try:
+                    with transaction.atomic():
+                        created += _create_group([entry])
+                except InsufficientStock:
+                    results[entry[0]] = {"index": entry[0], "ok": False, "errors": {"items": ["Insufficient stock."]}}
+                except UnknownSku as e:
+                    results[entry[0]] = {
+                        "index": entry[0],
+                        "ok": False,
+                        "errors": {"items": [f"Unknown SKU: {sku}" for sku in e.skus]},
+                    }
+                except DatabaseError:
+                    # the driver's message can carry SQL and schema details
+                    log.exception("batch checkout: order %s failed", entry[0])
+                    results[entry[0]] = {
+                        "index": entry[0],
+                        "ok": False,
+                        "errors": {"non_field_errors": ["Could not save this order."]},
+                    }
+        for index, sale in created:
+            results[index] = {
+                "index": index,
+                "ok": True,
+                "sale_id": sale.pk,
+                "sale_no": sale.sale_no,
+                "total_amount": str(sale.total_amount),
+            }
+    return results
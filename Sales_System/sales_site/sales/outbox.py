@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .inventory_client import InventoryUnavailable, get_client
+from .models import OutboxEvent
+
+log = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return int(getattr(settings, "OUTBOX_BATCH_SIZE", 100))
+
+
+def _sale_committed_event(sale, items):
+    qty_by_sku = {}
+    for item in items:
+        qty_by_sku[item.sku] = qty_by_sku.get(item.sku, 0) + item.qty
+    return OutboxEvent(
+        event_type=OutboxEvent.Type.SALE_COMMITTED,
+        key=sale.sale_no,
+        payload={
+            "saleId": sale.sale_no,
+            "items": [{"sku": sku, "qty": qty} for sku, qty in qty_by_sku.items()],
+        },
+    )
+
+
+def record_sale_committed(sale, items):
+    """
+    Queue a sale-committed event for Inventory. Must be called inside the
+    transaction that creates the sale; `items` is an iterable of objects
+    with .sku and .qty (SaleItem instances). Quantities are summed per SKU.
+    """
+    record_sales_committed([(sale, items)])
+
+
+def record_sales_committed(sales_with_items):
+    """record_sale_committed for many (sale, items) pairs in one INSERT."""
+    OutboxEvent.objects.bulk_create(
+        [_sale_committed_event(sale, items) for sale, items in sales_with_items]
+    )
+    if getattr(settings, "OUTBOX_AUTODISPATCH", True):
+        transaction.on_commit(kick)
+
+
+def _max_attempts():
+    return int(getattr(settings, "OUTBOX_MAX_ATTEMPTS", 20))
+
+
+def _claim_ttl():
+    return timedelta(seconds=getattr(settings, "OUTBOX_CLAIM_TTL", 300))
+
+
+def _claim(batch_size):
+    """
+    Lease up to `batch_size` undelivered events for OUTBOX_CLAIM_TTL in a
+    short transaction. SELECT ... FOR UPDATE SKIP LOCKED keeps concurrent
+    dispatchers (the in-process thread of every worker, dispatch_outbox)
+    from claiming the same rows; the lease keeps them off until this one
+    reports back, or gives up by crashing and letting it run out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(dispatched_at__isnull=True, attempts__lt=_max_attempts())
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(claimed_until=now + _claim_ttl())
+    return events
+
+
+def _failed(events, error):
+    """Count a failed attempt for `events` and release them; logs the ones given up on."""
+    OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+        attempts=F("attempts") + 1, last_error=str(error)[:1000], claimed_until=None
+    )
+    dead = [e for e in events if e.attempts + 1 >= _max_attempts()]
+    if dead:
+        metrics.observe_outbox_dead(len(dead))
+        log.error(
+            "outbox: giving up on %d event(s) after %d attempts, Inventory stock is not decremented: %s (%s)",
+            len(dead), _max_attempts(), ", ".join(e.key for e in dead), str(error)[:200],
+        )
+
+
+def dispatch_pending(batch_size=None):
+    """
+    Deliver up to `batch_size` undelivered events to Inventory in one
+    POST /events/sale-committed/batch. Returns the number of events
+    delivered.
+
+    The batch is claimed in one short transaction and the outcome written
+    in another; the POST itself (with its retries) runs outside any, so a
+    slow Inventory holds no locks. Inventory applies each saleId at most
+    once, for redelivery after a lease ran out. Events that fail
+    OUTBOX_MAX_ATTEMPTS times stay undelivered: see outbox_stats().
+    """
+    events = _claim(batch_size or _batch_size())
+    if not events:
+        return 0
+
+    try:
+        resp = get_client().post(
+            "/events/sale-committed/batch",
+            json={"events": [e.payload for e in events]},
+            idempotent=True,
+        )
+        resp.raise_for_status()
+        results = resp.json().get("results", [])
+    except InventoryUnavailable:
+        # nothing was sent; don't burn an attempt
+        OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(claimed_until=None)
+        raise
+    except Exception as e:
+        with transaction.atomic():
+            _failed(events, e)
+        raise
+
+    by_key = {e.key: e for e in events}
+    delivered = []
+    with transaction.atomic():
+        for r in results:
+            ev = by_key.pop(str(r.get("saleId")), None)
+            if ev is None:
+                continue
+            if r.get("ok"):
+                delivered.append(ev.pk)
+            else:
+                _failed([ev], r.get("error") or "rejected")
+        if delivered:
+            OutboxEvent.objects.filter(pk__in=delivered).update(
+                dispatched_at=timezone.now(), attempts=F("attempts") + 1, last_error="", claimed_until=None
+            )
+        if by_key:  # not in the response; try again on the next run
+            OutboxEvent.objects.filter(pk__in=[e.pk for e in by_key.values()]).update(claimed_until=None)
+    return len(delivered)
+
+
+def outbox_stats():
+    """Undelivered events: still being retried, and given up on after OUTBOX_MAX_ATTEMPTS."""
+    undelivered = OutboxEvent.objects.filter(dispatched_at__isnull=True)
+    return {
+        "pending": undelivered.filter(attempts__lt=_max_attempts()).count(),
+        "dead": undelivered.filter(attempts__gte=_max_attempts()).count(),
+    }
+
+
+def drain():
+    """Dispatch until the outbox is empty (or Inventory stops accepting)."""
+    batch_size = _batch_size()
+    total = 0
+    while True:
+        n = dispatch_pending(batch_size)
+        total += n
+        if n < batch_size:
+            return total
+
+
+# --- in-process dispatcher -------------------------------------------------
+
+_wakeup = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _loop():
+    linger = getattr(settings, "OUTBOX_LINGER", 0.25)
+    idle = getattr(settings, "OUTBOX_POLL_INTERVAL", 30)
+    while True:
+        _wakeup.wait(timeout=idle)
+        _wakeup.clear()
+        # let a burst of checkouts pile up so they go out as one batch
+        time.sleep(linger)
+        try:
+            drain()
+        except InventoryUnavailable:
+            pass  # breaker is open; retry on the next kick/poll
+        except Exception:
+            log.exception("outbox dispatch failed")
+        finally:
+            close_old_connections()
+
+
+def kick():
+    """Wake the background dispatcher, starting it on first use."""
+    global _thread
+    if _thread is None:
+        with _thread_lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_loop, name="outbox-dispatcher", daemon=True)
+                _thread.start()
+    _wakeup.set()
@@ -0,0 +1,219 @@
+import csv
+import gzip
+import io
+import json
+import sys
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .api_inventory import CENT, _apply_batch, _normalize, _Skip, _sync_batch_size, _to_decimal
+from .catalog import bump_catalog_version
+from .models import Product
+
+EXPORT_FIELDS = ("sku", "name", "unit", "price", "stock_qty", "is_active", "updated_at")
+FORMATS = ("csv", "ndjson")
+# Problem rows listed in an import report (all of them are counted)
+_MAX_LISTED = 50
+_FALSE = {"0", "false", "no", "n", "f", "inactive"}
+
+
+def guess_format(path):
+    """csv or ndjson from a file name like products.csv.gz; None if unknown."""
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return None
+
+
+def open_text(path, mode):
+    """
+    Text stream context manager for a path ("-" is stdin/stdout, left
+    open), gzip-compressed for *.gz.
+    """
+    if path == "-":
+        if mode == "r":
+            return nullcontext(io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline=""))
+        return nullcontext(sys.stdout)
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _as_bool(val):
+    if isinstance(val, bool):
+        return val
+    return str(val if val is not None else "").strip().lower() not in _FALSE
+
+
+def _number(row, key):
+    """row[key] as a Decimal (None if empty); ValueError if it isn't a number."""
+    val = row.get(key)
+    if val is None or val == "":
+        return None
+    try:
+        num = Decimal(str(val).strip())
+    except InvalidOperation:
+        num = None
+    if num is None or not num.is_finite():
+        raise ValueError(f"{key} is not a number: {val!r}")
+    return num
+
+
+def normalize_row(row):
+    """
+    (sku, fields) for one imported row, by the same rules as an Inventory
+    pull: SKU stripped and upper-cased, empty name skipped, unit defaults
+    to pcs, price rounded to cents. Accepts Sales columns (price,
+    stock_qty, is_active) or an Inventory export (listPrice, currentQty,
+    status). Unlike a pull, a price or quantity that isn't a number, or
+    is negative, raises ValueError instead of becoming 0.
+    """
+    inventory = "listPrice" in row or "currentQty" in row
+    price_key, qty_key = ("listPrice", "currentQty") if inventory else ("price", "stock_qty")
+    for key in (price_key, qty_key):
+        num = _number(row, key)
+        if num is not None and num < 0:
+            raise ValueError(f"{key} is negative: {row[key]!r}")
+    if inventory:
+        return _normalize(row)
+    return _normalize({
+        "sku": row.get("sku"),
+        "name": row.get("name"),
+        "unit": row.get("unit"),
+        "listPrice": _to_decimal(row.get("price")).quantize(CENT),
+        "currentQty": int(_to_decimal(row.get("stock_qty"))),
+        "status": "ACTIVE" if _as_bool(row.get("is_active", True)) else "INACTIVE",
+    })
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line number, dict) from a CSV (with header) or NDJSON stream.
+    An NDJSON line that isn't valid JSON yields its ValueError instead of
+    a dict, so import_products can report it and go on.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield line_no, row
+
+
+def import_products(rows, batch_size=None, progress=None):
+    """
+    Upsert (line number, row) pairs into Product in batches of
+    `batch_size` (default settings.INVENTORY_SYNC_BATCH_SIZE), with the
+    same diff + bulk_create/bulk_update as an Inventory pull. Only counts
+    are kept, so memory stays flat however long the file is. A SKU
+    repeated within a batch keeps its last row; a row that isn't a dict
+    (bad JSON, a JSON array) is counted as an error. A batch the database
+    rejects is retried row by row, so one bad row doesn't take the rest
+    of its batch down with it.
+    """
+    batch_size = batch_size or _sync_batch_size()
+    result = {"read": 0, "created": 0, "updated": 0, "unchanged": 0,
+              "skipped": 0, "errors": 0, "problems": [], "batches": 0}
+
+    def problem(kind, line_no, sku, message, rows=1):
+        result[kind] += rows
+        if len(result["problems"]) < _MAX_LISTED:
+            result["problems"].append({"line": line_no, "sku": sku, "kind": kind, "message": message})
+
+    def flush(batch):
+        applied = {"created": [], "updated": [], "unchanged": 0}
+        try:
+            _apply_batch(batch, applied)
+        except Exception:
+            # the batch rolled back: redo it row by row so only bad rows fail
+            applied = {"created": [], "updated": [], "unchanged": 0}
+            for sku, fields in batch.items():
+                try:
+                    _apply_batch({sku: fields}, applied)
+                except Exception as e:
+                    problem("errors", lines[sku], sku, str(e))
+        result["created"] += len(applied["created"])
+        result["updated"] += len(applied["updated"])
+        result["unchanged"] += applied["unchanged"]
+        result["batches"] += 1
+        if progress:
+            progress({k: v for k, v in result.items() if k != "problems"})
+
+    batch, lines = {}, {}  # sku -> fields / line number
+    try:
+        for line_no, row in rows:
+            result["read"] += 1
+            if not isinstance(row, dict):
+                message = f"invalid JSON: {row}" if isinstance(row, ValueError) else "not a JSON object"
+                problem("errors", line_no, None, message)
+                continue
+            try:
+                sku, fields = normalize_row(row)
+            except _Skip as skip:
+                problem("skipped", line_no, row.get("sku"), str(skip))
+                continue
+            except Exception as e:
+                problem("errors", line_no, row.get("sku"), str(e))
+                continue
+            batch.pop(sku, None)
+            batch[sku], lines[sku] = fields, line_no
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch, lines = {}, {}
+        if batch:
+            flush(batch)
+    finally:
+        # batches already written stay, even if reading the stream failed
+        if result["created"] or result["updated"]:
+            bump_catalog_version()
+    return result
+
+
+def iter_products(chunk_size=5000):
+    """
+    All products as dicts of EXPORT_FIELDS, in id order. Reads keyset
+    chunks (WHERE id > last) rather than one big cursor: MySQL's driver
+    buffers a whole result set client-side, a chunk at a time it can't.
+    """
+    qs = Product.objects.order_by("id").values_list("id", *EXPORT_FIELDS)
+    last_id = 0
+    while True:
+        chunk = list(qs.filter(id__gt=last_id)[:chunk_size])
+        for row in chunk:
+            yield dict(zip(EXPORT_FIELDS, row[1:]))
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def export_products(stream, fmt, chunk_size=5000):
+    """Write every product to `stream` as CSV (with header) or NDJSON; returns the count."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_FIELDS)
+        for row in iter_products(chunk_size):
+            writer.writerow([
+                row["sku"], row["name"], row["unit"], row["price"], row["stock_qty"],
+                int(row["is_active"]), row["updated_at"].isoformat(),
+            ])
+            count += 1
+        return count
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for row in iter_products(chunk_size):
+        stream.write(encoder.encode(row))
+        stream.write("\n")
+        count += 1
+    return count
@@ -0,0 +1,164 @@
+import hashlib
+
+from django.conf import settings
+
+from .api_inventory import _normalize, _Skip, summarize, upsert_into_sales
+from .inventory_client import get_client
+from .models import Product
+
+# Fields compared between the systems, in Sales terms
+RECONCILE_FIELDS = ("price", "stock_qty", "is_active")
+_MASK = (1 << 64) - 1
+# Bucket ids per drill-down request
+_ROWS_PER_REQUEST = 64
+# Differences listed in a report (all of them are counted)
+_MAX_LISTED = 200
+
+
+def bucket_count():
+    return int(getattr(settings, "RECONCILE_BUCKETS", 256))
+
+
+def bucket_of(sku, buckets):
+    """Bucket of a normalized SKU; Inventory_System computes the same."""
+    return int(hashlib.md5(sku.encode("utf-8")).hexdigest()[:8], 16) % buckets
+
+
+def row_hash(sku, fields):
+    """
+    64-bit hash of "sku|price|qty|active" (price with 2 decimals, active
+    1/0). Bucket digests add these up, so neither side has to sort.
+    """
+    line = f"{sku}|{fields['price']:.2f}|{fields['stock_qty']}|{int(fields['is_active'])}"
+    return int(hashlib.md5(line.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def bucket_digests(rows, buckets):
+    """
+    rows: iterable of (sku, fields). Returns one "<count>:<sum hex>" digest
+    per bucket.
+    """
+    counts = [0] * buckets
+    sums = [0] * buckets
+    for sku, fields in rows:
+        b = bucket_of(sku, buckets)
+        counts[b] += 1
+        sums[b] = (sums[b] + row_hash(sku, fields)) & _MASK
+    return [f"{c}:{s:016x}" for c, s in zip(counts, sums)]
+
+
+def local_rows(bucket_ids=None, buckets=None, stored=None):
+    """
+    Sales products as (sku, fields), optionally only those in `bucket_ids`.
+    SKUs are normalized like Inventory's (_normalize: stripped, upper-case),
+    so a product saved as " abc-1" lands in the same bucket as ABC-1; pass
+    a dict as `stored` to collect {normalized sku: sku as stored} for those.
+    """
+    wanted = set(bucket_ids) if bucket_ids is not None else None
+    qs = Product.objects.order_by().values_list("sku", *RECONCILE_FIELDS)
+    for raw_sku, price, stock_qty, is_active in qs.iterator(chunk_size=5000):
+        sku = raw_sku.strip().upper()
+        if wanted is not None and bucket_of(sku, buckets) not in wanted:
+            continue
+        if stored is not None and sku != raw_sku:
+            stored[sku] = raw_sku
+        yield sku, {"price": price, "stock_qty": stock_qty, "is_active": is_active}
+
+
+def _remote_digests(client, buckets):
+    resp = client.get("/products/reconcile/buckets", params={"buckets": buckets})
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("buckets") != buckets or len(data.get("digests", [])) != buckets:
+        raise RuntimeError(f"Inventory answered {data.get('buckets')} buckets, expected {buckets}")
+    return data["digests"], len(resp.content)
+
+
+def _remote_rows(client, bucket_ids, buckets):
+    """Inventory products in the given buckets (full product dicts)."""
+    rows, size = [], 0
+    for i in range(0, len(bucket_ids), _ROWS_PER_REQUEST):
+        chunk = bucket_ids[i:i + _ROWS_PER_REQUEST]
+        resp = client.get(
+            "/products/reconcile/rows",
+            params={"buckets": buckets, "ids": ",".join(map(str, chunk))},
+        )
+        resp.raise_for_status()
+        rows.extend(resp.json()["rows"])
+        size += len(resp.content)
+    return rows, size
+
+
+def reconcile(buckets=None, fix=False):
+    """
+    Compare Product (sku, price, stock_qty, is_active) with Inventory_System
+    without transferring the catalog:
+
+    1. fetch Inventory's per-bucket digests and compare with ours
+    2. fetch only the products in mismatching buckets and diff them by SKU
+
+    With fix=True the differing rows Inventory has are upserted into Sales
+    (Inventory is the source of truth for these fields), renaming a local
+    SKU stored un-normalized to Inventory's form first. SKUs only Sales
+    has are reported, not deleted.
+    """
+    buckets = buckets or bucket_count()
+    client = get_client()
+
+    remote, transferred = _remote_digests(client, buckets)
+    local = bucket_digests(local_rows(), buckets)
+    mismatched = [b for b in range(buckets) if local[b] != remote[b]]
+    result = {
+        "buckets": buckets,
+        "mismatched_buckets": len(mismatched),
+        "missing_in_sales": 0,
+        "missing_in_inventory": 0,
+        "different": 0,
+        "differences": [],
+        "bytes_transferred": transferred,
+    }
+    if not mismatched:
+        return result
+
+    raw_rows, size = _remote_rows(client, mismatched, buckets)
+    result["bytes_transferred"] += size
+    theirs, raw_by_sku = {}, {}
+    for p in raw_rows:
+        try:
+            sku, fields = _normalize(p)
+        except _Skip:
+            continue
+        theirs[sku] = {f: fields[f] for f in RECONCILE_FIELDS}
+        raw_by_sku[sku] = p
+    stored = {}
+    ours = dict(local_rows(mismatched, buckets, stored))
+
+    def note(sku, kind, **extra):
+        result[kind] += 1
+        if len(result["differences"]) < _MAX_LISTED:
+            result["differences"].append({"sku": sku, "kind": kind, **extra})
+
+    to_fix = []
+    for sku in sorted(ours.keys() | theirs.keys()):
+        mine, other = ours.get(sku), theirs.get(sku)
+        if mine is None:
+            note(sku, "missing_in_sales")
+            to_fix.append(raw_by_sku[sku])
+        elif other is None:
+            note(sku, "missing_in_inventory")
+        elif mine != other:
+            note(sku, "different", fields={
+                f: {"sales": mine[f], "inventory": other[f]}
+                for f in RECONCILE_FIELDS if mine[f] != other[f]
+            })
+            to_fix.append(raw_by_sku[sku])
+
+    if fix and to_fix:
+        # store the SKUs being fixed the way Inventory has them, so the
+        # upsert updates that row instead of adding a second one
+        for p in to_fix:
+            sku = str(p["sku"]).strip().upper()
+            if sku in stored and not Product.objects.filter(sku=sku).exists():
+                Product.objects.filter(sku=stored[sku]).update(sku=sku)
+        result["fixed"] = summarize(upsert_into_sales(to_fix))
+    return result
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, "RESERVATION_TTL", 900))
+
+
+def _max_units():
+    return int(getattr(settings, "RESERVATION_MAX_UNITS", 50))
+
+
+def held_by_others(skus, holder=None):
+    """{sku: qty} held by unexpired reservations of carts other than `holder`."""
+    qs = StockReservation.objects.filter(sku__in=list(skus), expires_at__gt=timezone.now())
+    if holder:
+        qs = qs.exclude(holder=holder)
+    return {r["sku"]: r["held"] for r in qs.values("sku").annotate(held=Sum("qty"))}
+
+
+def active_holds(holder, skus=None):
+    """{sku: qty} of this cart's unexpired reservations."""
+    qs = StockReservation.objects.filter(holder=holder, expires_at__gt=timezone.now())
+    if skus is not None:
+        qs = qs.filter(sku__in=list(skus))
+    return dict(qs.values_list("sku", "qty"))
+
+
+def hold_cart(holder, cart):
+    """
+    Reserve cart {sku: {"qty": n}} for `holder` until RESERVATION_TTL from
+    now, replacing its earlier holds. Returns {sku: qty held}.
+
+    The cart's Product rows are locked (in SKU order, like place_order)
+    while other carts' holds are summed, so two carts can't both hold the
+    last units. A line is held only as far as unreserved stock goes, and a
+    cart of more than RESERVATION_MAX_UNITS units holds nothing: it can
+    still check out, on place_order's locking path.
+    """
+    with transaction.atomic():
+        held = {}
+        if cart and sum(line["qty"] for line in cart.values()) <= _max_units():
+            stock = dict(
+                Product.objects.select_for_update()
+                .filter(sku__in=sorted(cart), is_active=True)
+                .order_by("sku")
+                .values_list("sku", "stock_qty")
+            )
+            others = held_by_others(stock, holder)
+            for sku, qty in stock.items():
+                qty = min(cart[sku]["qty"], qty - others.get(sku, 0))
+                if qty > 0:
+                    held[sku] = qty
+
+        StockReservation.objects.filter(holder=holder).exclude(sku__in=list(held)).delete()
+        if held:
+            expires_at = timezone.now() + _ttl()
+            rows = [
+                StockReservation(holder=holder, sku=sku, qty=qty, expires_at=expires_at)
+                for sku, qty in held.items()
+            ]
+            kwargs = {"update_conflicts": True, "update_fields": ["qty", "expires_at"]}
+            if connection.features.supports_update_conflicts_with_target:
+                kwargs["unique_fields"] = ["holder", "sku"]  # MySQL infers it from the unique key
+            StockReservation.objects.bulk_create(rows, **kwargs)
+    return held
+
+
+def release(holder):
+    StockReservation.objects.filter(holder=holder).delete()
+
+
+def sweep_expired():
+    """Delete every expired reservation in one statement; returns the count."""
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,131 @@
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SaleItem, SalesRollup
+
+
+def _per_sku(items):
+    """{sku: (qty, revenue, orders=1)} for one sale's lines."""
+    out = {}
+    for item in items:
+        qty, revenue, _ = out.get(item.sku, (0, Decimal("0"), 1))
+        out[item.sku] = (qty + item.qty, revenue + item.line_total, 1)
+    return out
+
+
+def _apply(day, status, per_sku, sign):
+    """
+    Add sign * (qty, revenue, orders) to the (day, sku, status) rows: one
+    locking SELECT for the rows that exist, then bulk update / bulk create.
+    A concurrent insert of the same new row is retried once.
+    """
+    if not per_sku:
+        return
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                existing = list(
+                    SalesRollup.objects.select_for_update()
+                    .filter(date=day, status=status, sku__in=list(per_sku))
+                )
+                seen = set()
+                for row in existing:
+                    qty, revenue, orders = per_sku[row.sku]
+                    row.qty += sign * qty
+                    row.revenue += sign * revenue
+                    row.order_count += sign * orders
+                    seen.add(row.sku)
+                missing = [
+                    SalesRollup(
+                        date=day, sku=sku, status=status,
+                        qty=sign * qty, revenue=sign * revenue, order_count=sign * orders,
+                    )
+                    for sku, (qty, revenue, orders) in per_sku.items()
+                    if sku not in seen
+                ]
+                if existing:
+                    SalesRollup.objects.bulk_update(existing, ["qty", "revenue", "order_count"])
+                if missing:
+                    SalesRollup.objects.bulk_create(missing)
+            return
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def _day(sale):
+    return timezone.localdate(sale.created_at)
+
+
+def record_sale(sale, items):
+    """Count a newly created sale (call in the transaction that creates it)."""
+    _apply(_day(sale), sale.status, _per_sku(items), +1)
+
+
+def record_sales(sales_with_items):
+    """
+    record_sale for many new sales at once: lines are merged per
+    (day, status) so each bucket is written once.
+    """
+    buckets = {}  # (day, status) -> {sku: (qty, revenue, orders)}
+    for sale, items in sales_with_items:
+        merged = buckets.setdefault((_day(sale), sale.status), {})
+        for sku, (qty, revenue, orders) in _per_sku(items).items():
+            q, r, o = merged.get(sku, (0, Decimal("0"), 0))
+            merged[sku] = (q + qty, r + revenue, o + orders)
+    for (day, status), per_sku in buckets.items():
+        _apply(day, status, per_sku, +1)
+
+
+def forget_sale(sale, status=None):
+    """Remove a sale from the rollup under `status` (default: its current one)."""
+    items = sale.items.only("sku", "qty", "line_total")
+    _apply(_day(sale), status or sale.status, _per_sku(items), -1)
+
+
+def move_sale(sale, old_status, new_status):
+    """Move a sale's lines from one status bucket to another (e.g. NEW -> PAID)."""
+    per_sku = _per_sku(sale.items.only("sku", "qty", "line_total"))
+    day = _day(sale)
+    with transaction.atomic():
+        _apply(day, old_status, per_sku, -1)
+        _apply(day, new_status, per_sku, +1)
+
+
+def rebuild(since=None, batch_size=1000):
+    """
+    Recompute rollups from SaleItem/Sale (all of them, or from local date
+    `since` on) by streaming the lines once. Returns the rows written.
+    """
+    lines = SaleItem.objects.order_by("sale_id").values_list(
+        "sale_id", "sku", "qty", "line_total", "sale__created_at", "sale__status"
+    )
+    rows = SalesRollup.objects.all()
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        lines = lines.filter(sale__created_at__gte=start)
+        rows = rows.filter(date__gte=since)
+
+    agg = {}  # (date, sku, status) -> [qty, revenue, orders, last sale_id]
+    for sale_id, sku, qty, line_total, created_at, status in lines.iterator(chunk_size=5000):
+        key = (timezone.localdate(created_at), sku, status)
+        a = agg.setdefault(key, [0, Decimal("0"), 0, None])
+        a[0] += qty
+        a[1] += line_total
+        if a[3] != sale_id:  # lines are ordered by sale, count each sale once
+            a[2] += 1
+            a[3] = sale_id
+
+    with transaction.atomic():
+        rows.delete()
+        SalesRollup.objects.bulk_create(
+            (
+                SalesRollup(date=d, sku=sku, status=st, qty=q, revenue=r, order_count=n)
+                for (d, sku, st), (q, r, n, _) in agg.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(agg)
@@ -1,5 +1,8 @@
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
-from .models import Customer, Sale, SaleItem, Product
+from .models import Customer, Sale, SaleItem, Product, SalesRollup
+from .rollups import record_sale
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,6 +13,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = SaleItem
         exclude = ("sale_item_id",)
+        read_only_fields = ("sale",)  # set by SaleSerializer.create
 
 class SaleSerializer(serializers.ModelSerializer):
     items = SaleItemSerializer(many=True)
@@ -19,12 +23,22 @@ class SaleSerializer(serializers.ModelSerializer):
         fields = ("sale_id","sale_no","customer","status","total_amount","created_at","paid_at","items")
         read_only_fields = ("sale_no","total_amount","created_at","paid_at")
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
-        sale = Sale.objects.create(**validated_data)
-        for item in items_data:
-            SaleItem.objects.create(sale=sale, **item)
-        sale.save()  # recompute total
+        # bulk_create skips SaleItem.save(), so precompute line totals here
+        items = [
+            SaleItem(**item, line_total=item["qty"] * item["unit_price"])
+            for item in items_data
+        ]
+        sale = Sale.objects.create(
+            total_amount=sum((i.line_total for i in items), Decimal("0")),
+            **validated_data,
+        )
+        for item in items:
+            item.sale = sale
+        SaleItem.objects.bulk_create(items)
+        record_sale(sale, items)
         return sale
     
 class ProductSerializer(serializers.ModelSerializer):
@@ -40,4 +54,10 @@ class ProductSerializer(serializers.ModelSerializer):
             "is_active",
             "updated_at",
         ]
-        read_only_fields = ["id", "updated_at"]
\ No newline at end of file
+        read_only_fields = ["id", "updated_at"]
+
+
+class SalesRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SalesRollup
+        fields = ("date", "sku", "status", "qty", "revenue", "order_count")
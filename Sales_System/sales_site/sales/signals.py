@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version_on_commit
+from .models import Product, Sale
+from .rollups import forget_sale, move_sale
+
+
+# Covers admin edits and ProductViewSet; bulk paths (Inventory sync,
+# checkout stock UPDATE) bump the catalog version themselves.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    bump_catalog_version_on_commit()
+
+
+# Rollups: creation and admin item edits are recorded explicitly once the
+# items exist (rollups.record_sale, SaleAdmin.save_related); status changes and deletes are caught here, in
+# the save's / delete's transaction. Sale.save() tracks the stored
+# status in _original_status (missing on instances never loaded or saved).
+# QuerySet.update() bypasses this -- run rebuild_rollups after bulk edits.
+@receiver(post_save, sender=Sale)
+def sale_status_changed(sender, instance, created, **kwargs):
+    original = getattr(instance, "_original_status", None)
+    if not created and original is not None and original != instance.status:
+        move_sale(instance, original, instance.status)
+
+
+@receiver(pre_delete, sender=Sale)
+def sale_deleted(sender, instance, **kwargs):
+    forget_sale(instance, getattr(instance, "_original_status", None))
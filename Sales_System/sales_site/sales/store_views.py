@@ -1,30 +1,65 @@
+import uuid
+
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.db import transaction
 from .models import Customer, Sale, SaleItem, Product
+from .orders import decrement_stock
+from .outbox import record_sale_committed
+from .catalog import get_active_catalog
+from .cart import revalidate_cart
+from .rollups import record_sale
+from .idempotency import idempotent
+from .reservations import active_holds, held_by_others, hold_cart, release
 
 
 def _cart(request):
     """
-    Cart shape in session:
-    {
-      "<sku>": {"name": str, "unit": str, "price": float, "qty": int}
-    }
+    Cart shape in session (compact): {"<sku>": qty}
+    Returned as {"<sku>": {"qty": int}}; name/unit/price are rehydrated
+    from Product by revalidate_cart wherever they're shown. Older sessions
+    that stored full lines ({"name", "unit", "price", "qty"}) still load.
     """
-    return request.session.get("cart", {})
+    cart = {}
+    for sku, line in request.session.get("cart", {}).items():
+        qty = line.get("qty", 0) if isinstance(line, dict) else line
+        cart[sku] = {"qty": int(qty)}
+    return cart
 
 
 def _save_cart(request, cart):
-    request.session["cart"] = cart
+    request.session["cart"] = {sku: line["qty"] for sku, line in cart.items()}
     request.session.modified = True
 
 
+def _holder(request, create=False):
+    """
+    Session key used as the cart's reservation holder. None for a session
+    not stored yet, unless `create` (only checkout_form, which reserves,
+    saves one: browsing an empty cart shouldn't write a session row).
+    """
+    if create and not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def _release(request):
+    holder = _holder(request)
+    if holder:
+        release(holder)
+
+
+def _revalidate(request, cart, desired=None):
+    """revalidate_cart against stock not reserved by other carts."""
+    return revalidate_cart(cart, desired, holder=_holder(request))
+
+
 def shop_home(request):
     """
     Storefront home – show active products from DB.
     """
-    products = Product.objects.filter(is_active=True).order_by("name")
+    products = get_active_catalog()["rows"]
     cart = _cart(request)
     total_items = sum(item["qty"] for item in cart.values())
     return render(request, "sales/shop_home.html", {
@@ -36,49 +71,40 @@ def shop_home(request):
 @require_POST
 def add_to_cart(request):
     """
-    Add a product to the cart. Uses DB product and validates stock.
+    Add a product to the cart. Revalidates the whole cart against the DB
+    and caps the line at available (unreserved) stock. Stock is only
+    reserved at checkout_form.
     """
     sku = request.POST.get("sku")
     try:
         qty = int(request.POST.get("qty", "1"))
     except ValueError:
         qty = 1
-
-    try:
-        p = Product.objects.get(sku=sku, is_active=True)
-    except Product.DoesNotExist:
+    if not sku:
         messages.error(request, "Product not found.")
         return redirect("shop_home")
 
-    if p.stock_qty <= 0:
-        messages.error(request, f"{p.name} is out of stock.")
-        return redirect("shop_home")
-
     cart = _cart(request)
-    current_qty = cart.get(sku, {}).get("qty", 0)
-    new_total = current_qty + max(qty, 1)
-
-    if new_total > p.stock_qty:
-        # cap at available stock
-        cart[sku] = {
-            "name": p.name,
-            "unit": p.unit,
-            "price": float(p.price),
-            "qty": p.stock_qty,
-        }
-        _save_cart(request, cart)
-        messages.warning(request, f"Only {p.stock_qty} × {p.name} available. Cart updated.")
-        return redirect("shop_home")
-
-    # ok to add
-    cart[sku] = {
-        "name": p.name,
-        "unit": p.unit,
-        "price": float(p.price),
-        "qty": new_total,
-    }
+    line = cart.get(sku, {})
+    cart[sku] = {**line, "qty": line.get("qty", 0) + max(qty, 1)}
+    cart, changes = _revalidate(request, cart)
     _save_cart(request, cart)
-    messages.success(request, f"Added {qty} × {p.name} to cart.")
+    _release(request)  # the cart changed; checkout_form holds it again
+
+    own = {c["kind"]: c for c in changes if c["sku"] == sku}
+    others = [c["message"] for c in changes if c["sku"] != sku]
+    if others:
+        messages.warning(request, " ".join(others))
+
+    if "unavailable" in own:
+        messages.error(request, "Product not found.")
+    elif "out_of_stock" in own:
+        messages.error(request, own["out_of_stock"]["message"])
+    elif "capped" in own:
+        item = cart[sku]
+        messages.warning(request, f"Only {item['qty']} × {item['name']} available. Cart updated.")
+    else:
+        messages.success(request, f"Added {qty} × {cart[sku]['name']} to cart.")
     return redirect("shop_home")
 
 
@@ -92,6 +118,7 @@ def remove_from_cart(request):
     if sku in cart:
         cart.pop(sku, None)
         _save_cart(request, cart)
+        _release(request)
         messages.success(request, "Item removed from cart.")
     else:
         messages.error(request, "Item not found in cart.")
@@ -100,9 +127,14 @@ def remove_from_cart(request):
 
 def view_cart(request):
     """
-    Render the cart with line totals and grand total.
+    Render the cart with line totals and grand total, using current
+    prices and stock (one query for the whole cart).
     """
-    cart = _cart(request)
+    cart, changes = _revalidate(request, _cart(request))
+    if changes:
+        _save_cart(request, cart)
+        messages.warning(request, " ".join(c["message"] for c in changes))
+
     items = []
     total = 0.0
     for sku, item in cart.items():
@@ -119,37 +151,18 @@ def update_cart(request):
     Caps quantities to available stock.
     """
     cart = _cart(request)
-    messages_list = []
-
-    for sku, item in list(cart.items()):
-        # read desired qty
+    desired = {}
+    for sku, item in cart.items():
         try:
-            new_qty = int(request.POST.get(f"qty_{sku}", item["qty"]))
+            desired[sku] = int(request.POST.get(f"qty_{sku}", item["qty"]))
         except ValueError:
-            new_qty = item["qty"]
-
-        if new_qty <= 0:
-            cart.pop(sku, None)
-            messages_list.append(f"Removed {item['name']}.")
-            continue
-
-        # stock check
-        try:
-            p = Product.objects.get(sku=sku, is_active=True)
-        except Product.DoesNotExist:
-            cart.pop(sku, None)
-            messages_list.append(f"{item['name']} is no longer available.")
-            continue
-
-        if new_qty > p.stock_qty:
-            item["qty"] = p.stock_qty
-            messages_list.append(f"Capped {p.name} to {p.stock_qty} (available).")
-        else:
-            item["qty"] = new_qty
+            desired[sku] = item["qty"]
 
+    cart, changes = _revalidate(request, cart, desired)
     _save_cart(request, cart)
-    if messages_list:
-        messages.warning(request, " ".join(messages_list))
+    _release(request)
+    if changes:
+        messages.warning(request, " ".join(c["message"] for c in changes))
     else:
         messages.success(request, "Cart updated.")
     return redirect("view_cart")
@@ -157,16 +170,26 @@ def update_cart(request):
 
 def checkout_form(request):
     """
-    Simple guest checkout form.
+    Simple guest checkout form. Sends the shopper back to the cart if
+    stock no longer covers it, otherwise reserves the cart's stock for
+    RESERVATION_TTL while the form is filled in.
     """
-    cart = _cart(request)
+    cart, changes = _revalidate(request, _cart(request))
+    if changes:
+        _save_cart(request, cart)
     if not cart:
         messages.error(request, "Your cart is empty.")
         return redirect("shop_home")
-    return render(request, "sales/checkout.html")
+    if changes:
+        messages.warning(request, " ".join(c["message"] for c in changes))
+        return redirect("view_cart")
+    hold_cart(_holder(request, create=True), cart)
+    # a fresh key per form render, so a resubmitted form places one order
+    return render(request, "sales/checkout.html", {"idempotency_key": uuid.uuid4().hex})
 
 
 @require_POST
+@idempotent("place_order")
 @transaction.atomic
 def place_order(request):
     """
@@ -200,42 +223,80 @@ def place_order(request):
         messages.error(request, "Your cart is empty.")
         return redirect("shop_home")
 
-    # Validate stock (lock rows to avoid races)
+    skus = sorted(cart)
+    holder = request.session.session_key
+    holds = active_holds(holder, skus) if holder else {}
+    reserved = all(holds.get(sku, 0) >= cart[sku]["qty"] for sku in skus)
+
+    if reserved:
+        # The cart holds every unit it buys, so other carts have left room
+        # for it: no up-front row locks, the guarded UPDATE below is the
+        # only statement touching the hot Product rows.
+        products = {
+            p.sku: p
+            for p in Product.objects.filter(sku__in=skus, is_active=True)
+        }
+        others = {}
+    else:
+        # Lock every cart SKU in one query. Ordering by SKU makes concurrent
+        # checkouts take row locks in the same order, so they can't deadlock.
+        products = {  # sku -> Product
+            p.sku: p
+            for p in Product.objects.select_for_update()
+            .filter(sku__in=skus, is_active=True)
+            .order_by("sku")
+        }
+        others = held_by_others(skus, holder)
+
     problems = []
-    locked_products = {}  # sku -> Product
-    for sku, item in cart.items():
-        try:
-            p = Product.objects.select_for_update().get(sku=sku, is_active=True)
-        except Product.DoesNotExist:
+    for sku in skus:
+        p = products.get(sku)
+        if p is None:
             problems.append(f"{sku} is no longer available.")
             continue
-        if item["qty"] > p.stock_qty:
-            problems.append(f"{p.name} – only {p.stock_qty} left.")
-        locked_products[sku] = p
+        available = p.stock_qty - others.get(sku, 0)
+        if cart[sku]["qty"] > available:
+            problems.append(f"{p.name} – only {max(available, 0)} left.")
 
     if problems:
         messages.error(request, "Cannot place order: " + " ".join(problems))
         return redirect("view_cart")
 
-    # Create sale + items, decrement stock
-    sale = Sale.objects.create(customer=customer, status="NEW")
-    for sku, item in cart.items():
-        p = locked_products[sku]
-        SaleItem.objects.create(
-            sale=sale,
+    # Build lines in memory; trust DB price at checkout
+    lines = []
+    for sku in skus:
+        p = products[sku]
+        qty = cart[sku]["qty"]
+        lines.append(SaleItem(
             sku=sku,
             product_name=p.name,
             unit=p.unit,
-            qty=item["qty"],
-            unit_price=p.price,  # trust DB price at checkout
-        )
-        p.stock_qty -= item["qty"]
-        p.save(update_fields=["stock_qty"])
+            qty=qty,
+            unit_price=p.price,
+            line_total=qty * p.price,  # bulk_create skips SaleItem.save()
+        ))
+    total = sum(line.line_total for line in lines)
+
+    sale = Sale.objects.create(customer=customer, status="NEW", total_amount=total)
+    for line in lines:
+        line.sale = sale
+    SaleItem.objects.bulk_create(lines)
+
+    # Decrement stock for every line in one conditional UPDATE. The
+    # stock_qty >= qty guard makes sure we never oversell, whether the rows
+    # were locked above or covered by this cart's reservations.
+    if not decrement_stock(lines):
+        transaction.set_rollback(True)
+        messages.error(request, "Cannot place order: stock changed, please review your cart.")
+        return redirect("view_cart")
 
-    # recompute total on sale
-    sale.save()
+    # Tell Inventory asynchronously; committed (or not) with the sale
+    record_sale_committed(sale, lines)
+    record_sale(sale, lines)  # reporting rollups
 
-    # clear cart
+    # clear cart; its holds became the sale
+    if holder:
+        release(holder)
     _save_cart(request, {})
 
     return render(request, "sales/order_success.html", {"sale": sale})
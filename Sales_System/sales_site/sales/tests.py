@@ -1,3 +1,1450 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import skipIf
+from unittest.mock import patch
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import inventory_async, metrics, product_io
+from . import orders as orders_module
+from .api_inventory import iter_inventory_pages, pull_products, push_products, upsert_into_sales
+from .cart import revalidate_cart
+from .catalog import bump_catalog_version, get_active_catalog
+from .fake_inventory import FakeInventory
+from .inventory_client import CircuitBreaker, InventoryClient, InventoryUnavailable, reset_client
+from .jobs import enqueue, run_job
+from .management.commands import bench as bench_command
+from .models import (
+    Customer, IdempotencyKey, OutboxEvent, Product, Sale, SaleItem, SalesRollup, StockReservation, SyncCursor,
+    SyncJob,
+)
+from .outbox import dispatch_pending
+from .product_io import import_products, read_rows
+from .reconcile import reconcile
+from .reservations import hold_cart, sweep_expired
+
+
+def _index_name(model, *fields):
+    for index in model._meta.indexes:
+        if tuple(index.fields) == fields:
+            return index.name
+    raise LookupError(f"no index on {model.__name__}{fields}")
+
+
+def _explain(sql):
+    """Plan rows for one captured query, as dicts keyed by column name."""
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        columns = [c[0].lower() for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _full_scans(plan):
+    """Tables the plan reads end to end without any usable index."""
+    if connection.vendor == "sqlite":
+        return [
+            row["detail"].split()[1]
+            for row in plan
+            if row["detail"].startswith("SCAN ") and " USING " not in row["detail"]
+        ]
+    # MySQL: type ALL with no candidate key
+    return [row["table"] for row in plan if row.get("type") == "ALL" and not row.get("possible_keys")]
+
+
+def _inv(sku, **fields):
+    """An Inventory product dict, as GET /products returns it."""
+    return {"sku": sku, "name": f"Product {sku}", "unit": "pcs", "listPrice": "10.00",
+            "currentQty": 5, "status": "ACTIVE", **fields}
+
+
+class UpsertIntoSalesTests(TestCase):
+    """Bulk diff-based upsert of Inventory products into Product."""
+
+    def test_creates_updates_and_counts_unchanged(self):
+        Product.objects.create(sku="A", name="Product A", price=Decimal("10.00"), stock_qty=5)
+        Product.objects.create(sku="B", name="Product B", price=Decimal("10.00"), stock_qty=5)
+        result = upsert_into_sales([_inv("A"), _inv(" b ", currentQty=9), _inv("c", listPrice="3.456")])
+        self.assertEqual(result["created"], ["C"])
+        self.assertEqual(result["updated"], ["B"])
+        self.assertEqual(result["unchanged"], 1)
+        self.assertEqual(Product.objects.get(sku="B").stock_qty, 9)
+        self.assertEqual(Product.objects.get(sku="C").price, Decimal("3.46"))
+
+    def test_writes_in_batches_with_last_duplicate_winning(self):
+        products = [_inv(f"SKU-{i}") for i in range(10)] + [_inv("SKU-0", currentQty=1)]
+        with CaptureQueriesContext(connection) as ctx:
+            result = upsert_into_sales(products, batch_size=4)
+        self.assertEqual(len(result["created"]), 10)
+        self.assertEqual(Product.objects.get(sku="SKU-0").stock_qty, 1)
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+
+    def test_skips_rows_without_sku_or_name(self):
+        result = upsert_into_sales([_inv(""), _inv("X", name="  "), _inv("Y")])
+        self.assertEqual([s["reason"] for s in result["skipped"]], ["missing sku", "empty name"])
+        self.assertEqual(result["created"], ["Y"])
+
+    def test_inactive_status_maps_to_is_active(self):
+        upsert_into_sales([_inv("Z", status="INACTIVE")])
+        self.assertFalse(Product.objects.get(sku="Z").is_active)
+
+
+class InventoryTestMixin:
+    """Points the shared Inventory client at a FakeInventory for the test."""
+    catalog_size = 50
+
+    def setUp(self):
+        super().setUp()
+        self.inventory = FakeInventory(catalog_size=self.catalog_size).start()
+        self.addCleanup(self.inventory.stop)
+        overrides = override_settings(
+            INVENTORY_API_BASE=self.inventory.url, INVENTORY_RETRIES=0, INVENTORY_RETRY_BACKOFF=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class PullCursorTests(InventoryTestMixin, TestCase):
+    """Incremental pulls from the persisted (updatedAt, id) cursor."""
+
+    def test_delta_pulls_only_rows_changed_since_the_cursor(self):
+        first = pull_products()
+        self.assertEqual((first["mode"], len(first["created"])), ("full", 50))
+        cursor = SyncCursor.objects.get(name="inventory_pull")
+        self.assertEqual(cursor.last_id, 50)
+
+        self.assertEqual(pull_products()["received"], 0)
+        self.inventory.update_product("BENCH-000007", currentQty=3)
+        delta = pull_products()
+        self.assertEqual((delta["mode"], delta["received"], delta["updated"]), ("delta", 1, ["BENCH-000007"]))
+        self.assertEqual(SyncCursor.objects.get(name="inventory_pull").last_id, 7)
+
+    def test_full_ignores_the_cursor(self):
+        pull_products()
+        self.assertEqual(pull_products(full=True)["unchanged"], 50)
+
+    def test_cursor_stays_put_when_rows_fail(self):
+        pull_products()
+        before = SyncCursor.objects.get(name="inventory_pull").last_updated_at
+        self.inventory.update_product("BENCH-000001", currentQty=-1)  # rejected by the DB
+        result = pull_products()
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertEqual(SyncCursor.objects.get(name="inventory_pull").last_updated_at, before)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False, INVENTORY_PAGE_SIZE=20)
+class InventoryPagingTests(InventoryTestMixin, TestCase):
+    """GET /products keyset pages of INVENTORY_PAGE_SIZE."""
+
+    def test_pages_through_the_whole_catalog(self):
+        pages = list(iter_inventory_pages())
+        self.assertEqual([len(p) for p in pages], [20, 20, 10])
+        self.assertEqual(len({p["sku"] for page in pages for p in page}), 50)
+        self.assertEqual(self.inventory.stats["requests"], 3)
+
+    def test_row_without_position_ends_the_pull_with_an_error(self):
+        public = FakeInventory._public
+
+        def without_updated_at(row):
+            data = public(row)
+            if row["id"] == 20:
+                del data["updatedAt"]
+            return data
+
+        with patch.object(FakeInventory, "_public", staticmethod(without_updated_at)):
+            with self.assertRaises(RuntimeError):
+                pull_products()
+        self.assertIsNone(SyncCursor.objects.get(name="inventory_pull").last_updated_at)
+
+
+class CircuitBreakerTests(TestCase):
+    """Shared Inventory client: retries and breaker state changes."""
+
+    def client_for(self, url, **kwargs):
+        client = InventoryClient(url, retries=1, backoff=0, breaker_threshold=2, breaker_reset=60, **kwargs)
+        self.addCleanup(client.session.close)
+        return client
+
+    def test_opens_after_consecutive_failures_and_rejects(self):
+        client = self.client_for("http://127.0.0.1:9")  # nothing listens there
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                client.get("/products")
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(InventoryUnavailable):
+            client.get("/products")
+        self.assertEqual(client.stats()["retries"], 2)
+        self.assertEqual(client.stats()["rejected"], 1)
+
+    def test_half_open_probe_closes_on_success_and_reopens_on_failure(self):
+        with FakeInventory(catalog_size=1) as inventory:
+            client = self.client_for(inventory.url)
+            client.breaker.state, client.breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 61
+            self.assertEqual(client.get("/products").status_code, 200)
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+            inventory.failure_rate = 1.0
+            client.breaker.state, client.breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 61
+            self.assertEqual(client.get("/products").status_code, 503)
+            self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_any_request_error_reports_the_probe(self):
+        client = self.client_for("http://127.0.0.1:9")
+        client.breaker.state, client.breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 61
+        with patch.object(client.session, "request", side_effect=requests.TooManyRedirects):
+            with self.assertRaises(requests.TooManyRedirects):
+                client.get("/products")
+        # not stuck half-open: the breaker reopened and will probe again later
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        client.breaker.opened_at -= 61
+        self.assertTrue(client.breaker.allow())
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class SyncJobTests(InventoryTestMixin, TestCase):
+    """Background sync jobs: coalescing, staleness and the run itself."""
+
+    def test_second_request_joins_the_active_job(self):
+        job, created = enqueue(SyncJob.Kind.PULL)
+        again, created_again = enqueue(SyncJob.Kind.PULL, {"full": True})
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(SyncJob.objects.get(pk=job.pk).params, {"full": True})
+        self.assertTrue(enqueue(SyncJob.Kind.PUSH)[1])  # other kinds are independent
+
+    def test_one_active_job_per_kind_is_enforced_by_the_database(self):
+        enqueue(SyncJob.Kind.PULL)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SyncJob.objects.create(kind=SyncJob.Kind.PULL, active_kind=SyncJob.Kind.PULL)
+
+    def test_job_without_heartbeat_is_replaced(self):
+        dead, _ = enqueue(SyncJob.Kind.PULL)
+        SyncJob.objects.filter(pk=dead.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        job, created = enqueue(SyncJob.Kind.PULL)
+        self.assertTrue(created)
+        dead.refresh_from_db()
+        self.assertEqual((dead.status, dead.active_kind), (SyncJob.Status.FAILED, None))
+
+    def test_run_records_result_and_frees_the_kind(self):
+        job, _ = enqueue(SyncJob.Kind.PULL)
+        with patch("sales.jobs.close_old_connections"):  # keep the test transaction's connection
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.Status.DONE)
+        self.assertEqual(job.result["mode"], "full")
+        self.assertEqual(job.progress["created"], 50)
+        self.assertIsNone(job.active_kind)
+        self.assertTrue(enqueue(SyncJob.Kind.PULL)[1])
+
+    def test_endpoint_answers_202_with_a_status_url(self):
+        resp = self.client.post("/api/sync-from-inventory/")
+        self.assertEqual(resp.status_code, 202)
+        status = self.client.get(resp.json()["status_url"]).json()
+        self.assertEqual((status["kind"], status["status"]), ("PULL", "QUEUED"))
+        self.assertTrue(self.client.post("/api/sync-from-inventory/").json()["coalesced"])
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False, INVENTORY_PUSH_CHUNK_SIZE=10)
+class ChunkedPushTests(InventoryTestMixin, TestCase):
+    """Sales -> Inventory push in acknowledged chunks."""
+
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_create(
+            Product(sku=f"P-{i:02d}", name=f"P {i}", price=Decimal("1.00"), stock_qty=i) for i in range(25)
+        )
+
+    def test_pushes_in_chunks_then_only_changes(self):
+        result = push_products()
+        self.assertEqual((result["count"], result["chunks"]), (25, 3))
+        self.assertEqual(self.inventory.stats["pushed"], 25)
+        self.assertEqual(push_products()["count"], 0)
+        Product.objects.filter(sku="P-03").update(name="renamed", updated_at=timezone.now())
+        self.assertEqual(push_products()["count"], 1)
+
+    def test_failed_push_resumes_after_the_last_acknowledged_chunk(self):
+        def fail_after_first_chunk(progress):
+            self.inventory.failure_rate = 1.0
+
+        with self.assertRaises(RuntimeError):
+            push_products(progress=fail_after_first_chunk)
+        self.inventory.failure_rate = 0.0
+        resumed = push_products()
+        self.assertEqual((resumed["mode"], resumed["count"]), ("delta", 15))
+        self.assertEqual(self.inventory.stats["pushed"], 25)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class PlaceOrderTests(TestCase):
+    """Storefront checkout: one guarded stock UPDATE, all or nothing."""
+
+    def setUp(self):
+        Product.objects.create(sku="A", name="Alpha", price=Decimal("10.00"), stock_qty=5)
+        Product.objects.create(sku="B", name="Beta", price=Decimal("2.50"), stock_qty=1)
+        self.client.post("/add/", {"sku": "A", "qty": 2})
+        self.client.post("/add/", {"sku": "B", "qty": 1})
+
+    def place(self, key):
+        return self.client.post("/place-order/", {"name": "Ann", "email": "ann@example.com", "idempotency_key": key})
+
+    def stock(self):
+        return dict(Product.objects.values_list("sku", "stock_qty"))
+
+    def test_creates_sale_and_decrements_stock_in_one_update(self):
+        key = self.client.get("/checkout/").context["idempotency_key"]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.place(key)
+        self.assertEqual(resp.status_code, 200)
+        sale = Sale.objects.get()
+        self.assertEqual(sale.total_amount, Decimal("22.50"))
+        self.assertEqual(sale.items.count(), 2)
+        self.assertEqual(self.stock(), {"A": 3, "B": 0})
+        product_updates = [q for q in ctx.captured_queries
+                           if q["sql"].startswith("UPDATE") and "sales_product" in q["sql"]]
+        self.assertEqual(len(product_updates), 1)
+
+    def test_rolls_back_when_stock_changed_under_the_reservation(self):
+        key = self.client.get("/checkout/").context["idempotency_key"]
+        Product.objects.filter(sku="B").update(stock_qty=0)  # e.g. an Inventory pull
+        resp = self.place(key)
+        self.assertRedirects(resp, "/cart/", fetch_redirect_response=False)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertEqual(self.stock(), {"A": 5, "B": 0})
+
+    def test_reports_short_stock_without_reservations(self):
+        key = self.client.get("/checkout/").context["idempotency_key"]
+        StockReservation.objects.all().delete()
+        Product.objects.filter(sku="A").update(stock_qty=1)
+        resp = self.place(key)
+        self.assertRedirects(resp, "/cart/", fetch_redirect_response=False)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(self.stock(), {"A": 1, "B": 1})
+
+
+class SaleTotalTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+
+    def test_save_does_not_query_items(self):
+        sale = Sale.objects.create(customer=self.customer, total_amount=Decimal("5.00"))
+        sale.paid_at = timezone.now()
+        with CaptureQueriesContext(connection) as ctx:
+            sale.save()
+        self.assertFalse([q for q in ctx.captured_queries if "sales_saleitem" in q["sql"]])
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal("5.00"))
+
+    def test_recalculate_total_sums_items_once(self):
+        sale = Sale.objects.create(customer=self.customer)
+        SaleItem.objects.create(sale=sale, sku="A", product_name="Alpha", unit="pcs", qty=3, unit_price=Decimal("1.50"))
+        SaleItem.objects.create(sale=sale, sku="B", product_name="Beta", unit="pcs", qty=1, unit_price=Decimal("2.00"))
+        with self.assertNumQueries(2):  # aggregate + UPDATE
+            self.assertEqual(sale.recalculate_total(), Decimal("6.50"))
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal("6.50"))
+        with self.assertNumQueries(1):  # unchanged: no write
+            sale.recalculate_total()
+
+    def test_recalculate_total_without_items_is_zero(self):
+        sale = Sale.objects.create(customer=self.customer, total_amount=Decimal("9.99"))
+        self.assertEqual(sale.recalculate_total(), Decimal("0"))
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal("0"))
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class OutboxTests(InventoryTestMixin, TestCase):
+    """Sale stock reaches Inventory once, through the outbox only."""
+    catalog_size = 5
+
+    def setUp(self):
+        super().setUp()
+        pull_products(full=True)
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+
+    def checkout(self, sku="BENCH-000001", qty=2):
+        return self.client.post("/checkout-json/", {
+            "customer": self.customer.pk,
+            "items": [{"sku": sku, "product_name": sku, "unit": "pcs", "qty": qty, "unit_price": "1.00"}],
+        }, content_type="application/json")
+
+    def test_push_then_dispatch_decrements_inventory_once(self):
+        self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(Product.objects.get(sku="BENCH-000001").stock_qty, 998)
+
+        self.assertGreater(push_products()["count"], 0)  # the sold product changed
+        self.assertEqual(self.inventory.stock("BENCH-000001"), 1000)
+        self.assertEqual(dispatch_pending(), 1)
+        self.assertEqual(self.inventory.stock("BENCH-000001"), 998)
+
+        self.assertEqual(dispatch_pending(), 0)
+        OutboxEvent.objects.update(dispatched_at=None)  # redelivered after a crash
+        self.assertEqual(dispatch_pending(), 1)
+        self.assertEqual(self.inventory.stock("BENCH-000001"), 998)
+
+    def test_failed_dispatch_keeps_the_event_for_a_retry(self):
+        self.checkout()
+        self.inventory.failure_rate = 1.0
+        with self.assertRaises(requests.HTTPError):
+            dispatch_pending()
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNone(event.dispatched_at)
+        self.assertIn("503", event.last_error)
+
+        self.inventory.failure_rate = 0.0
+        self.assertEqual(dispatch_pending(), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.attempts, event.last_error), (2, ""))
+        self.assertIsNotNone(event.dispatched_at)
+
+    def test_claimed_batch_is_skipped_until_its_lease_runs_out(self):
+        self.checkout()
+        OutboxEvent.objects.update(claimed_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(dispatch_pending(), 0)  # another dispatcher is sending it
+        OutboxEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_pending(), 1)
+        self.assertIsNone(OutboxEvent.objects.get().claimed_until)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_event_out_of_attempts_is_counted_as_dead(self):
+        self.checkout()
+        self.inventory.failure_rate = 1.0
+        metrics.reset()
+        with self.assertRaises(requests.HTTPError):
+            dispatch_pending()
+        with self.assertRaises(requests.HTTPError), self.assertLogs("sales.outbox", "ERROR"):
+            dispatch_pending()
+        self.assertEqual(dispatch_pending(), 0)
+        stats = self.client.get("/api/inventory-client/").json()
+        self.assertEqual(stats["outbox"], {"pending": 0, "dead": 1})
+        self.assertIn("sales_outbox_dead_events_total 1", metrics.render_prometheus())
+
+    def test_rejected_event_is_left_undelivered(self):
+        Product.objects.create(sku="LOCAL-1", name="Sales only", price=Decimal("1.00"), stock_qty=5)
+        self.checkout(sku="LOCAL-1", qty=1)
+        self.checkout()
+        self.assertEqual(dispatch_pending(), 1)
+        rejected = OutboxEvent.objects.get(dispatched_at__isnull=True)
+        self.assertEqual(rejected.attempts, 1)
+        self.assertIn("Unknown SKU", rejected.last_error)
+
+    def test_checkout_refuses_to_oversell(self):
+        resp = self.checkout(qty=1001)
+        self.assertEqual(resp.status_code, 409)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(Product.objects.get(sku="BENCH-000001").stock_qty, 1000)
+
+    def test_unknown_sku_is_rejected_as_such(self):
+        resp = self.checkout(sku="NO-SUCH-SKU")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {"error": "unknown sku", "skus": ["NO-SUCH-SKU"]})
+        self.assertFalse(Sale.objects.exists())
+
+        order = {"customer": self.customer.pk, "items": [
+            {"sku": "NO-SUCH-SKU", "product_name": "p", "unit": "pcs", "qty": 1, "unit_price": "1.00"},
+        ]}
+        results = self.client.post("/checkout-json/batch/", {"orders": [order]},
+                                   content_type="application/json").json()["results"]
+        self.assertEqual(results[0]["errors"], {"items": ["Unknown SKU: NO-SUCH-SKU"]})
+
+    def test_checkout_batch_fails_only_the_order_short_of_stock(self):
+        def order(qty):
+            return {"customer": self.customer.pk, "items": [
+                {"sku": "BENCH-000002", "product_name": "p", "unit": "pcs", "qty": qty, "unit_price": "1.00"},
+            ]}
+        resp = self.client.post("/checkout-json/batch/", {"orders": [order(600), order(600)]},
+                                content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()["results"]
+        self.assertEqual([r["ok"] for r in results], [True, False])
+        self.assertIn("items", results[1]["errors"])
+        self.assertEqual(Product.objects.get(sku="BENCH-000002").stock_qty, 400)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class CatalogCacheTests(TestCase):
+    """The storefront catalog is cached per version; writes move the version."""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(sku="A", name="Alpha", price=Decimal("10.00"), stock_qty=5)
+
+    def test_second_read_is_served_from_cache(self):
+        first = get_active_catalog()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_catalog(), first)
+
+    def test_product_save_invalidates_after_commit(self):
+        version = get_active_catalog()["version"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal("12.00")
+            self.product.save()
+        catalog = get_active_catalog()
+        self.assertEqual(catalog["version"], version + 1)
+        self.assertEqual(catalog["rows"][0]["price"], Decimal("12.00"))
+
+    def test_rolled_back_checkout_keeps_the_version(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        version = get_active_catalog()["version"]
+
+        def checkout(qty):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post("/checkout-json/", {
+                    "customer": customer.pk,
+                    "items": [{"sku": "A", "product_name": "Alpha", "unit": "pcs", "qty": qty, "unit_price": "10.00"}],
+                }, content_type="application/json")
+
+        self.assertEqual(checkout(6).status_code, 409)
+        self.assertEqual(get_active_catalog()["version"], version)
+        self.assertEqual(checkout(2).status_code, 201)
+        catalog = get_active_catalog()
+        self.assertEqual(catalog["version"], version + 1)
+        self.assertEqual(catalog["rows"][0]["stock_qty"], 3)
+
+    def test_bump_survives_an_evicted_version_key(self):
+        get_active_catalog()
+        cache.delete("catalog:version")
+        bump_catalog_version()
+        self.assertEqual(cache.get("catalog:version"), 2)
+
+
+class ProductListTests(TestCase):
+    """/products/: conditional GET and (name, id) keyset pages."""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            Product.objects.create(sku=f"P{i}", name="Same name" if i < 3 else f"Z{i}",
+                                   price=Decimal("1.00"), stock_qty=1)
+        Product.objects.create(sku="OFF", name="Hidden", price=Decimal("1.00"), is_active=False)
+
+    def test_unchanged_poll_gets_304(self):
+        first = self.client.get("/products/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()), 5)
+        again = self.client.get("/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+        Product.objects.filter(sku="P0").update(price=Decimal("2.00"), updated_at=timezone.now())
+        bump_catalog_version()
+        changed = self.client.get("/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_keyset_pages_cover_the_catalog_once(self):
+        skus, cursor = [], ""
+        for _ in range(10):
+            resp = self.client.get(f"/products/?limit=2&cursor={cursor}")
+            self.assertEqual(resp.status_code, 200)
+            body = resp.json()
+            skus += [p["sku"] for p in body["results"]]
+            cursor = body["next"]
+            if cursor is None:
+                break
+        self.assertEqual(skus, ["P0", "P1", "P2", "P3", "P4"])
+
+    def test_bad_paging_input(self):
+        self.assertEqual(self.client.get("/products/?limit=x").status_code, 400)
+        self.assertEqual(self.client.get("/products/?limit=2&cursor=!!").status_code, 400)
+
+
+class SaleListTests(TestCase):
+    """/api/sales/: newest-first cursor pages and filters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        start = timezone.now() - timedelta(days=10)
+        cls.sales = []
+        for i in range(7):
+            sale = Sale.objects.create(customer=customer, status="PAID" if i % 2 else "NEW",
+                                       created_at=start + timedelta(days=i))
+            SaleItem.objects.create(sale=sale, sku="A", product_name="Alpha", unit="pcs",
+                                    qty=1, unit_price=Decimal("1.00"))
+            cls.sales.append(sale)
+
+    def test_cursor_pages_walk_newest_first(self):
+        seen, url = [], "/api/sales/?page_size=3"
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body["results"]), 3)
+            seen += [s["sale_id"] for s in body["results"]]
+            url = body["next"]
+        self.assertEqual(seen, [s.pk for s in reversed(self.sales)])
+
+    def test_items_come_prefetched(self):
+        with self.assertNumQueries(2):  # sales + customer join, then items
+            body = self.client.get("/api/sales/").json()
+        self.assertEqual(len(body["results"][0]["items"]), 1)
+
+    def test_filters(self):
+        paid = self.client.get("/api/sales/?status=paid").json()["results"]
+        self.assertEqual({s["status"] for s in paid}, {"PAID"})
+        self.assertEqual(len(paid), 3)
+        day = timezone.localdate(self.sales[2].created_at).isoformat()
+        ranged = self.client.get(f"/api/sales/?created_after={day}&created_before={day}").json()["results"]
+        self.assertEqual([s["sale_id"] for s in ranged], [self.sales[2].pk])
+        self.assertEqual(self.client.get("/api/sales/?created_after=soon").status_code, 400)
+        self.assertEqual(self.client.get("/api/sales/?created_before=2025-02-30").status_code, 400)
+
+
+class CartRevalidationTests(TestCase):
+    """revalidate_cart: two queries for the whole cart, every kind of change."""
+
+    def setUp(self):
+        Product.objects.create(sku="A", name="Alpha", price=Decimal("10.00"), stock_qty=5)
+        Product.objects.create(sku="B", name="Beta", price=Decimal("3.00"), stock_qty=2)
+        Product.objects.create(sku="C", name="Gamma", price=Decimal("1.00"), stock_qty=0)
+        Product.objects.create(sku="D", name="Delta", price=Decimal("1.00"), stock_qty=9, is_active=False)
+
+    def test_reports_each_change(self):
+        cart = {
+            "A": {"qty": 1},
+            "B": {"qty": 4},
+            "C": {"qty": 1},
+            "D": {"qty": 1},
+            "GONE": {"qty": 1, "name": "Old thing"},
+        }
+        with self.assertNumQueries(2):  # products, other carts' holds
+            new_cart, changes = revalidate_cart(cart, desired={"A": 2})
+        self.assertEqual(new_cart, {
+            "A": {"name": "Alpha", "unit": "pcs", "price": 10.0, "qty": 2},
+            "B": {"name": "Beta", "unit": "pcs", "price": 3.0, "qty": 2},
+        })
+        self.assertEqual(
+            [(c["sku"], c["kind"]) for c in changes],
+            [("B", "capped"), ("C", "out_of_stock"), ("D", "unavailable"), ("GONE", "unavailable")],
+        )
+
+    def test_zero_quantity_removes_the_line(self):
+        new_cart, changes = revalidate_cart({"A": {"qty": 1}}, desired={"A": 0})
+        self.assertEqual(new_cart, {})
+        self.assertEqual(changes[0]["kind"], "removed")
+
+    def test_other_carts_holds_are_not_available(self):
+        StockReservation.objects.create(holder="other", sku="A", qty=4,
+                                        expires_at=timezone.now() + timedelta(minutes=5))
+        new_cart, changes = revalidate_cart({"A": {"qty": 3}}, holder="mine")
+        self.assertEqual(new_cart["A"]["qty"], 1)
+        self.assertEqual(changes[0]["kind"], "capped")
+
+    def test_view_cart_saves_the_corrected_cart(self):
+        self.client.post("/add/", {"sku": "B", "qty": 2})
+        Product.objects.filter(sku="B").update(stock_qty=1)
+        resp = self.client.get("/cart/")
+        self.assertEqual([i["qty"] for i in resp.context["items"]], [1])
+        self.assertEqual(self.client.session["cart"], {"B": 1})
+
+
+class CompactCartTests(TestCase):
+    """The session cart is {sku: qty}; lines are rehydrated from Product."""
+
+    def setUp(self):
+        Product.objects.create(sku="A", name="Alpha", price=Decimal("10.00"), stock_qty=5)
+
+    def test_session_stores_only_quantities(self):
+        self.client.post("/add/", {"sku": "A", "qty": 2})
+        self.client.post("/add/", {"sku": "A", "qty": 1})
+        self.assertEqual(self.client.session["cart"], {"A": 3})
+
+    def test_legacy_full_lines_still_load(self):
+        session = self.client.session
+        session["cart"] = {"A": {"name": "Old name", "unit": "box", "price": 1.0, "qty": 2}}
+        session.save()
+        items = self.client.get("/cart/").context["items"]
+        self.assertEqual([(i["name"], i["price"], i["qty"]) for i in items], [("Alpha", 10.0, 2)])
+        self.client.post("/cart/update/", {"qty_A": 1})
+        self.assertEqual(self.client.session["cart"], {"A": 1})
+
+
+@override_settings(RESERVATION_MAX_UNITS=10)
+class ReservationTests(TestCase):
+    """Carts hold stock from checkout_form until the hold expires."""
+
+    def setUp(self):
+        Product.objects.create(sku="A", name="Alpha", price=Decimal("10.00"), stock_qty=5)
+        self.other = self.client_class()
+
+    def holds(self):
+        return dict(StockReservation.objects.values_list("holder", "qty"))
+
+    def test_only_checkout_holds_stock(self):
+        self.client.post("/add/", {"sku": "A", "qty": 3})
+        self.client.get("/cart/")
+        self.assertEqual(self.holds(), {})
+        self.client.get("/checkout/")
+        self.assertEqual(list(self.holds().values()), [3])
+
+    def test_held_stock_is_not_available_to_other_carts(self):
+        self.client.post("/add/", {"sku": "A", "qty": 3})
+        self.client.get("/checkout/")
+        self.other.post("/add/", {"sku": "A", "qty": 5})
+        self.assertEqual(self.other.session["cart"], {"A": 2})
+
+    def test_browsing_creates_no_session_until_checkout(self):
+        self.client.get("/cart/")
+        self.assertFalse(Session.objects.exists())
+
+        StockReservation.objects.create(holder="other", sku="A", qty=4,
+                                        expires_at=timezone.now() + timedelta(minutes=5))
+        self.client.post("/add/", {"sku": "A", "qty": 3})
+        self.assertEqual(self.client.session["cart"], {"A": 1})  # a new session still sees the holds
+        self.client.get("/checkout/")
+        self.assertEqual(self.holds()[self.client.session.session_key], 1)
+
+    def test_changing_the_cart_releases_its_holds(self):
+        self.client.post("/add/", {"sku": "A", "qty": 3})
+        self.client.get("/checkout/")
+        self.client.post("/cart/update/", {"qty_A": 1})
+        self.assertEqual(self.holds(), {})
+
+    def test_expired_holds_free_the_stock(self):
+        self.client.post("/add/", {"sku": "A", "qty": 3})
+        self.client.get("/checkout/")
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.other.post("/add/", {"sku": "A", "qty": 5})
+        self.assertEqual(self.other.session["cart"], {"A": 5})
+        self.assertEqual(sweep_expired(), 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_holds_are_capped_per_cart(self):
+        Product.objects.filter(sku="A").update(stock_qty=50)
+        self.client.post("/add/", {"sku": "A", "qty": 11})
+        self.assertEqual(self.client.get("/checkout/").status_code, 200)
+        self.assertEqual(self.holds(), {})
+
+    def test_hold_never_exceeds_unreserved_stock(self):
+        StockReservation.objects.create(holder="other", sku="A", qty=4,
+                                        expires_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(hold_cart("mine", {"A": {"qty": 3}, "GONE": {"qty": 1}}), {"A": 1})
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class SalesRollupTests(TestCase):
+    """Rollups follow sale creation, admin edits, status changes and deletes."""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        for sku in ("A", "B"):
+            Product.objects.create(sku=sku, name=sku, price=Decimal("2.00"), stock_qty=100)
+
+    def sell(self, *lines):
+        resp = self.client.post("/checkout-json/", {"customer": self.customer.pk, "items": [
+            {"sku": sku, "product_name": sku, "unit": "pcs", "qty": qty, "unit_price": "2.00"} for sku, qty in lines
+        ]}, content_type="application/json")
+        self.assertEqual(resp.status_code, 201)
+        return Sale.objects.get(pk=resp.json()["sale_id"])
+
+    def rollup(self):
+        return {
+            (r.sku, r.status): (r.qty, r.revenue, r.order_count)
+            for r in SalesRollup.objects.exclude(order_count=0)
+        }
+
+    def test_status_change_moves_the_sale_once(self):
+        sale = self.sell(("A", 2), ("B", 1))
+        self.sell(("A", 1))
+        self.assertEqual(self.rollup(), {
+            ("A", "NEW"): (3, Decimal("6.00"), 2), ("B", "NEW"): (1, Decimal("2.00"), 1),
+        })
+        sale = Sale.objects.get(pk=sale.pk)
+        sale.status = Sale.Status.PAID
+        sale.save()
+        sale.save()  # no second move
+        self.assertEqual(self.rollup(), {
+            ("A", "NEW"): (1, Decimal("2.00"), 1),
+            ("A", "PAID"): (2, Decimal("4.00"), 1), ("B", "PAID"): (1, Decimal("2.00"), 1),
+        })
+
+    def test_admin_created_and_edited_sale_is_counted(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+
+        def post(url, status, lines):
+            data = {
+                "customer": self.customer.pk, "status": status, "total_amount": "0",
+                "paid_at_0": "", "paid_at_1": "",
+                "items-TOTAL_FORMS": len(lines), "items-INITIAL_FORMS": sum(1 for pk, *_ in lines if pk),
+                "items-MIN_NUM_FORMS": 0, "items-MAX_NUM_FORMS": 1000,
+            }
+            for i, (pk, sku, qty) in enumerate(lines):
+                data.update({
+                    f"items-{i}-sale_item_id": pk or "", f"items-{i}-sku": sku, f"items-{i}-product_name": sku,
+                    f"items-{i}-unit": "pcs", f"items-{i}-qty": qty, f"items-{i}-unit_price": "2.00",
+                })
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+
+        post("/admin/sales/sale/add/", "NEW", [(None, "A", 2)])
+        sale = Sale.objects.get()
+        self.assertEqual(sale.total_amount, Decimal("4.00"))
+        self.assertEqual(self.rollup(), {("A", "NEW"): (2, Decimal("4.00"), 1)})
+
+        item = sale.items.get()
+        post(f"/admin/sales/sale/{sale.pk}/change/", "PAID", [(item.pk, "A", 5), (None, "B", 1)])
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, Decimal("12.00"))
+        self.assertEqual(self.rollup(), {
+            ("A", "PAID"): (5, Decimal("10.00"), 1), ("B", "PAID"): (1, Decimal("2.00"), 1),
+        })
+
+    def test_failed_rollup_update_rolls_back_the_status(self):
+        sale = self.sell(("A", 1))
+        sale.status = Sale.Status.CANCELLED
+        with patch("sales.signals.move_sale", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                sale.save()
+        self.assertEqual(Sale.objects.get(pk=sale.pk).status, "NEW")
+
+    def test_delete_forgets_the_sale_and_rebuild_agrees(self):
+        keep = self.sell(("A", 2))
+        gone = self.sell(("B", 1))
+        keep.status = Sale.Status.PAID
+        keep.save()
+        Sale.objects.get(pk=gone.pk).delete()
+        incremental = self.rollup()
+        self.assertEqual(incremental, {("A", "PAID"): (2, Decimal("4.00"), 1)})
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_report_is_cursor_paged(self):
+        self.sell(("A", 1), ("B", 1))
+        first = self.client.get("/api/reports/sales-rollup/?page_size=1").json()
+        self.assertEqual([r["sku"] for r in first["results"]], ["A"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([r["sku"] for r in second["results"]], ["B"])
+        self.assertIsNone(second["next"])
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class CheckoutBatchTests(TestCase):
+    """Batch checkout: one bad order fails only itself."""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        for sku in ("A", "B", "BAD"):
+            Product.objects.create(sku=sku, name=sku, price=Decimal("2.00"), stock_qty=5)
+
+    def order(self, sku="A", qty=1, customer=None):
+        return {"customer": customer or self.customer.pk, "items": [
+            {"sku": sku, "product_name": sku, "unit": "pcs", "qty": qty, "unit_price": "2.00"},
+        ]}
+
+    def post(self, orders):
+        return self.client.post("/checkout-json/batch/", {"orders": orders}, content_type="application/json")
+
+    def test_all_valid_is_201(self):
+        resp = self.post([self.order(), self.order("B", 2)])
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["created"], 2)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_partial_failures_are_reported_per_order(self):
+        real_record_sales = orders_module.record_sales
+
+        def record_sales(pairs):
+            if any(i.sku == "BAD" for _, items in pairs for i in items):
+                raise DatabaseError("Duplicate entry 'x' for key 'secret_index'")
+            real_record_sales(pairs)
+
+        with patch.object(orders_module, "record_sales", record_sales), \
+                self.assertLogs("sales.orders", "ERROR"):
+            resp = self.post([
+                self.order(),
+                self.order(qty=0),              # invalid
+                self.order(customer=999999),    # unknown customer
+                self.order("B", qty=6),         # short of stock
+                self.order("BAD"),              # database error
+                self.order("B", qty=5),
+            ])
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        results = body["results"]
+        self.assertEqual([r["ok"] for r in results], [True, False, False, False, False, True])
+        self.assertIn("qty", str(results[1]["errors"]))
+        self.assertIn("customer", results[2]["errors"])
+        self.assertEqual(results[3]["errors"], {"items": ["Insufficient stock."]})
+        self.assertEqual(results[4]["errors"], {"non_field_errors": ["Could not save this order."]})
+        self.assertEqual(dict(Product.objects.values_list("sku", "stock_qty")), {"A": 4, "B": 0, "BAD": 5})
+
+    def test_rejects_bad_envelopes(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        with override_settings(CHECKOUT_BATCH_MAX=1):
+            self.assertEqual(self.post([self.order(), self.order()]).status_code, 400)
+
+
+class BenchSupportTests(TestCase):
+    """Pieces of the offline benchmark: percentiles and the fake Inventory."""
+
+    def test_percentile_is_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(bench_command._percentile(values, 50), 50.0)
+        self.assertEqual(bench_command._percentile(values, 99), 99.0)
+        self.assertEqual(bench_command._percentile([7.0], 99), 7.0)
+        self.assertIsNone(bench_command._percentile([], 50))
+
+    def test_scenario_summary(self):
+        scenario = bench_command._Scenario("x")
+        for _ in range(3):
+            with scenario.measure():
+                Product.objects.count()
+        scenario.check(type("Resp", (), {"status_code": 503})())
+        summary = scenario.summary()
+        self.assertEqual((summary["requests"], summary["errors"]), (3, 1))
+        self.assertEqual((summary["queries_avg"], summary["queries_max"]), (1, 1))
+
+    def test_fake_inventory_pages_and_ranges(self):
+        inventory = FakeInventory(catalog_size=10)
+        first = inventory.page(limit=4)
+        self.assertEqual([p["id"] for p in first], [1, 2, 3, 4])
+        last = first[-1]
+        since = datetime.fromisoformat(last["updatedAt"].replace("Z", "+00:00"))
+        self.assertEqual([p["id"] for p in inventory.page(since, last["id"], limit=4)], [5, 6, 7, 8])
+        self.assertEqual([p["id"] for p in inventory.page(id_from=3, id_to=5)], [3, 4])
+
+        inventory.update_product("BENCH-000002", currentQty=1)
+        span = inventory.id_range(since, last["id"])
+        self.assertEqual((span["count"], span["minId"], span["maxId"]), (7, 2, 10))
+
+
+class MetricsTests(TestCase):
+    """Per-request metrics and the Prometheus endpoint."""
+
+    def setUp(self):
+        Product.objects.create(sku="A", name="Alpha", price=Decimal("1.00"), stock_qty=1)
+
+    def scrape(self, **headers):
+        resp = self.client.get("/metrics", **headers)
+        return resp, resp.content.decode()
+
+    def test_requests_and_queries_are_counted_per_view(self):
+        cache.clear()
+        self.client.get("/products/")
+        _, before = self.scrape()
+        self.client.get("/products/")
+        resp, text = self.scrape()
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE sales_http_requests_total counter", text)
+        line = 'sales_http_requests_total{view="product_list_json",method="GET",status="200"}'
+
+        def value(body):
+            return float(next(l for l in body.splitlines() if l.startswith(line)).rsplit(" ", 1)[1])
+
+        self.assertEqual(value(text) - value(before), 1)
+        self.assertIn('sales_db_queries_per_request_bucket{view="product_list_json",le="+Inf"}', text)
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.scrape()[0].status_code, 401)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer nope")[0].status_code, 401)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION="Bearer s3cret")[0].status_code, 200)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics._labels((("view", 'a"b\\c\nd'),)), '{view="a\\"b\\\\c\\nd"}')
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class HotPathQueryTests(TestCase):
+    """
+    Captures the queries behind the main views and checks that none of
+    them scans a table without an index, and that the number of queries
+    doesn't grow with the size of the page/cart/batch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Test", email="test@example.com")
+        cls.products = [
+            Product.objects.create(sku=f"SKU-{i:03d}", name=f"Product {i:03d}", price=Decimal("10.00"), stock_qty=100)
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def make_sales(self, n, status=Sale.Status.NEW):
+        for _ in range(n):
+            sale = Sale.objects.create(customer=self.customer, status=status)
+            for p in self.products[:3]:
+                SaleItem.objects.create(sale=sale, sku=p.sku, product_name=p.name, unit="pcs", qty=1, unit_price=p.price)
+
+    def capture(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(resp.status_code, 400, resp.content[:500])
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def assertIndexFriendly(self, queries):
+        for sql in queries:
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            plan = _explain(sql)
+            self.assertEqual(_full_scans(plan), [], f"full scan in:\n{sql}\n{plan}")
+
+    def assertPlanUses(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"{queryset.query}\n{plan}")
+
+    # --- plans ---------------------------------------------------------------
+
+    def test_sale_list_plans(self):
+        self.make_sales(3)
+        self.assertIndexFriendly(self.capture("get", "/api/sales/"))
+        self.assertIndexFriendly(self.capture("get", "/api/sales/?status=NEW&created_after=2020-01-01"))
+        self.assertPlanUses(
+            Sale.objects.filter(status="PAID").order_by("-created_at", "-sale_id")[:50],
+            _index_name(Sale, "status", "created_at", "sale_id"),
+        )
+
+    @skipIf(
+        connection.vendor == "sqlite",
+        "SQLite gets a bare `WHERE is_active` and can't use an index for it; MySQL gets `is_active = 1`",
+    )
+    def test_catalog_plans(self):
+        self.assertIndexFriendly(self.capture("get", "/products/?limit=5"))
+        self.assertIndexFriendly(self.capture("get", "/shop/"))
+        self.assertPlanUses(
+            Product.objects.filter(is_active=True).order_by("name", "id")[:20],
+            _index_name(Product, "is_active", "name", "id"),
+        )
+
+    def test_sale_item_sku_plan(self):
+        self.assertPlanUses(
+            SaleItem.objects.filter(sku="SKU-001").values("sale_id"),
+            _index_name(SaleItem, "sku", "sale"),
+        )
+
+    def test_rollup_report_plans(self):
+        self.make_sales(2)
+        self.assertIndexFriendly(self.capture("get", "/api/reports/sales-rollup/?sku=SKU-001"))
+
+    def test_cart_and_order_plans(self):
+        for p in self.products[:3]:
+            self.capture("post", "/add/", data={"sku": p.sku, "qty": 1})
+        self.assertIndexFriendly(self.capture("get", "/cart/"))
+        self.assertIndexFriendly(
+            self.capture("post", "/place-order/", data={"name": "Test", "email": "test@example.com"})
+        )
+
+    # --- query counts ----------------------------------------------------------
+
+    def test_sale_list_query_count_is_constant(self):
+        self.make_sales(2)
+        small = len(self.capture("get", "/api/sales/"))
+        self.make_sales(20)
+        self.assertEqual(len(self.capture("get", "/api/sales/")), small)
+        self.assertLessEqual(small, 2)
+
+    def test_product_list_is_cached(self):
+        self.capture("get", "/products/")
+        self.assertEqual(self.capture("get", "/products/"), [])
+
+    def test_cart_query_count_is_constant(self):
+        self.capture("post", "/add/", data={"sku": self.products[0].sku, "qty": 1})
+        small = len(self.capture("get", "/cart/"))
+        for p in self.products[1:]:
+            self.capture("post", "/add/", data={"sku": p.sku, "qty": 1})
+        self.assertEqual(len(self.capture("get", "/cart/")), small)
+
+    def test_checkout_batch_query_count_is_constant(self):
+        def orders(n):
+            items = [
+                {"sku": p.sku, "product_name": p.name, "unit": "pcs", "qty": 1, "unit_price": "10.00"}
+                for p in self.products[:3]
+            ]
+            return {"orders": [{"customer": self.customer.pk, "items": items} for _ in range(n)]}
+
+        # 30 x 3 lines still fits one INSERT within SQLite's parameter limit
+        small = len(self.capture("post", "/checkout-json/batch/", data=orders(1), content_type="application/json"))
+        large = len(self.capture("post", "/checkout-json/batch/", data=orders(30), content_type="application/json"))
+        self.assertEqual(large, small)
+        self.assertEqual(Sale.objects.count(), 31)
+
+
+class ReconcileTests(TestCase):
+    """Bucketed stock reconciliation against the in-process Inventory stand-in."""
+
+    def setUp(self):
+        self.inventory = FakeInventory(catalog_size=500).start()
+        self.addCleanup(self.inventory.stop)
+        overrides = override_settings(INVENTORY_API_BASE=self.inventory.url, INVENTORY_RETRIES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        self.client.post("/api/sync-from-inventory/?wait=1&full=1")
+
+    def test_in_sync_transfers_only_digests(self):
+        result = reconcile(buckets=64)
+        self.assertEqual(result["mismatched_buckets"], 0)
+        self.assertEqual(result["differences"], [])
+        self.assertLess(result["bytes_transferred"], 4096)
+
+    def test_reports_and_fixes_only_differing_skus(self):
+        self.inventory.update_product("BENCH-000007", currentQty=3)
+        self.inventory.update_product("BENCH-000042", listPrice="1.00", status="INACTIVE")
+        Product.objects.filter(sku="BENCH-000100").delete()
+        Product.objects.create(sku="ONLY-IN-SALES", name="x", price=1)
+
+        result = reconcile(buckets=64)
+        self.assertLessEqual(result["mismatched_buckets"], 4)
+        self.assertEqual(
+            {(d["sku"], d["kind"]) for d in result["differences"]},
+            {
+                ("BENCH-000007", "different"),
+                ("BENCH-000042", "different"),
+                ("BENCH-000100", "missing_in_sales"),
+                ("ONLY-IN-SALES", "missing_in_inventory"),
+            },
+        )
+        self.assertEqual(
+            set(result["differences"][0]["fields"]) | set(result["differences"][1]["fields"]),
+            {"stock_qty", "price", "is_active"},
+        )
+
+        fixed = reconcile(buckets=64, fix=True)
+        self.assertEqual(fixed["fixed"]["created"] + fixed["fixed"]["updated"], 3)
+        after = reconcile(buckets=64)
+        self.assertEqual([d["sku"] for d in after["differences"]], ["ONLY-IN-SALES"])
+
+    def test_sku_stored_in_another_case_matches_inventorys(self):
+        Product.objects.filter(sku="BENCH-000007").update(sku=" bench-000007")
+        self.assertEqual(reconcile(buckets=64)["differences"], [])
+
+        self.inventory.update_product("BENCH-000007", currentQty=3)
+        result = reconcile(buckets=64, fix=True)
+        self.assertEqual([(d["sku"], d["kind"]) for d in result["differences"]], [("BENCH-000007", "different")])
+        self.assertEqual(result["fixed"]["updated"], 1)
+        self.assertEqual(list(Product.objects.filter(sku__icontains="bench-000007").values_list("sku", "stock_qty")),
+                         [("BENCH-000007", 3)])
+
+    def test_endpoints(self):
+        resp = self.client.get("/api/reconcile/buckets/?buckets=16")
+        self.assertEqual(resp.json()["count"], 500)
+        self.assertEqual(resp.json()["digests"], self.inventory.reconcile_buckets(16)["digests"])
+        rows = self.client.get("/api/reconcile/rows/?buckets=16&ids=0,1").json()["rows"]
+        self.assertTrue(rows)
+        self.assertEqual(self.client.post("/api/reconcile/?buckets=16").json()["mismatched_buckets"], 0)
+        self.assertEqual(self.client.get("/api/reconcile/rows/?buckets=16&ids=99").status_code, 400)
+
+
+class ProductImportExportTests(TestCase):
+    """import_products / export_products round trips."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_import_normalizes_and_upserts_in_batches(self):
+        Product.objects.create(sku="A-1", name="Old", price=Decimal("1.00"), stock_qty=1)
+        with open(self.path("in.ndjson"), "w") as f:
+            f.write('{"sku": " a-1 ", "name": "New", "price": "2.499", "stock_qty": 5}\n')
+            f.write('{"sku": "b-2", "name": "B", "is_active": "no"}\n')
+            f.write('{"sku": "C-3", "name": "C", "listPrice": "3.10", "currentQty": 2, "status": "ACTIVE"}\n')
+            f.write('{"sku": "", "name": "no sku"}\n')
+        call_command("import_products", self.path("in.ndjson"), "--batch-size", "2", stdout=io.StringIO())
+
+        self.assertEqual(Product.objects.count(), 3)
+        a = Product.objects.get(sku="A-1")
+        self.assertEqual((a.name, a.price, a.stock_qty), ("New", Decimal("2.50"), 5))
+        b = Product.objects.get(sku="B-2")
+        self.assertEqual((b.price, b.stock_qty, b.is_active), (Decimal("0.00"), 0, False))
+        self.assertEqual(Product.objects.get(sku="C-3").price, Decimal("3.10"))
+
+    def test_export_round_trips_through_csv_and_ndjson(self):
+        Product.objects.bulk_create(
+            Product(sku=f"SKU-{i:03d}", name=f"P {i}", price=Decimal(i) / 4, stock_qty=i, is_active=i % 2 == 0)
+            for i in range(25)
+        )
+        expected = list(Product.objects.order_by("sku").values_list("sku", "name", "price", "stock_qty", "is_active"))
+        for name in ("out.csv.gz", "out.ndjson"):
+            call_command("export_products", self.path(name), "--chunk-size", "7", stderr=io.StringIO())
+            Product.objects.all().delete()
+            call_command("import_products", self.path(name), stdout=io.StringIO())
+            self.assertEqual(
+                list(Product.objects.order_by("sku").values_list("sku", "name", "price", "stock_qty", "is_active")),
+                expected,
+            )
+
+    def test_failed_rows_fail_the_command(self):
+        with open(self.path("in.csv"), "w") as f:
+            f.write("sku,name,price,stock_qty\nOK,ok,1,1\nBAD,bad,1,-1\n")
+        with self.assertRaises(CommandError):
+            call_command("import_products", self.path("in.csv"), "--batch-size", "1", stdout=io.StringIO())
+        self.assertTrue(Product.objects.filter(sku="OK").exists())
+
+    def test_bad_values_fail_their_own_line_only(self):
+        rows = [
+            (2, {"sku": " a1 ", "name": "Apple", "unit": "pcs", "price": "1.50", "stock_qty": "3"}),
+            (3, {"sku": "b2", "name": "", "price": "1", "stock_qty": "1"}),
+            (4, {"sku": "c3", "name": "Cherry", "unit": "kg", "price": "abc", "stock_qty": "1"}),
+            (5, {"sku": "d4", "name": "Date", "unit": "kg", "price": "2", "stock_qty": "-2"}),
+        ]
+        result = import_products(rows, batch_size=10)
+        self.assertEqual((result["created"], result["skipped"], result["errors"]), (1, 1, 2))
+        self.assertEqual(
+            [(p["line"], p["sku"], p["kind"]) for p in result["problems"]],
+            [(3, "b2", "skipped"), (4, "c3", "errors"), (5, "d4", "errors")],
+        )
+        self.assertEqual(list(Product.objects.values_list("sku", flat=True)), ["A1"])
+
+    def test_batch_rejected_by_the_database_is_retried_row_by_row(self):
+        rows = [
+            (2, {"sku": "A1", "name": "Apple", "price": "1", "stock_qty": 1}),
+            (3, {"sku": "B2", "name": "Banana", "price": "1", "stock_qty": 1}),
+            (4, {"sku": "C3", "name": "Cherry", "price": "1", "stock_qty": 1}),
+        ]
+        real_apply = product_io._apply_batch
+
+        def apply(batch, applied):
+            if "B2" in batch:
+                raise DatabaseError("value out of range")
+            return real_apply(batch, applied)
+
+        with patch("sales.product_io._apply_batch", side_effect=apply):
+            result = import_products(rows, batch_size=10)
+        self.assertEqual((result["created"], result["errors"]), (2, 1))
+        self.assertEqual([(p["line"], p["sku"]) for p in result["problems"]], [(3, "B2")])
+        self.assertEqual(sorted(Product.objects.values_list("sku", flat=True)), ["A1", "C3"])
+
+    def test_bad_ndjson_lines_are_reported_and_the_rest_imported(self):
+        with open(self.path("in.ndjson"), "w") as f:
+            f.write('{"sku": "A-1", "name": "A", "price": "1", "stock_qty": 1}\n')
+            f.write('{"sku": "B-2", "name": \n')
+            f.write('[1, 2]\n')
+            f.write('{"sku": "C-3", "name": "C", "price": "3", "stock_qty": 3}\n')
+        version = get_active_catalog()["version"]
+        with open(self.path("in.ndjson")) as stream:
+            result = import_products(read_rows(stream, "ndjson"), batch_size=1)
+
+        self.assertEqual((result["read"], result["created"], result["errors"]), (4, 2, 2))
+        self.assertEqual([p["line"] for p in result["problems"]], [2, 3])
+        self.assertEqual(sorted(Product.objects.values_list("sku", flat=True)), ["A-1", "C-3"])
+        self.assertNotEqual(get_active_catalog()["version"], version)
+
+    def test_catalog_version_bumped_when_reading_fails_midway(self):
+        def rows():
+            yield 1, {"sku": "A-1", "name": "A", "price": "1", "stock_qty": 1}
+            raise OSError("disk went away")
+
+        version = get_active_catalog()["version"]
+        with self.assertRaises(OSError):
+            import_products(rows(), batch_size=1)
+        self.assertTrue(Product.objects.filter(sku="A-1").exists())
+        self.assertNotEqual(get_active_catalog()["version"], version)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False, SALES_EXPORT_CHUNK_SIZE=4)
+class SalesExportTests(TestCase):
+    """Streamed /api/sales-export/, with chunks small enough to split sales."""
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Acct", email="acct@example.com")
+        cls.sales = []
+        for i in range(5):
+            sale = Sale.objects.create(customer=customer, total_amount=Decimal(i * 3))
+            SaleItem.objects.bulk_create(
+                SaleItem(sale=sale, sku=f"SKU-{j}", product_name=f"P{j}", unit="pcs",
+                         qty=j + 1, unit_price=Decimal("1.00"), line_total=Decimal(j + 1))
+                for j in range(i % 3)  # 0, 1 or 2 items, so sales straddle chunks
+            )
+            cls.sales.append(sale)
+
+    def export(self, query):
+        resp = self.client.get(f"/api/sales-export/?{query}")
+        self.assertTrue(resp.streaming)
+        return resp, b"".join(resp.streaming_content).decode("utf-8")
+
+    def test_csv_has_one_row_per_item_in_chunked_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp, body = self.export("format=csv")
+        self.assertEqual(resp["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(body)))
+        # 0+1+2+0+1 items, itemless sales as one row each
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([r["sale_no"] for r in rows][:3], [self.sales[0].sale_no, self.sales[1].sale_no, self.sales[2].sale_no])
+        self.assertEqual(rows[0]["sku"], "")
+        self.assertEqual(len([q for q in ctx.captured_queries if "sales_saleitem" in q["sql"]]), 2)
+
+    def test_ndjson_nests_items_across_chunk_boundaries(self):
+        _, body = self.export("format=ndjson")
+        sales = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([s["sale_no"] for s in sales], [s.sale_no for s in self.sales])
+        self.assertEqual([len(s["items"]) for s in sales], [0, 1, 2, 0, 1])
+        self.assertEqual(sales[2]["items"][1], {
+            "sku": "SKU-1", "product_name": "P1", "unit": "pcs", "qty": 2, "unit_price": "1.00", "line_total": "2.00",
+        })
+        self.assertEqual(sales[0]["customer_email"], "acct@example.com")
+
+    def test_date_range_and_bad_input(self):
+        Sale.objects.filter(pk=self.sales[0].pk).update(created_at="2020-01-15T10:00:00Z")
+        _, body = self.export("format=ndjson&created_after=2020-01-01&created_before=2020-01-31")
+        self.assertEqual([json.loads(line)["sale_no"] for line in body.splitlines()], [self.sales[0].sale_no])
+        self.assertEqual(self.client.get("/api/sales-export/?format=xml").status_code, 400)
+        self.assertEqual(self.client.get("/api/sales-export/?created_after=nope").status_code, 400)
+
+
+@override_settings(OUTBOX_AUTODISPATCH=False)
+class IdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Test", email="test@example.com")
+        Product.objects.create(sku="SKU-1", name="Product 1", price=Decimal("10.00"), stock_qty=10)
+
+    def checkout(self, body, key=None):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return self.client.post("/checkout-json/", body, content_type="application/json", **headers)
+
+    def body(self, qty=1):
+        return {
+            "customer": self.customer.pk,
+            "items": [{"sku": "SKU-1", "product_name": "Product 1", "unit": "pcs", "qty": qty, "unit_price": "10.00"}],
+        }
+
+    def test_retry_replays_stored_response(self):
+        first = self.checkout(self.body(), key="abc")
+        retry = self.checkout(self.body(), key="abc")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json()["sale_no"], first.json()["sale_no"])
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_key_reused_for_other_request_is_rejected(self):
+        self.checkout(self.body(), key="abc")
+        self.assertEqual(self.checkout(self.body(qty=2), key="abc").status_code, 422)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_without_key_nothing_is_stored(self):
+        self.checkout(self.body())
+        self.checkout(self.body())
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_duplicate_of_in_flight_request_gets_409_without_blocking(self):
+        IdempotencyKey.objects.create(  # the original is still running
+            scope="checkout", key="abc", expires_at=timezone.now() + timedelta(hours=1),
+            fingerprint=hashlib.sha256(
+                b"POST\0/checkout-json/\0" + json.dumps(self.body()).encode() + b"\0"
+            ).hexdigest(),
+        )
+        for wait, limit in ((0, 0.5), (60, 3)):  # IDEMPOTENCY_WAIT is capped
+            with self.subTest(wait=wait), override_settings(IDEMPOTENCY_WAIT=wait):
+                started = time.monotonic()
+                resp = self.checkout(self.body(), key="abc")
+                self.assertLess(time.monotonic() - started, limit)
+                self.assertEqual(resp.status_code, 409)
+                self.assertEqual(resp["Retry-After"], "1")
+        self.assertFalse(Sale.objects.exists())
+
+    def test_resubmitted_checkout_form_places_one_order(self):
+        self.client.post("/add/", {"sku": "SKU-1", "qty": 1})
+        key = self.client.get("/checkout/").context["idempotency_key"]
+        form = {"name": "Test", "email": "test@example.com", "idempotency_key": key}
+        self.client.post("/place-order/", form)
+        self.client.post("/place-order/", form)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(Product.objects.get(sku="SKU-1").stock_qty, 9)
+
+
+@skipIf(inventory_async.httpx is None, "httpx is not installed")
+@override_settings(OUTBOX_AUTODISPATCH=False, INVENTORY_PAGE_SIZE=100, INVENTORY_PUSH_CHUNK_SIZE=100)
+class AsyncSyncTests(TransactionTestCase):
+    """The async sync views, through the ASGI handler (ORM work runs on other threads)."""
+
+    def setUp(self):
+        self.inventory = FakeInventory(catalog_size=450).start()
+        self.addCleanup(self.inventory.stop)
+        overrides = override_settings(INVENTORY_API_BASE=self.inventory.url, INVENTORY_RETRIES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+    async def test_pull_by_id_range_then_delta(self):
+        resp = await self.async_client.post("/api/async/sync-from-inventory/?full=1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["fetch"], "ranges")
+        self.assertEqual(len(resp.json()["created"]), 450)
+
+        self.inventory.update_product("BENCH-000123", currentQty=7)
+        resp = await self.async_client.get("/api/async/sync-from-inventory/")
+        self.assertEqual(resp.json()["mode"], "delta")
+        self.assertEqual(resp.json()["updated"], ["BENCH-000123"])
+        self.assertEqual((await Product.objects.aget(sku="BENCH-000123")).stock_qty, 7)
+
+    async def test_range_denser_than_a_page_is_fetched_in_pages(self):
+        span = {**self.inventory.id_range(), "count": 100}  # one range holding all 450 rows
+        queue = asyncio.Queue()
+        async with inventory_async.async_client() as client:
+            await inventory_async._produce_ranges(client, queue, span, {}, 100)
+        pages = [queue.get_nowait() for _ in range(queue.qsize())]
+        self.assertEqual([len(p) for p in pages], [100, 100, 100, 100, 50])
+
+    async def test_failed_range_cancels_the_others(self):
+        started, cancelled = [], []
+
+        async def fetch(client, params):
+            started.append(params["idFrom"])
+            if len(started) == 1:
+                await asyncio.sleep(0)  # let the others start
+                raise RuntimeError("boom")
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(params["idFrom"])
+                raise
+
+        span = {"minId": 1, "maxId": 1000, "count": 1000}
+        with patch.object(inventory_async, "_fetch_json", fetch), self.assertRaises(RuntimeError):
+            await asyncio.wait_for(inventory_async._produce_ranges(None, asyncio.Queue(), span, {}, 100), 5)
+        self.assertLess(len(started), 10)  # queued ranges never ran
+        self.assertEqual(sorted(cancelled), sorted(started[1:]))
+
+    async def test_push_advances_cursor_over_every_chunk(self):
+        await self.async_client.post("/api/async/sync-from-inventory/?full=1")
+        resp = await self.async_client.post("/api/async/sync-to-inventory/?full=1")
+        self.assertEqual(resp.json()["count"], 450)
+        self.assertEqual(resp.json()["chunks"], 5)
+        self.assertEqual(self.inventory.stats["pushed"], 450)
+        cursor = await SyncCursor.objects.aget(name="inventory_push")
+        last = await Product.objects.order_by("updated_at", "id").alast()
+        self.assertEqual((cursor.last_updated_at, cursor.last_id), (last.updated_at, last.id))
+
+        retry = await self.async_client.post("/api/async/sync-to-inventory/?full=1", headers={"Idempotency-Key": "k"})
+        again = await self.async_client.post("/api/async/sync-to-inventory/?full=1", headers={"Idempotency-Key": "k"})
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(again.json(), retry.json())
+        self.assertEqual(self.inventory.stats["pushed"], 900)
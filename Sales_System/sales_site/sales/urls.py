@@ -6,8 +6,13 @@ from rest_framework.routers import DefaultRouter
 from sales.views import (
     CustomerViewSet,
     SaleViewSet,
+    SalesRollupViewSet,
     product_list,   # JSON product list (legacy/plain)
     checkout,       # JSON checkout (legacy/plain)
+    checkout_batch, # JSON checkout, many orders per request
+    catalog_cache_stats,
+    prometheus_metrics,
+    sales_export,
 )
 from sales.store_views import (
     shop_home,          # HTML
@@ -19,12 +24,23 @@ from sales.store_views import (
     remove_from_cart,   # HTML
 )
 from sales.api import ProductViewSet
-from .views_inventory_sync import pull_from_inventory, push_to_inventory  # correct names
+from .views_inventory_sync import (
+    pull_from_inventory,
+    push_to_inventory,
+    pull_from_inventory_async,
+    push_to_inventory_async,
+    sync_job_status,
+    inventory_client_stats,
+    reconcile_buckets,
+    reconcile_rows,
+    reconcile_with_inventory,
+)
 
 router = DefaultRouter()
 router.register(r"customers", CustomerViewSet)
 router.register(r"sales",     SaleViewSet)
 router.register(r"products",  ProductViewSet)
+router.register(r"reports/sales-rollup", SalesRollupViewSet, basename="sales-rollup")
 
 urlpatterns = [
     # Admin
@@ -47,11 +63,22 @@ urlpatterns = [
     path("products/",        product_list, name="product_list_json"),
     path("shop/products/",   product_list, name="product_list_json_shop"),  # for your Node caller
     path("checkout-json/",   checkout,     name="checkout_json"),
+    path("checkout-json/batch/", checkout_batch, name="checkout_json_batch"),  # POST
+    path("api/catalog-cache/", catalog_cache_stats, name="catalog_cache_stats"),  # GET
+    path("metrics", prometheus_metrics, name="metrics"),  # GET, Prometheus text format
+    path("api/sales-export/", sales_export, name="sales_export"),  # GET, streamed CSV/NDJSON
 
     # REST API
     path("api/", include(router.urls)),
 
     # Inventory ↔ Sales sync
-    path("api/sync-from-inventory/", pull_from_inventory, name="sync_from_inventory"),  # GET
-    path("api/sync-to-inventory/",   push_to_inventory,  name="sync_to_inventory"),    # POST
+    path("api/sync-from-inventory/", pull_from_inventory, name="sync_from_inventory"),  # GET/POST -> job
+    path("api/sync-to-inventory/",   push_to_inventory,  name="sync_to_inventory"),    # POST -> job
+    path("api/async/sync-from-inventory/", pull_from_inventory_async, name="sync_from_inventory_async"),  # GET/POST, inline
+    path("api/async/sync-to-inventory/",   push_to_inventory_async,  name="sync_to_inventory_async"),    # POST, inline
+    path("api/sync-jobs/<uuid:job_id>/", sync_job_status, name="sync_job_status"),     # GET
+    path("api/inventory-client/",    inventory_client_stats, name="inventory_client_stats"),  # GET
+    path("api/reconcile/",           reconcile_with_inventory, name="reconcile"),            # POST
+    path("api/reconcile/buckets/",   reconcile_buckets, name="reconcile_buckets"),           # GET
+    path("api/reconcile/rows/",      reconcile_rows,    name="reconcile_rows"),              # GET
 ]
@@ -1,8 +1,38 @@
+import base64
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.views.decorators.http import require_GET
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from .models import Customer, Sale, Product
-from .serializers import CustomerSerializer, SaleSerializer
+from .models import Customer, Sale, Product, SalesRollup
+from .serializers import CustomerSerializer, SaleSerializer, SalesRollupSerializer
+from .outbox import record_sale_committed
+from .orders import create_sales_bulk, decrement_stock, unknown_skus
+from .idempotency import idempotent
+from .catalog import catalog_stats, get_active_catalog
+from .metrics import render_prometheus
+from .exports import csv_lines, ndjson_lines, sale_rows
+
+try:
+    import orjson  # optional, much faster for big catalogs
+except ImportError:
+    orjson = None
+
+# Largest ?limit= accepted by product_list
+PRODUCT_PAGE_MAX = 1000
 
 # Temporary in-memory catalog (replace with Inventory later)
 PRODUCTS = [
@@ -15,14 +45,95 @@ class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all().order_by("name")
     serializer_class = CustomerSerializer
 
+class SaleCursorPagination(CursorPagination):
+    # keyset on (created_at, sale_id): stable and O(page) at any depth
+    ordering = ("-created_at", "-sale_id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class RollupCursorPagination(CursorPagination):
+    # oldest day first, like the report reads; (date, sku, status) is unique
+    ordering = ("date", "sku", "status")
+    page_size = 500
+    page_size_query_param = "page_size"
+    max_page_size = 5000
+
+
+def _parse_when(value, end_of_day=False):
+    """Accept an ISO datetime or a plain date (whole day) from the query string."""
+    try:
+        # date first: parse_datetime also accepts a bare date (as midnight)
+        d = parse_date(value)
+        dt = datetime.combine(d, time.max if end_of_day else time.min) if d else parse_datetime(value)
+    except ValueError:  # well-formed but out of range, e.g. 2025-02-30
+        dt = None
+    if dt is None:
+        raise ValidationError(f"Invalid date: {value}")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
 class SaleViewSet(viewsets.ModelViewSet):
-    queryset = Sale.objects.all().order_by("-created_at")
+    """
+    Sales with their items in a constant number of queries per page.
+    Filters: ?status=NEW|PAID|CANCELLED, ?created_after=, ?created_before=
+    (ISO date or datetime, inclusive).
+    """
+    queryset = Sale.objects.select_related("customer").prefetch_related("items")
     serializer_class = SaleSerializer
+    pagination_class = SaleCursorPagination
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        if params.get("status"):
+            qs = qs.filter(status=params["status"].upper())
+        if params.get("created_after"):
+            qs = qs.filter(created_at__gte=_parse_when(params["created_after"]))
+        if params.get("created_before"):
+            qs = qs.filter(created_at__lte=_parse_when(params["created_before"], end_of_day=True))
+        return qs
+
+class SalesRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only sales report from the incrementally maintained rollup table:
+    qty, revenue and order count per day x SKU x status.
+    Filters: ?date_from= / ?date_to= (YYYY-MM-DD, inclusive; default the
+    last 30 days), ?sku=, ?status=. Cursor-paged.
+    """
+    queryset = SalesRollup.objects.all()
+    serializer_class = SalesRollupSerializer
+    pagination_class = RollupCursorPagination
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        today = timezone.localdate()
+        date_from = params.get("date_from")
+        date_to = params.get("date_to")
+        try:
+            start = parse_date(date_from) if date_from else today - timedelta(days=30)
+            end = parse_date(date_to) if date_to else today
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            raise ValidationError("date_from/date_to must be YYYY-MM-DD")
+        qs = qs.filter(date__range=(start, end))
+        if params.get("sku"):
+            qs = qs.filter(sku=params["sku"].strip().upper())
+        if params.get("status"):
+            qs = qs.filter(status=params["status"].upper())
+        # buckets emptied by status moves stay as zero rows; hide them
+        return qs.exclude(order_count=0)
 
 @api_view(["GET"])
 def product_list(request):
     return Response(PRODUCTS)
 
+@idempotent("checkout")
 @api_view(["POST"])
 def checkout(request):
     """
@@ -41,14 +152,176 @@ def checkout(request):
     }
     ser = SaleSerializer(data=payload)
     ser.is_valid(raise_exception=True)
-    sale = ser.save()
+    with transaction.atomic():
+        sale = ser.save()
+        items = list(sale.items.all())
+        if not decrement_stock(items):
+            unknown = unknown_skus(items)
+            transaction.set_rollback(True)
+            if unknown:
+                return Response({"error": "unknown sku", "skus": unknown}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "insufficient stock"}, status=status.HTTP_409_CONFLICT)
+        record_sale_committed(sale, items)
     return Response(SaleSerializer(sale).data, status=status.HTTP_201_CREATED)
 
+@idempotent("checkout_batch")
+@api_view(["POST"])
+def checkout_batch(request):
+    """
+    Many /checkout-json/ orders in one request:
+
+        {"orders": [{"customer": 1, "items": [...]}, ...]}   (or a bare list)
+
+    Orders are validated together and committed in groups with bulk
+    inserts; one bad order doesn't fail the others. Returns
+    {"created", "failed", "results": [...]} with one result per order
+    (see orders.create_sales_bulk): 201 if every order was created,
+    otherwise 200.
+    """
+    orders = request.data.get("orders") if isinstance(request.data, dict) else request.data
+    if not isinstance(orders, list) or not orders:
+        return Response({"error": "expected a non-empty list of orders"}, status=400)
+    max_orders = getattr(settings, "CHECKOUT_BATCH_MAX", 1000)
+    if len(orders) > max_orders:
+        return Response({"error": f"at most {max_orders} orders per batch"}, status=400)
+
+    results = create_sales_bulk(orders)
+    created = sum(1 for r in results if r["ok"])
+    return Response(
+        {"created": created, "failed": len(results) - created, "results": results},
+        status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_200_OK,
+    )
+
+def _json_response(data, status=200):
+    """Render straight to bytes, skipping DRF's renderer/negotiation."""
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return HttpResponse(body, status=status, content_type="application/json")
+
+
+def _product_row(p):
+    return {"sku": p["sku"], "name": p["name"], "unit": p["unit"], "price": float(p["price"])}
+
+
+def _encode_cursor(row):
+    raw = json.dumps([row["name"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    name, pk = json.loads(raw)
+    return str(name), int(pk)
+
+
 @api_view(["GET"])
 def product_list(request):
-    products = Product.objects.filter(is_active=True).order_by("name")
-    data = [
-        {"sku": p.sku, "name": p.name, "unit": p.unit, "price": float(p.price)}
-        for p in products
-    ]
-    return Response(data)
\ No newline at end of file
+    """
+    Active catalog as JSON (Inventory's /products/sync polls this).
+
+    - ETag / Last-Modified come from the newest Product.updated_at (and
+      the row count), so an unchanged poll gets 304 with no body.
+    - ?limit=N[&cursor=...] pages on (name, id) and returns
+      {"results": [...], "next": <cursor or null>}; without ?limit the
+      plain list is returned as before.
+    """
+    catalog = get_active_catalog()
+    last_modified = catalog["last_modified"]
+    cursor = request.query_params.get("cursor") or ""
+    try:
+        limit = int(request.query_params.get("limit") or 0)
+    except ValueError:
+        return _json_response({"error": "limit must be an integer"}, status=400)
+
+    fingerprint = "|".join([
+        last_modified.isoformat() if last_modified else "",
+        str(len(catalog["rows"])),
+        str(limit),
+        cursor,
+    ])
+    etag = '"%s"' % hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+    ts = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=ts)
+    if response is None:
+        if limit > 0:
+            limit = min(limit, PRODUCT_PAGE_MAX)
+            rows = Product.objects.filter(is_active=True)
+            if cursor:
+                try:
+                    name, pk = _decode_cursor(cursor)
+                except (ValueError, TypeError):
+                    return _json_response({"error": "invalid cursor"}, status=400)
+                rows = rows.filter(Q(name__gt=name) | Q(name=name, id__gt=pk))
+            page = list(rows.order_by("name", "id").values("id", "sku", "name", "unit", "price")[:limit + 1])
+            data = {
+                "results": [_product_row(p) for p in page[:limit]],
+                "next": _encode_cursor(page[limit - 1]) if len(page) > limit else None,
+            }
+        else:
+            data = [_product_row(p) for p in catalog["rows"]]
+        response = _json_response(data)
+
+    response["ETag"] = etag
+    if ts is not None:
+        response["Last-Modified"] = http_date(ts)
+    response["Cache-Control"] = "no-cache"  # always revalidate, 304 is cheap
+    return response
+
+
+@api_view(["GET"])
+def catalog_cache_stats(request):
+    """Hit/miss counters of the storefront catalog cache."""
+    return Response(catalog_stats())
+
+
+def prometheus_metrics(request):
+    """
+    Request/SQL/Inventory metrics of this process in Prometheus text
+    format. If METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+EXPORT_FORMATS = {
+    "csv": (csv_lines, "text/csv; charset=utf-8"),
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+}
+
+
+@require_GET
+def sales_export(request):
+    """
+    All sales in a date range as a streamed download, for accounting:
+    ?format=csv (default; one row per item) or ?format=ndjson (one sale
+    per line, items nested). Filters as SaleViewSet: ?created_after=,
+    ?created_before= (ISO date or datetime, inclusive), ?status=.
+
+    Bytes start flowing after the first chunk query and memory stays
+    constant however large the range (sales/exports.py).
+    """
+    params = request.GET
+    fmt = params.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return _json_response({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    sales = Sale.objects.all()
+    try:
+        if params.get("created_after"):
+            sales = sales.filter(created_at__gte=_parse_when(params["created_after"]))
+        if params.get("created_before"):
+            sales = sales.filter(created_at__lte=_parse_when(params["created_before"], end_of_day=True))
+    except ValidationError as e:
+        return _json_response({"error": e.detail[0]}, status=400)
+    if params.get("status"):
+        sales = sales.filter(status=params["status"].upper())
+
+    lines, content_type = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(lines(sale_rows(sales)), content_type=content_type)
+    name = "-".join(["sales", *(params[k][:10] for k in ("created_after", "created_before") if params.get(k))])
+    response["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    return response
@@ -1,65 +1,206 @@
-import requests
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 
-from .models import Product
-from .api_inventory import fetch_inventory_products, upsert_into_sales
+from .models import Product, SyncJob
+from .api_inventory import pull_products, push_products
+from .inventory_async import apull_products, apush_products
+from .inventory_client import InventoryUnavailable, get_client
+from .idempotency import idempotent
+from .jobs import enqueue, job_payload
+from .outbox import outbox_stats
+from .reconcile import bucket_count, bucket_digests, bucket_of, local_rows, reconcile
 
-@api_view(["GET"])
+
+def _flag(request, name):
+    return request.query_params.get(name, "").lower() in ("1", "true", "yes")
+
+
+def _accepted(request, job, created):
+    return Response({
+        "job_id": str(job.job_id),
+        "status": job.status,
+        "coalesced": not created,
+        "status_url": request.build_absolute_uri(reverse("sync_job_status", args=[job.job_id])),
+    }, status=202)
+
+
+@api_view(["GET", "POST"])
 @permission_classes([AllowAny])
 def pull_from_inventory(request):
     """
-    Inventory → Sales: pull all products from Inventory_System and upsert into Django.
-    Returns detailed diagnostics so we can see any skips.
+    Inventory → Sales: pull products changed since the last sync and upsert
+    them into Django. Pass ?full=1 to re-download the whole catalog.
+
+    Runs as a background job and answers 202 with a job id; poll
+    /api/sync-jobs/<job_id>/ for progress. ?wait=1 runs it inline and
+    returns the detailed diagnostics directly.
     """
+    full = _flag(request, "full")
+    if not _flag(request, "wait"):
+        job, created = enqueue(SyncJob.Kind.PULL, {"full": full})
+        return _accepted(request, job, created)
     try:
-        items = fetch_inventory_products()
-        upsert_result = upsert_into_sales(items)
+        result = pull_products(full=full)
         return Response({
             "message": "Synced Inventory → Sales",
-            **upsert_result,
-            "sample": items[:3],  # tiny peek
+            **result,
         })
+    except InventoryUnavailable as e:
+        return Response({"error": str(e)}, status=503)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+@idempotent("sync_to_inventory")
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def push_to_inventory(request):
     """
-    Sales → Inventory: push all Django products into Inventory_System.
+    Sales → Inventory: push products changed since the last successful push
+    into Inventory_System, in compressed chunks. ?full=1 pushes everything.
+    Background job like pull_from_inventory; ?wait=1 runs inline.
+    """
+    full = _flag(request, "full")
+    if not _flag(request, "wait"):
+        job, created = enqueue(SyncJob.Kind.PUSH, {"full": full})
+        return _accepted(request, job, created)
+    try:
+        result = push_products(full=full)
+        return Response({
+            "message": "Pushed Sales → Inventory",
+            **result,
+        })
+    except InventoryUnavailable as e:
+        return Response({"error": str(e)}, status=503)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+
+def _async_flag(request, name):
+    return request.GET.get(name, "").lower() in ("1", "true", "yes")
+
+
+async def _run_async(sync, message, request):
+    try:
+        result = await sync(full=_async_flag(request, "full"))
+    except InventoryUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return JsonResponse({"message": message, **result})
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def pull_from_inventory_async(request):
+    """
+    Async pull_from_inventory, run inline (?full=1 as there). Under ASGI
+    it holds no worker thread while waiting on Inventory: pages are fetched
+    concurrently and upserted on a worker thread as they arrive.
+    """
+    return await _run_async(apull_products, "Synced Inventory → Sales", request)
+
+
+@csrf_exempt
+@idempotent("sync_to_inventory")
+@require_http_methods(["POST"])
+async def push_to_inventory_async(request):
+    """Async push_to_inventory, run inline; chunks are POSTed concurrently."""
+    return await _run_async(apush_products, "Pushed Sales → Inventory", request)
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def sync_job_status(request, job_id):
+    """
+    Progress (batches, created/updated/skipped counts) and final result of
+    a sync job.
+    """
+    try:
+        job = SyncJob.objects.get(pk=job_id)
+    except SyncJob.DoesNotExist:
+        return Response({"error": "Unknown job"}, status=404)
+    return Response(job_payload(job))
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def inventory_client_stats(request):
+    """
+    Diagnostics for the shared Inventory HTTP client: request/retry counts,
+    latency histogram and circuit breaker state, plus the outbox backlog
+    (pending events and dead ones that ran out of attempts).
+    """
+    return Response({**get_client().stats(), "outbox": outbox_stats()})
+
+
+def _bucket_params(request):
+    """(buckets, bucket ids) from ?buckets=N&ids=1,2,3; raises ValueError."""
+    buckets = int(request.query_params.get("buckets") or bucket_count())
+    if not 1 <= buckets <= 65536:
+        raise ValueError("buckets must be between 1 and 65536")
+    raw = request.query_params.get("ids", "")
+    ids = [int(i) for i in raw.split(",") if i.strip()]
+    if any(not 0 <= i < buckets for i in ids):
+        raise ValueError("bucket id out of range")
+    return buckets, ids
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def reconcile_buckets(request):
     """
+    Per-bucket digests of Sales products (sku, price, stock_qty, is_active),
+    the same as Inventory's /products/reconcile/buckets. ?buckets=N.
+    """
+    try:
+        buckets, _ = _bucket_params(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    digests = bucket_digests(local_rows(), buckets)
+    return Response({
+        "buckets": buckets,
+        "count": sum(int(d.split(":", 1)[0]) for d in digests),
+        "digests": digests,
+    })
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def reconcile_rows(request):
+    """Sales products in the buckets ?ids=1,2,3 (of ?buckets=N)."""
+    try:
+        buckets, ids = _bucket_params(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    wanted = set(ids)
+    rows = [
+        p for p in Product.objects.order_by("sku")
+        .values("sku", "name", "unit", "price", "stock_qty", "is_active")
+        .iterator(chunk_size=5000)
+        if bucket_of(p["sku"], buckets) in wanted
+    ]
+    return Response({"buckets": buckets, "rows": rows})
+
+
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def reconcile_with_inventory(request):
+    """
+    Compare stock/price/status with Inventory bucket by bucket and report
+    the differing SKUs. ?fix=1 copies Inventory's values into Sales.
+    """
+    try:
+        buckets, _ = _bucket_params(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     try:
-        products = list(
-            Product.objects.values(
-                "sku", "name", "description", "unit", "price", "stock_qty"
-            )
-        )
-        # Transform for Inventory payload
-        payload = []
-        for p in products:
-            payload.append({
-                "sku": str(p["sku"]).strip().upper(),
-                "name": p["name"],
-                "description": p.get("description") or "",
-                "unit": p.get("unit") or "pcs",
-                "listPrice": str(p["price"]),   # send as string to avoid float issues
-                "status": "ACTIVE",
-                "currentQty": int(p.get("stock_qty") or 0),
-            })
-
-        base = getattr(settings, "INVENTORY_API_BASE", "http://127.0.0.1:3001")
-        url = f"{base}/products/sync-from-sales"
-        resp = requests.post(url, json=payload, timeout=10)
-
-        if resp.status_code == 200:
-            return Response({
-                "message": "Pushed Sales → Inventory",
-                "count": len(payload),
-                "inventory_response": resp.json(),
-            })
-        return Response({"status": resp.status_code, "body": resp.text}, status=500)
+        return Response(reconcile(buckets=buckets, fix=_flag(request, "fix")))
+    except InventoryUnavailable as e:
+        return Response({"error": str(e)}, status=503)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
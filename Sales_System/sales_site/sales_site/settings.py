@@ -42,6 +42,7 @@ DATABASES = {
 
 # REQUIRED for admin/auth/sessions/messages
 MIDDLEWARE = [
+    "sales.middleware.MetricsMiddleware",  # first, so it times the whole stack
     "corsheaders.middleware.CorsMiddleware", 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -84,4 +85,102 @@ STATIC_URL = "static/"
 
 # --- External service: Inventory_System ---
 INVENTORY_API_BASE = os.getenv("INVENTORY_API_BASE", "http://127.0.0.1:3001")
-INVENTORY_API_KEY  = os.getenv("INVENTORY_API_KEY", "")
\ No newline at end of file
+INVENTORY_API_KEY  = os.getenv("INVENTORY_API_KEY", "")
+# Rows per bulk_create/bulk_update batch when syncing from Inventory
+INVENTORY_SYNC_BATCH_SIZE = int(os.getenv("INVENTORY_SYNC_BATCH_SIZE", "1000"))
+# Products per GET /products page when pulling from Inventory
+INVENTORY_PAGE_SIZE = int(os.getenv("INVENTORY_PAGE_SIZE", "1000"))
+# Shared Inventory HTTP client (sales/inventory_client.py)
+INVENTORY_CONNECT_TIMEOUT = float(os.getenv("INVENTORY_CONNECT_TIMEOUT", "3.05"))
+INVENTORY_READ_TIMEOUT = float(os.getenv("INVENTORY_READ_TIMEOUT", "30"))
+INVENTORY_RETRIES = int(os.getenv("INVENTORY_RETRIES", "3"))
+INVENTORY_RETRY_BACKOFF = float(os.getenv("INVENTORY_RETRY_BACKOFF", "0.5"))
+INVENTORY_POOL_SIZE = int(os.getenv("INVENTORY_POOL_SIZE", "10"))
+INVENTORY_BREAKER_THRESHOLD = int(os.getenv("INVENTORY_BREAKER_THRESHOLD", "5"))
+INVENTORY_BREAKER_RESET = float(os.getenv("INVENTORY_BREAKER_RESET", "30"))
+# Background sync jobs (sales/jobs.py)
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+# A running job refreshes its heartbeat this often (seconds); one whose
+# heartbeat is older than SYNC_JOB_STALE_AFTER is treated as dead
+SYNC_JOB_HEARTBEAT = int(os.getenv("SYNC_JOB_HEARTBEAT", "10"))
+SYNC_JOB_STALE_AFTER = int(os.getenv("SYNC_JOB_STALE_AFTER", "60"))
+# Products per gzip-compressed POST when pushing Sales -> Inventory
+INVENTORY_PUSH_CHUNK_SIZE = int(os.getenv("INVENTORY_PUSH_CHUNK_SIZE", "500"))
+# Inventory requests in flight at once in the async sync views
+# (sales/inventory_async.py, needs httpx)
+INVENTORY_ASYNC_CONCURRENCY = int(os.getenv("INVENTORY_ASYNC_CONCURRENCY", "4"))
+# Transactional outbox -> Inventory POST /events/sale-committed/batch
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+# Seconds a dispatcher holds a claimed batch; must outlast the POST with its retries
+OUTBOX_CLAIM_TTL = float(os.getenv("OUTBOX_CLAIM_TTL", "300"))
+OUTBOX_LINGER = float(os.getenv("OUTBOX_LINGER", "0.25"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "30"))
+# Set to 0 when a separate `manage.py dispatch_outbox --loop` worker drains it
+OUTBOX_AUTODISPATCH = os.getenv("OUTBOX_AUTODISPATCH", "1") == "1"
+
+# --- Cache (catalog cache, sales/catalog.py) ---
+# LocMemCache is per process, so other workers only see a catalog version
+# bump once their copy expires (CATALOG_CACHE_TTL). Point REDIS_URL at a
+# shared Redis to make bumps visible everywhere immediately.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sales",
+    }
+}
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "60"))
+
+# --- Storefront sessions ---
+# "db" (Django default), "cached_db" (cache in front of the DB table) or
+# "cache" (cache only). cached_db/cache need a cache shared by all workers,
+# so the default only switches to cached_db when REDIS_URL is set.
+# `manage.py bench_cart_session` compares them.
+STOREFRONT_SESSION_MODE = os.getenv(
+    "STOREFRONT_SESSION_MODE", "cached_db" if os.getenv("REDIS_URL") else "db"
+)
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+}[STOREFRONT_SESSION_MODE]
+
+# Seconds a cart holds its stock (sales/reservations.py)
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+# Carts with more units than this check out without holding stock
+RESERVATION_MAX_UNITS = int(os.getenv("RESERVATION_MAX_UNITS", "50"))
+
+# Batch checkout (/checkout-json/batch/, sales/orders.py)
+CHECKOUT_BATCH_MAX = int(os.getenv("CHECKOUT_BATCH_MAX", "1000"))
+# Orders committed per transaction; a failing group is retried order by order
+CHECKOUT_BATCH_GROUP_SIZE = int(os.getenv("CHECKOUT_BATCH_GROUP_SIZE", "100"))
+
+# --- Metrics (sales/middleware.py, GET /metrics) ---
+# Requests at least this slow are counted; a sample of them is logged to
+# "sales.slow_requests" with their slowest queries
+METRICS_SLOW_REQUEST_MS = int(os.getenv("METRICS_SLOW_REQUEST_MS", "500"))
+METRICS_SLOW_SAMPLE_RATE = float(os.getenv("METRICS_SLOW_SAMPLE_RATE", "0.1"))
+METRICS_TOP_QUERIES = int(os.getenv("METRICS_TOP_QUERIES", "5"))
+# Bearer token required by /metrics when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Rows per query when streaming /api/sales-export/ (sales/exports.py)
+SALES_EXPORT_CHUNK_SIZE = int(os.getenv("SALES_EXPORT_CHUNK_SIZE", "2000"))
+
+# SKU buckets compared by stock reconciliation (sales/reconcile.py); must
+# match between the runs you compare, Inventory takes it per request
+RECONCILE_BUCKETS = int(os.getenv("RECONCILE_BUCKETS", "256"))
+
+# --- Idempotency-Key (sales/idempotency.py) ---
+# How long a stored response is replayed to retries with the same key
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# Seconds a duplicate waits for the in-flight original before getting 409 +
+# Retry-After (capped at 2: the wait holds a worker; 0 = answer at once)
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "1"))
+# An in-progress key older than this is assumed abandoned and taken over
+IDEMPOTENCY_STALE_AFTER = int(os.getenv("IDEMPOTENCY_STALE_AFTER", "600"))